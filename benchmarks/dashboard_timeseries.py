@@ -0,0 +1,120 @@
+"""
+Cost of the dashboard charge time series.
+
+Fills a temporary SQLite database with payments spread over 30 days and times
+charge_timeseries() for hourly and daily buckets: loading the columns into
+arrays and computing the bucket statistics separately, then the whole call with
+an empty segment cache (cold) and again once every day is cached (warm).
+
+Run from the repository root:
+
+    python -m benchmarks.dashboard_timeseries [--rows 2000000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from dashboard import timeseries
+from payments.payments_models import Base, Payment, PaymentStatus
+
+DAYS = 30
+INSERT_BATCH_ROWS = 50000
+
+
+def populate(session: Session, rows: int, end: datetime) -> None:
+    """
+    Inserts payments with random amounts and creation times in the DAYS before end.
+
+    :param session: Session bound to an empty payments table.
+    :param rows: Number of payments to insert.
+    :param end: Latest creation time.
+    """
+    rng = np.random.default_rng(0)
+    statuses = [PaymentStatus.COMPLETED, PaymentStatus.COMPLETED, PaymentStatus.COMPLETED, PaymentStatus.FAILED]
+    for first in range(0, rows, INSERT_BATCH_ROWS):
+        count = min(INSERT_BATCH_ROWS, rows - first)
+        offsets = rng.integers(0, DAYS * 86400, count)
+        amounts = np.round(rng.lognormal(3.5, 1.0, count), 2)
+        session.execute(insert(Payment), [
+            {
+                "amount": float(amount),
+                "status": statuses[index % len(statuses)],
+                "created_at": end - timedelta(seconds=int(offset)),
+                "updated_at": end,
+            }
+            for index, (offset, amount) in enumerate(zip(offsets, amounts))
+        ])
+    session.commit()
+
+
+def run(rows: int) -> List[Dict[str, object]]:
+    """
+    Times the time series over the whole range for hourly and daily buckets.
+
+    :param rows: Number of payments in the database.
+    :return: One row per bucket width.
+    """
+    end = datetime(2026, 3, 1)
+    start = end - timedelta(days=DAYS)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'timeseries.db')}")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            populate(session, rows, end)
+            for bucket_seconds in (3600, 86400):
+                load_seconds = compute_seconds = cold_seconds = warm_seconds = float("inf")
+                for _ in range(3):
+                    started = time.perf_counter()
+                    timestamps, amounts = timeseries.load_payment_arrays(session, start, end)
+                    loaded = time.perf_counter()
+                    timeseries.bucket_statistics(
+                        timestamps, amounts, int((start - timeseries.EPOCH).total_seconds()),
+                        bucket_seconds, DAYS * 86400 // bucket_seconds,
+                    )
+                    load_seconds = min(load_seconds, loaded - started)
+                    compute_seconds = min(compute_seconds, time.perf_counter() - loaded)
+
+                    segments = timeseries.SegmentCache()
+                    for attempt in ("cold", "warm"):
+                        started = time.perf_counter()
+                        timeseries.charge_timeseries(session, start, end, bucket_seconds, segments=segments)
+                        elapsed = time.perf_counter() - started
+                        if attempt == "cold":
+                            cold_seconds = min(cold_seconds, elapsed)
+                        else:
+                            warm_seconds = min(warm_seconds, elapsed)
+                results.append({
+                    "bucket_seconds": bucket_seconds,
+                    "charges": int(amounts.size),
+                    "load_ms": round(load_seconds * 1000, 1),
+                    "compute_ms": round(compute_seconds * 1000, 1),
+                    "cold_ms": round(cold_seconds * 1000, 1),
+                    "warm_ms": round(warm_seconds * 1000, 1),
+                })
+        engine.dispose()
+    return results
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard charge time series.")
+    parser.add_argument("--rows", type=int, default=2000000, help="Payments in the database.")
+    args = parser.parse_args(argv)
+
+    for row in run(args.rows):
+        print(f"{row['bucket_seconds']:>6} s buckets  {row['charges']:>9} charges  load {row['load_ms']:>8.1f} ms  "
+              f"compute {row['compute_ms']:>7.1f} ms  cold {row['cold_ms']:>8.1f} ms  warm {row['warm_ms']:>7.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
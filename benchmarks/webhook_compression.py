@@ -0,0 +1,101 @@
+"""
+Ingest cost of compressed webhook bodies.
+
+For each payload size and Content-Encoding, measures the bytes on the wire and
+the CPU time to decode the body as it streams in, verify its signature and
+parse it, i.e. the receive path up to dispatch. A single event and a batch of
+100 events are compared, since batches compress much better.
+
+Run from the repository root:
+
+    python -m benchmarks.webhook_compression [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import gzip
+import sys
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+import orjson
+import zstandard
+from pydantic import TypeAdapter
+
+from benchmarks.webhook_parsing import make_body
+from webhooks.request_body import read_body
+from webhooks.webhooks_models import WebhookPayload
+from webhooks.webhooks_signature import sign_payload, verify_signature
+
+SECRET = "whsec_benchmark"
+# Starlette hands the body to the app in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+BATCH = TypeAdapter(List[WebhookPayload])
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "identity": lambda body: body,
+    "gzip": lambda body: gzip.compress(body, compresslevel=6),
+    "zstd": zstandard.ZstdCompressor(level=3).compress,
+}
+
+
+async def _chunks(body: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(body), CHUNK_BYTES):
+        yield body[start:start + CHUNK_BYTES]
+
+
+async def _ingest(wire: bytes, encoding: str, header: str, events: int, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = await read_body(_chunks(wire), encoding)
+        verify_signature(body, header, SECRET)
+        parsed = orjson.loads(body)
+        if events == 1:
+            WebhookPayload.model_validate(parsed)
+        else:
+            BATCH.validate_python(parsed)
+    return time.perf_counter() - started
+
+
+def run(iterations: int) -> List[Dict[str, object]]:
+    """
+    Times decoding, verification and parsing for every encoding and payload size.
+
+    :param iterations: Requests ingested per measurement.
+    :return: One row per payload, encoding and batch size.
+    """
+    rows = []
+    for label, line_items in (("small", 0), ("typical", 10), ("large", 200)):
+        event = make_body(line_items)
+        for events in (1, 100):
+            body = event if events == 1 else b"[" + b",".join([event] * events) + b"]"
+            header = sign_payload(body, SECRET)
+            count = max(1, iterations // events // max(1, line_items // 10))
+            for encoding, compress in COMPRESSORS.items():
+                wire = compress(body)
+                seconds = min(asyncio.run(_ingest(wire, encoding, header, events, count)) for _ in range(3))
+                rows.append({
+                    "payload": label,
+                    "events": events,
+                    "encoding": encoding,
+                    "body_bytes": len(body),
+                    "wire_bytes": len(wire),
+                    "us_per_event": round(seconds / count / events * 1e6, 2),
+                })
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark compressed webhook ingest.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Events ingested per measurement.")
+    args = parser.parse_args(argv)
+
+    for row in run(args.iterations):
+        ratio = row["body_bytes"] / row["wire_bytes"]
+        print(f"{row['payload']:>8} x{row['events']:<4} {row['encoding']:>8} {row['wire_bytes']:>9} B on wire "
+              f"({ratio:5.1f}x)  {row['us_per_event']:>9.2f} us/event")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Per-event CPU cost of parsing webhook bodies.
+
+Compares the old receive path (stdlib json.loads plus copying every header into
+a dict, with no model validation) against the current one (orjson.loads
+validated into WebhookPayload, reading only the signature header) for small,
+typical and large payloads. The other rows are the alternatives considered.
+
+Run from the repository root:
+
+    python -m benchmarks.webhook_parsing [--iterations 20000]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers
+
+from webhooks.webhooks_models import WebhookPayload
+from webhooks.webhooks_signature import SIGNATURE_HEADER
+
+import orjson
+
+
+def make_body(line_items: int) -> bytes:
+    """
+    Builds a charge event body with the given number of invoice line items.
+    """
+    data = {
+        "id": "ch_3PZx1c2eZvKYlo2C0Jf1b2Xy",
+        "amount": 129900,
+        "currency": "usd",
+        "customer_id": "cus_Q9tXr2Lk1mN0pA",
+        "status": "succeeded",
+        "metadata": {"order_id": "ord_88412", "channel": "web", "campaign": "spring-sale"},
+        "lines": [
+            {
+                "id": f"il_{index:08d}",
+                "description": f"Seat license #{index} (monthly)",
+                "quantity": 1 + index % 5,
+                "unit_amount": 1299,
+                "period": {"start": 1712000000, "end": 1714592000},
+                "tax_rates": ["txr_1", "txr_2"],
+            }
+            for index in range(line_items)
+        ],
+    }
+    payload = {"event": {"event_id": "evt_1PZx1c2eZvKYlo2C", "event_type": "charge.succeeded"}, "data": data}
+    return json.dumps(payload).encode("utf-8")
+
+
+def make_headers() -> Headers:
+    """
+    Builds request headers like those a webhook sender includes.
+    """
+    raw = [
+        (b"host", b"api.example.com"), (b"user-agent", b"Stripe/1.0 (+https://stripe.com/docs/webhooks)"),
+        (b"content-type", b"application/json; charset=utf-8"), (b"accept", b"*/*; q=0.5, application/xml"),
+        (b"cache-control", b"no-cache"), (b"content-length", b"1024"), (b"x-forwarded-for", b"3.18.12.63"),
+        (b"x-forwarded-proto", b"https"), (b"x-request-id", b"req_9f8e7d6c5b4a"), (b"traceparent", b"00-4bf92f-01"),
+        (b"x-webhook-signature", b"t=1700000000,v1=" + b"a" * 64), (b"accept-encoding", b"gzip"),
+    ]
+    return Headers(raw=raw)
+
+
+def old_path(body: bytes, headers: Headers) -> None:
+    data = json.loads(body)
+    dict(headers)
+    data["event"]["event_id"], data["event"]["event_type"]
+
+
+def stdlib_then_validate(body: bytes, headers: Headers) -> None:
+    WebhookPayload.model_validate(json.loads(body))
+    headers.get(SIGNATURE_HEADER)
+
+
+def validate_json(body: bytes, headers: Headers) -> None:
+    WebhookPayload.model_validate_json(body)
+    headers.get(SIGNATURE_HEADER)
+
+
+def new_path(body: bytes, headers: Headers) -> None:
+    WebhookPayload.model_validate(orjson.loads(body))
+    headers.get(SIGNATURE_HEADER)
+
+
+def run(iterations: int) -> List[Dict[str, object]]:
+    """
+    Times every parsing strategy for each payload size.
+
+    :param iterations: Events parsed per measurement.
+    :return: One row per payload size and strategy with microseconds per event.
+    """
+    strategies: Dict[str, Callable[[bytes, Headers], None]] = {
+        "before: json.loads + dict(headers), unvalidated": old_path,
+        "json.loads + model_validate": stdlib_then_validate,
+        "model_validate_json": validate_json,
+        "after: orjson.loads + model_validate + one header": new_path,
+    }
+
+    headers = make_headers()
+    rows = []
+    for label, line_items in (("small", 0), ("typical", 10), ("large", 200)):
+        body = make_body(line_items)
+        count = max(1, iterations // max(1, line_items // 10))
+        for name, strategy in strategies.items():
+            seconds = min(timeit.repeat(lambda: strategy(body, headers), number=count, repeat=3))
+            rows.append({"payload": label, "bytes": len(body), "strategy": name,
+                         "us_per_event": round(seconds / count * 1e6, 2)})
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark webhook body parsing.")
+    parser.add_argument("--iterations", type=int, default=20000, help="Events parsed per measurement.")
+    args = parser.parse_args(argv)
+
+    for row in run(args.iterations):
+        print(f"{row['payload']:>8} {row['bytes']:>7} B  {row['us_per_event']:>9.2f} us/event  {row['strategy']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
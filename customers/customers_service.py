@@ -1,6 +1,8 @@
 import logging
 from typing import Optional, Dict
 
+from dashboard import dashboard_rollups
+
 logger = logging.getLogger(__name__)
 
 def create_customer(name: str, email: str, payment_info: Dict[str, str]) -> Dict[str, str]:
@@ -32,11 +34,17 @@ def create_customer(name: str, email: str, payment_info: Dict[str, str]) -> Dict
         }
 
         # TODO: Replace with actual DB insert and return newly created record
-        return new_customer
     except Exception as error:
         logger.error("Failed to create a new customer: %s", error)
         raise ValueError("Could not create customer record.") from error
 
+    # The customer exists by now, so a dashboard failure must not fail its creation
+    try:
+        dashboard_rollups.rollup_buffer.record("customers", "new")
+    except Exception as error:
+        logger.error("Failed to record customer %s in the dashboard rollups: %s", new_customer["id"], error)
+    return new_customer
+
 
 def fetch_customer(customer_id: str) -> Optional[Dict[str, str]]:
     """
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, Integer, String
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+class DashboardRollup(Base):
+    """
+    SQLAlchemy model for the 'dashboard_rollups' table.
+
+    One row per (granularity, bucket, metric, status) holding the number of
+    events and their total amount; maintained incrementally, see dashboard_rollups.py.
+    """
+    __tablename__ = "dashboard_rollups"
+
+    # 'minute', 'hour' or 'day'
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    # 'charges', 'customers' or 'subscriptions'
+    metric = Column(String, primary_key=True)
+    # Charge status, or 'new' / 'started' / 'canceled'
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,361 @@
+"""
+Incrementally maintained dashboard rollups.
+
+Every charge, new customer and subscription change adds to one row per
+granularity (minute, hour, day) in dashboard_rollups, keyed by the bucket it
+falls in, the metric and its status. Reading the dashboard then touches a
+handful of precomputed rows instead of aggregating charges, customers and
+subscriptions on every request.
+
+Subscription changes are written in the same transaction as the change itself.
+Charges and customers are not stored in the database yet, so they are summed
+in a small in-process buffer that is flushed periodically, like usage
+metering; reads merge in whatever has not been flushed. Minute and hour rows
+are pruned after DASHBOARD_MINUTE_RETENTION_HOURS and
+DASHBOARD_HOUR_RETENTION_DAYS.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from dashboard.dashboard_models import DashboardRollup
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_ROLLUP_FLUSH_SECONDS = float(os.getenv("DASHBOARD_ROLLUP_FLUSH_SECONDS", "5"))
+DASHBOARD_MINUTE_RETENTION_HOURS = int(os.getenv("DASHBOARD_MINUTE_RETENTION_HOURS", "48"))
+DASHBOARD_HOUR_RETENTION_DAYS = int(os.getenv("DASHBOARD_HOUR_RETENTION_DAYS", "90"))
+
+GRANULARITIES = ("minute", "hour", "day")
+# Most buckets a single dashboard read may cover, per granularity.
+MAX_BUCKETS = {"minute": 180, "hour": 168, "day": 366}
+
+RollupKey = Tuple[str, datetime, str, str]
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    """
+    Truncates a timestamp to the start of its bucket.
+
+    :param at: The timestamp (naive UTC).
+    :param granularity: 'minute', 'hour' or 'day'.
+    :return: The start of the bucket containing the timestamp.
+    :raises ValueError: If the granularity is unknown.
+    """
+    if granularity == "minute":
+        return at.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _step(granularity: str) -> timedelta:
+    return {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}[granularity]
+
+
+def _rows(metric: str, status: str, count: int, volume: float, at: datetime) -> List[Dict[str, Any]]:
+    return [
+        {
+            "granularity": granularity,
+            "bucket_start": bucket_start(at, granularity),
+            "metric": metric,
+            "status": status,
+            "count": count,
+            "volume": volume,
+        }
+        for granularity in GRANULARITIES
+    ]
+
+
+def _upsert(session: Session, rows: List[Dict[str, Any]]) -> None:
+    database.upsert_add(
+        session,
+        DashboardRollup,
+        rows,
+        ["granularity", "bucket_start", "metric", "status"],
+        ["count", "volume"],
+    )
+
+
+def record_in_session(
+    session: Session,
+    metric: str,
+    status: str,
+    count: int = 1,
+    volume: float = 0.0,
+    at: Optional[datetime] = None,
+) -> None:
+    """
+    Adds to the rollups of every granularity. Runs inside the caller's transaction.
+
+    :param session: Database session of the transaction making the change.
+    :param metric: 'charges', 'customers' or 'subscriptions'.
+    :param status: The status being counted, e.g. 'successful' or 'started'.
+    :param count: Number of events; negative to undo.
+    :param volume: Amount to add to the volume.
+    :param at: When the events happened; defaults to now (UTC).
+    """
+    _upsert(session, _rows(metric, status, count, volume, at or datetime.utcnow()))
+
+
+class RollupBuffer:
+    """
+    Thread-safe map of rollup increments waiting to be flushed.
+
+    Keys are per bucket, so the buffer holds at most a few keys per metric and
+    status between flushes.
+    """
+
+    def __init__(self) -> None:
+        self._totals: Dict[RollupKey, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def record(self, metric: str, status: str, count: int = 1, volume: float = 0.0,
+               at: Optional[datetime] = None) -> None:
+        """
+        Adds to the rollups of every granularity, to be written on the next flush.
+
+        :param metric: 'charges', 'customers' or 'subscriptions'.
+        :param status: The status being counted.
+        :param count: Number of events.
+        :param volume: Amount to add to the volume.
+        :param at: When the events happened; defaults to now (UTC).
+        """
+        at = at or datetime.utcnow()
+        with self._lock:
+            for granularity in GRANULARITIES:
+                totals = self._totals[(granularity, bucket_start(at, granularity), metric, status)]
+                totals[0] += count
+                totals[1] += volume
+
+    def pending(self, granularity: str, since: datetime) -> List[Tuple[datetime, str, str, int, float]]:
+        """
+        Returns unflushed increments of one granularity from a bucket onwards.
+        """
+        with self._lock:
+            return [
+                (start, metric, status, int(count), volume)
+                for (key_granularity, start, metric, status), (count, volume) in self._totals.items()
+                if key_granularity == granularity and start >= since
+            ]
+
+    def drain(self) -> Dict[RollupKey, List[float]]:
+        """
+        Removes and returns everything buffered so far.
+        """
+        with self._lock:
+            drained, self._totals = self._totals, defaultdict(lambda: [0, 0.0])
+        return drained
+
+    def restore(self, totals: Dict[RollupKey, List[float]]) -> None:
+        """
+        Merges increments back into the buffer after a failed flush.
+        """
+        with self._lock:
+            for key, (count, volume) in totals.items():
+                self._totals[key][0] += count
+                self._totals[key][1] += volume
+
+    def flush(self, session: Session) -> int:
+        """
+        Writes buffered increments to the database.
+
+        :param session: Database session used for the write; committed on success.
+        :return: The number of rows upserted.
+        """
+        with self._flush_lock:
+            totals = self.drain()
+            if not totals:
+                return 0
+            try:
+                _upsert(session, [
+                    {"granularity": granularity, "bucket_start": start, "metric": metric, "status": status,
+                     "count": int(count), "volume": volume}
+                    for (granularity, start, metric, status), (count, volume) in totals.items()
+                ])
+                session.commit()
+            except Exception:
+                session.rollback()
+                self.restore(totals)
+                raise
+        logger.debug("Flushed %d dashboard rollup(s)", len(totals))
+        return len(totals)
+
+
+def prune_rollups(session: Session, now: Optional[datetime] = None) -> int:
+    """
+    Deletes minute and hour rollups older than their retention; day rollups are kept.
+
+    :param session: Database session used for the delete; committed on success.
+    :param now: Reference time; defaults to now (UTC).
+    :return: The number of rows deleted.
+    """
+    now = now or datetime.utcnow()
+    deleted = 0
+    for granularity, retention in (
+        ("minute", timedelta(hours=DASHBOARD_MINUTE_RETENTION_HOURS)),
+        ("hour", timedelta(days=DASHBOARD_HOUR_RETENTION_DAYS)),
+    ):
+        deleted += session.execute(
+            delete(DashboardRollup)
+            .where(DashboardRollup.granularity == granularity)
+            .where(DashboardRollup.bucket_start < now - retention)
+        ).rowcount
+    session.commit()
+    return deleted
+
+
+def window_start(granularity: str, buckets: int, now: Optional[datetime] = None) -> datetime:
+    """
+    Returns the start of the first of the most recent buckets.
+
+    :param granularity: 'minute', 'hour' or 'day'.
+    :param buckets: Number of buckets, ending with the current one.
+    :param now: Reference time; defaults to now (UTC).
+    :return: The bucket_start of the oldest bucket covered.
+    """
+    return bucket_start(now or datetime.utcnow(), granularity) - _step(granularity) * (buckets - 1)
+
+
+def get_dashboard_rollups(
+    session: Session,
+    granularity: str = "hour",
+    buckets: int = 24,
+    now: Optional[datetime] = None,
+    metrics: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Returns charge, customer and subscription activity for the most recent buckets.
+
+    Reads at most one row per bucket, metric and status, plus any increments not flushed yet.
+
+    :param session: Database session to read from.
+    :param granularity: 'minute', 'hour' or 'day'.
+    :param buckets: Number of buckets to cover, ending with the current one.
+    :param now: Reference time; defaults to now (UTC).
+    :param metrics: Metrics to read, e.g. ('charges',); defaults to all of them.
+        Totals of the metrics left out are zero.
+    :return: A dictionary with 'recent_charges' (count and volume per status),
+        'new_customers', 'subscriptions' (started and canceled) and the per-bucket 'series'.
+    :raises ValueError: If the granularity is unknown or too many buckets are requested.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    if not 1 <= buckets <= MAX_BUCKETS[granularity]:
+        raise ValueError(f"Between 1 and {MAX_BUCKETS[granularity]} {granularity} buckets can be read.")
+    since = window_start(granularity, buckets, now)
+
+    query = (
+        select(
+            DashboardRollup.bucket_start,
+            DashboardRollup.metric,
+            DashboardRollup.status,
+            DashboardRollup.count,
+            DashboardRollup.volume,
+        )
+        .where(DashboardRollup.granularity == granularity, DashboardRollup.bucket_start >= since)
+    )
+    if metrics is not None:
+        query = query.where(DashboardRollup.metric.in_(list(metrics)))
+    rows = list(session.execute(query))
+    rows.extend(row for row in rollup_buffer.pending(granularity, since) if metrics is None or row[1] in metrics)
+
+    charges: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "volume": 0.0})
+    totals: Dict[Tuple[str, str], int] = defaultdict(int)
+    series: Dict[datetime, Dict[str, Any]] = {}
+    for start, metric, status, count, volume in rows:
+        bucket = series.setdefault(start, {"bucket_start": start, "charges": {}, "customers": {}, "subscriptions": {}})
+        entry = bucket[metric].setdefault(status, {"count": 0, "volume": 0.0})
+        entry["count"] += count
+        entry["volume"] = round(entry["volume"] + volume, 2)
+        totals[(metric, status)] += count
+        if metric == "charges":
+            charges[status]["count"] += count
+            charges[status]["volume"] = round(charges[status]["volume"] + volume, 2)
+
+    return {
+        "granularity": granularity,
+        "since": since,
+        "recent_charges": [{"status": status, **values} for status, values in sorted(charges.items())],
+        "new_customers": totals[("customers", "new")],
+        "subscriptions": {"started": totals[("subscriptions", "started")],
+                          "canceled": totals[("subscriptions", "canceled")]},
+        "series": [series[start] for start in sorted(series)],
+    }
+
+
+rollup_buffer = RollupBuffer()
+
+_flush_task: Optional["asyncio.Task[None]"] = None
+
+
+def flush_rollup_buffer() -> int:
+    """
+    Flushes the process-wide buffer and prunes expired rollups in their own transaction.
+
+    :return: The number of rows upserted.
+    """
+    database.get_engine()
+    session = database.SessionLocal()
+    try:
+        flushed = rollup_buffer.flush(session)
+        prune_rollups(session)
+        return flushed
+    finally:
+        session.close()
+
+
+async def _flush_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(flush_rollup_buffer)
+        except Exception as exc:
+            logger.error("Failed to flush dashboard rollups: %s", exc)
+
+
+async def start_dashboard_rollups() -> None:
+    """
+    Starts the periodic flush. Intended as an application startup handler.
+    """
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_periodically(DASHBOARD_ROLLUP_FLUSH_SECONDS))
+
+
+async def stop_dashboard_rollups() -> None:
+    """
+    Stops the periodic flush and writes whatever is still buffered.
+    Intended as an application shutdown handler.
+    """
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    if not len(rollup_buffer):
+        return
+    try:
+        flushed = await run_in_threadpool(flush_rollup_buffer)
+        logger.info("Flushed %d dashboard rollup(s) on shutdown", flushed)
+    except Exception as exc:
+        logger.error("Failed to flush dashboard rollups on shutdown; %d key(s) lost: %s", len(rollup_buffer), exc)
@@ -1,33 +1,168 @@
-from typing import Any, Dict
-from fastapi import APIRouter, HTTPException, status
+import logging
+from datetime import datetime
+from functools import partial
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+import database
+from dashboard import dashboard_rollups, dashboard_sections, live_updates, timeseries
+from payments.payments_models import PaymentStatus
+from response_cache import ComputedResponse, ResponseCache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["Dashboard"]
 )
 
+# Operators poll the dashboard every few seconds; one computation serves them all
+dashboard_cache = ResponseCache()
+# Bounded cache of recently requested time series ranges
+timeseries_cache = ResponseCache(
+    ttl=timeseries.TIMESERIES_CACHE_TTL_SECONDS,
+    max_entries=timeseries.TIMESERIES_CACHE_MAX_ENTRIES,
+)
+
+
+async def _load_dashboard_data(granularity: str, buckets: int) -> ComputedResponse:
+    # Sections open their own sessions, since refreshes outlive the request
+    data, results = await dashboard_sections.dashboard_assembler.assemble(granularity, buckets)
+    return ComputedResponse(data, {"Server-Timing": dashboard_sections.server_timing(results)})
+
+
 @router.get("/data", response_model=Dict[str, Any])
-def get_dashboard_data_endpoint() -> Dict[str, Any]:
+async def get_dashboard_data_endpoint(
+    request: Request,
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    buckets: int = Query(24, ge=1, le=366),
+) -> Response:
     """
     Summarizes recent charges, new customers, and subscription metrics.
 
-    :return: A dictionary with summarized dashboard data.
+    Reads the precomputed rollups for the requested buckets and the per-plan
+    subscription aggregates; no charges, customers or subscriptions are scanned.
+    The three sections are loaded concurrently, each with its own timeout: a
+    section that is slow or failing keeps its last known value and is listed
+    under 'stale', and the Server-Timing header reports how long each took.
+    Responses are served from dashboard_cache with an ETag, so pollers get
+    304 Not Modified until the data changes.
+
+    :param request: The incoming request, for its If-None-Match header.
+    :param granularity: Bucket size of the summary: 'minute', 'hour' or 'day'.
+    :param buckets: Number of buckets to cover, ending with the current one.
+    :return: A JSON response with summarized dashboard data.
+    :raises HTTPException: 400 if too many buckets are requested, 500 if no section can be read.
     """
+    max_buckets = dashboard_rollups.MAX_BUCKETS[granularity]
+    if buckets > max_buckets:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Between 1 and {max_buckets} {granularity} buckets can be read.",
+        )
     try:
-        # TODO: Implement a real data retrieval operation here
-        dashboard_data = {
-            "recent_charges": [],
-            "new_customers": 0,
-            "subscription_metrics": {}
-        }
-        return dashboard_data
+        return await dashboard_cache.respond(
+            request,
+            partial(_load_dashboard_data, granularity, buckets),
+            key=f"{request.url.path}?buckets={buckets}&granularity={granularity}",
+        )
     except Exception as e:
-        # TODO: Add error logging here
+        logger.error("Failed to retrieve dashboard data: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to retrieve dashboard data"
         ) from e
 
+
+@router.get("/cache/metrics", response_model=Dict[str, Any])
+async def get_dashboard_cache_metrics() -> Dict[str, Any]:
+    """
+    Returns hit, miss and refresh counters of the dashboard response cache.
+
+    :return: A dictionary of cache statistics.
+    """
+    return dashboard_cache.stats()
+
+
+@router.get("/stream")
+async def stream_dashboard_endpoint() -> StreamingResponse:
+    """
+    Streams live dashboard updates as server-sent events.
+
+    'charge' events carry each created or refunded charge; 'metrics' events carry
+    the per-status change in charge count and volume since the previous one. A
+    viewer that falls too far behind gets a 'resync' event and is disconnected.
+
+    :return: A text/event-stream response.
+    :raises HTTPException: 503 if this worker already serves the maximum number of viewers.
+    """
+    try:
+        subscriber = live_updates.live_updates.subscribe()
+    except live_updates.TooManySubscribersError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e)) from e
+    return StreamingResponse(
+        live_updates.stream(subscriber),
+        media_type="text/event-stream",
+        # Proxies must pass frames through as they are written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _load_timeseries(
+    start: datetime, end: datetime, bucket_seconds: int, statuses: List[PaymentStatus]
+) -> Dict[str, Any]:
+    with database.session_scope() as db:
+        return timeseries.charge_timeseries(db, start, end, bucket_seconds, statuses)
+
+
+@router.get("/timeseries", response_model=Dict[str, Any])
+async def get_timeseries_endpoint(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket_seconds: int = Query(3600, ge=60, le=31 * 86400),
+    statuses: List[PaymentStatus] = Query([PaymentStatus.COMPLETED], alias="status"),
+) -> Response:
+    """
+    Returns charge counts, volume and p50/p95/p99 amounts per time bucket.
+
+    The range is snapped to bucket boundaries, so polls within the same bucket
+    share one cache entry.
+
+    The series is read from the 'payments' table only. Charges made through
+    payments_service are still kept in its in-memory store and never reach that
+    table, so they do not show up here (unlike in /dashboard/data and the live
+    stream, which are fed from the service itself).
+
+    :param request: The incoming request, for its If-None-Match header.
+    :param start: Start of the range (UTC); defaults to 24 buckets before the end.
+    :param end: End of the range (UTC); defaults to now.
+    :param bucket_seconds: Width of each bucket in seconds.
+    :param statuses: Payment statuses to include; repeat the 'status' parameter for several.
+    :return: A JSON response with 'totals' and per-bucket 'buckets'.
+    :raises HTTPException: 400 if the range is empty or has too many buckets,
+        500 if the data cannot be read.
+    """
+    try:
+        start, end = timeseries.align_range(start, end, bucket_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    statuses = sorted(set(statuses), key=lambda value: value.value)
+    key = (f"{request.url.path}?start={start.isoformat()}&end={end.isoformat()}&bucket_seconds={bucket_seconds}"
+           f"&status={','.join(value.value for value in statuses)}")
+    try:
+        return await timeseries_cache.respond(
+            request, partial(_load_timeseries, start, end, bucket_seconds, statuses), key=key
+        )
+    except Exception as e:
+        logger.error("Failed to compute charge time series: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute charge time series"
+        ) from e
+
+
 @router.get("/transactions/{charge_id}", response_model=Dict[str, Any])
 def get_transaction_details_endpoint(charge_id: str) -> Dict[str, Any]:
     """
@@ -0,0 +1,194 @@
+"""
+Concurrent assembly of the dashboard payload.
+
+The payload combines three independent sections: recent charges, new
+customers and subscription metrics. Each is read in its own thread with its
+own session, and all three are awaited together, each for at most
+DASHBOARD_SECTION_TIMEOUT_SECONDS. A section that times out or fails is
+replaced by its last successful value and listed under 'stale', so one slow
+source degrades the dashboard instead of failing it.
+
+Threads cannot be interrupted, so a load that times out keeps running and
+updates the section's last value when it finishes; requests arriving
+meanwhile wait on that load instead of starting another.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+import database
+from dashboard import dashboard_rollups
+from subscriptions import subscription_metrics
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_SECTION_TIMEOUT_SECONDS = float(os.getenv("DASHBOARD_SECTION_TIMEOUT_SECONDS", "1"))
+
+# A section loader returns the section's value and its part of the per-bucket series.
+SectionLoader = Callable[[str, int, datetime], Tuple[Any, List[Dict[str, Any]]]]
+SectionKey = Tuple[str, str, int]
+
+
+def load_recent_charges(granularity: str, buckets: int, now: datetime) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Reads charge count and volume per status.
+    """
+    with database.session_scope() as db:
+        rollups = dashboard_rollups.get_dashboard_rollups(db, granularity, buckets, now, metrics=("charges",))
+    return rollups["recent_charges"], rollups["series"]
+
+
+def load_new_customers(granularity: str, buckets: int, now: datetime) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Reads the number of customers created.
+    """
+    with database.session_scope() as db:
+        rollups = dashboard_rollups.get_dashboard_rollups(db, granularity, buckets, now, metrics=("customers",))
+    return rollups["new_customers"], rollups["series"]
+
+
+def load_subscription_metrics(granularity: str, buckets: int, now: datetime) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Reads subscriptions started and canceled, with the current active count and MRR.
+    """
+    with database.session_scope() as db:
+        rollups = dashboard_rollups.get_dashboard_rollups(db, granularity, buckets, now, metrics=("subscriptions",))
+        current = subscription_metrics.get_subscription_metrics(db)
+    return {
+        "active_subscriptions": current["active_subscriptions"],
+        "mrr": current["mrr"],
+        "started": rollups["subscriptions"]["started"],
+        "canceled": rollups["subscriptions"]["canceled"],
+    }, rollups["series"]
+
+
+# Section name -> (loader, the series metric it contributes)
+SECTIONS: Dict[str, Tuple[SectionLoader, str]] = {
+    "recent_charges": (load_recent_charges, "charges"),
+    "new_customers": (load_new_customers, "customers"),
+    "subscription_metrics": (load_subscription_metrics, "subscriptions"),
+}
+
+
+@dataclass
+class SectionResult:
+    """
+    Outcome of loading one section: its value, series, time waited in seconds and whether it is stale.
+    """
+    name: str
+    value: Any
+    series: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed: float = 0.0
+    stale: bool = False
+
+
+def server_timing(results: List[SectionResult]) -> str:
+    """
+    Formats section timings as a Server-Timing header value.
+    """
+    return ", ".join(
+        f"{result.name};dur={result.elapsed * 1000:.1f}" + (';desc="stale"' if result.stale else "")
+        for result in results
+    )
+
+
+class DashboardAssembler:
+    """
+    Loads the dashboard sections concurrently with per-section timeouts and stale fallbacks.
+
+    Must be used from the event loop.
+    """
+
+    def __init__(
+        self,
+        timeout: float = DASHBOARD_SECTION_TIMEOUT_SECONDS,
+        sections: Optional[Dict[str, Tuple[SectionLoader, str]]] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.sections = SECTIONS if sections is None else sections
+        self._last: Dict[SectionKey, Tuple[Any, List[Dict[str, Any]]]] = {}
+        self._inflight: Dict[SectionKey, "asyncio.Task[Any]"] = {}
+
+    async def assemble(
+        self,
+        granularity: str,
+        buckets: int,
+        now: Optional[datetime] = None,
+    ) -> Tuple[Dict[str, Any], List[SectionResult]]:
+        """
+        Loads every section and merges them into the dashboard payload.
+
+        :param granularity: 'minute', 'hour' or 'day'.
+        :param buckets: Number of buckets to cover, ending with the current one.
+        :param now: Reference time; defaults to now (UTC).
+        :return: The payload, whose 'stale' lists the sections holding their last known
+            value (null if there is none), and the per-section results.
+        :raises RuntimeError: If no section could be loaded and none has a previous value.
+        """
+        now = now or datetime.utcnow()
+        results = list(await asyncio.gather(*(
+            self._section(name, granularity, buckets, now) for name in self.sections
+        )))
+        if all(result.stale and result.value is None for result in results):
+            raise RuntimeError("No dashboard section could be loaded.")
+
+        series: Dict[datetime, Dict[str, Any]] = {}
+        for result in results:
+            metric = self.sections[result.name][1]
+            for bucket in result.series:
+                merged = series.setdefault(
+                    bucket["bucket_start"],
+                    {"bucket_start": bucket["bucket_start"], "charges": {}, "customers": {}, "subscriptions": {}},
+                )
+                merged[metric] = bucket[metric]
+
+        data: Dict[str, Any] = {
+            "granularity": granularity,
+            "since": dashboard_rollups.window_start(granularity, buckets, now),
+        }
+        data.update((result.name, result.value) for result in results)
+        data["series"] = [series[start] for start in sorted(series)]
+        data["stale"] = [result.name for result in results if result.stale]
+        return data, results
+
+    async def _section(self, name: str, granularity: str, buckets: int, now: datetime) -> SectionResult:
+        key = (name, granularity, buckets)
+        task = self._inflight.get(key)
+        if task is None:
+            loader = self.sections[name][0]
+            task = asyncio.create_task(run_in_threadpool(loader, granularity, buckets, now))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._finished, key))
+
+        started = time.perf_counter()
+        done, _ = await asyncio.wait({task}, timeout=self.timeout)
+        elapsed = time.perf_counter() - started
+        if done and not task.cancelled() and task.exception() is None:
+            value, series = task.result()
+            return SectionResult(name, value, series, elapsed)
+
+        if not done:
+            logger.warning("Dashboard section %s took longer than %.2fs; serving its last value", name, self.timeout)
+        value, series = self._last.get(key, (None, []))
+        return SectionResult(name, value, series, elapsed, stale=True)
+
+    def _finished(self, key: SectionKey, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error("Failed to load dashboard section %s: %s", key[0], task.exception())
+            return
+        self._last[key] = task.result()
+
+
+dashboard_assembler = DashboardAssembler()
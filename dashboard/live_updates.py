@@ -0,0 +1,324 @@
+"""
+In-process pub/sub feeding the dashboard's server-sent events stream.
+
+Charges publish a 'charge' event as soon as they are created or refunded, and
+add to a per-status metric delta that is published as one 'metrics' event
+every DASHBOARD_STREAM_METRICS_SECONDS, so a burst of charges costs viewers one
+frame instead of one per charge.
+
+Every event is encoded into an SSE frame once and the same bytes are handed to
+every subscriber. Subscribers belong to the event loop that serves them;
+publishing from another thread schedules one callback per loop, which appends
+the frame to each subscriber's buffer. Buffers hold at most
+DASHBOARD_STREAM_BUFFER_EVENTS frames: a viewer that falls that far behind is
+disconnected and told to resync, rather than buffered without limit.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_STREAM_BUFFER_EVENTS = int(os.getenv("DASHBOARD_STREAM_BUFFER_EVENTS", "256"))
+DASHBOARD_STREAM_MAX_CLIENTS = int(os.getenv("DASHBOARD_STREAM_MAX_CLIENTS", "10000"))
+DASHBOARD_STREAM_METRICS_SECONDS = float(os.getenv("DASHBOARD_STREAM_METRICS_SECONDS", "1"))
+# Comment frames keep idle connections open through proxies
+DASHBOARD_STREAM_HEARTBEAT_SECONDS = float(os.getenv("DASHBOARD_STREAM_HEARTBEAT_SECONDS", "15"))
+# Tells EventSource clients how long to wait before reconnecting
+DASHBOARD_STREAM_RETRY_MS = int(os.getenv("DASHBOARD_STREAM_RETRY_MS", "3000"))
+
+HEARTBEAT_FRAME = b": keepalive\n\n"
+
+
+class TooManySubscribersError(Exception):
+    """
+    Raised when a worker already serves DASHBOARD_STREAM_MAX_CLIENTS viewers.
+    """
+    pass
+
+
+def encode_event(event_id: int, event: str, data: Any) -> bytes:
+    """
+    Encodes one server-sent event frame.
+
+    :param event_id: The event's sequence number, sent as its id.
+    :param event: The event type.
+    :param data: JSON-serializable payload.
+    :return: The frame, ending with the blank line that terminates it.
+    """
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event.encode(), orjson.dumps(data))
+
+
+class Subscriber:
+    """
+    One viewer's bounded buffer of pending frames. Used only from its event loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_buffered: int) -> None:
+        self.loop = loop
+        self.max_buffered = max_buffered
+        self.dropped = False
+        self._frames: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def push(self, frame: bytes) -> bool:
+        """
+        Queues a frame.
+
+        :return: False if the buffer is full, in which case the subscriber is marked dropped.
+        """
+        if self.dropped:
+            return False
+        if len(self._frames) >= self.max_buffered:
+            self.dropped = True
+            self._frames.clear()
+            self._ready.set()
+            return False
+        self._frames.append(frame)
+        self._ready.set()
+        return True
+
+    async def next_frames(self) -> List[bytes]:
+        """
+        Waits for and returns every queued frame; empty once the subscriber has been dropped.
+        """
+        await self._ready.wait()
+        self._ready.clear()
+        frames = list(self._frames)
+        self._frames.clear()
+        return frames
+
+
+class LiveUpdates:
+    """
+    Fans events out to subscribers on any number of event loops.
+
+    publish() and record_charge() are thread-safe; subscribe() must be called from
+    the event loop that will serve the subscriber.
+    """
+
+    def __init__(
+        self,
+        max_buffered: int = DASHBOARD_STREAM_BUFFER_EVENTS,
+        max_subscribers: int = DASHBOARD_STREAM_MAX_CLIENTS,
+    ) -> None:
+        self.max_buffered = max_buffered
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[asyncio.AbstractEventLoop, Set[Subscriber]] = {}
+        self._metrics: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self) -> Subscriber:
+        """
+        Registers a subscriber on the running event loop.
+
+        :return: The new subscriber; pass it to unsubscribe() when the viewer leaves.
+        :raises TooManySubscribersError: If max_subscribers viewers are already connected.
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(loop, self.max_buffered)
+        with self._lock:
+            if sum(len(subscribers) for subscribers in self._subscribers.values()) >= self.max_subscribers:
+                raise TooManySubscribersError(f"At most {self.max_subscribers} dashboard viewers are allowed.")
+            self._subscribers.setdefault(loop, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        Removes a subscriber; does nothing if it is already gone.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.loop)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.loop]
+
+    def publish(self, event: str, data: Any) -> None:
+        """
+        Sends an event to every subscriber.
+
+        :param event: The event type, e.g. 'charge' or 'metrics'.
+        :param data: JSON-serializable payload.
+        """
+        with self._lock:
+            if not self._subscribers:
+                return
+            frame = encode_event(next(self._sequence), event, data)
+            loops = list(self._subscribers)
+            self.published += 1
+        self._broadcast(loops, frame)
+
+    def heartbeat(self) -> None:
+        """
+        Sends a keepalive comment to every subscriber.
+        """
+        with self._lock:
+            loops = list(self._subscribers)
+        self._broadcast(loops, HEARTBEAT_FRAME)
+
+    def record_charge(self, status: str, volume: float) -> None:
+        """
+        Adds a charge to the metric delta sent by the next flush_metrics().
+
+        :param status: The charge's status, e.g. 'successful' or 'refunded'.
+        :param volume: The charge amount.
+        """
+        with self._lock:
+            totals = self._metrics[status]
+            totals[0] += 1
+            totals[1] += volume
+
+    def flush_metrics(self) -> bool:
+        """
+        Publishes the metric delta accumulated since the last flush, if any.
+
+        :return: True if a 'metrics' event was published.
+        """
+        with self._lock:
+            metrics, self._metrics = self._metrics, defaultdict(lambda: [0, 0.0])
+        if not metrics:
+            return False
+        self.publish("metrics", {
+            "recent_charges": [
+                {"status": status, "count": int(count), "volume": round(volume, 2)}
+                for status, (count, volume) in sorted(metrics.items())
+            ],
+        })
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of connected viewers and the published and dropped counters.
+        """
+        return {"subscribers": len(self), "published": self.published, "dropped": self.dropped}
+
+    def _broadcast(self, loops: List[asyncio.AbstractEventLoop], frame: bytes) -> None:
+        try:
+            current: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop in loops:
+            if loop is current:
+                self._deliver(loop, frame)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop, frame)
+            except RuntimeError:
+                # The loop has been closed without its subscribers unsubscribing
+                with self._lock:
+                    self._subscribers.pop(loop, None)
+
+    def _deliver(self, loop: asyncio.AbstractEventLoop, frame: bytes) -> None:
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(loop, ()))
+        for subscriber in subscribers:
+            if subscriber.dropped or subscriber.push(frame):
+                continue
+            self.unsubscribe(subscriber)
+            with self._lock:
+                self.dropped += 1
+            logger.warning("Dropped a dashboard viewer that fell %d events behind", subscriber.max_buffered)
+
+
+async def stream(subscriber: Subscriber, updates: Optional[LiveUpdates] = None) -> AsyncIterator[bytes]:
+    """
+    Yields a subscriber's frames as a text/event-stream body, unsubscribing when it ends.
+
+    A dropped subscriber gets a final 'resync' event telling it to reload /dashboard/data
+    before reconnecting.
+
+    :param subscriber: A subscriber from LiveUpdates.subscribe().
+    :param updates: The LiveUpdates it belongs to; defaults to the process-wide live_updates.
+    """
+    updates = live_updates if updates is None else updates
+    try:
+        yield b"retry: %d\n\n" % DASHBOARD_STREAM_RETRY_MS
+        while True:
+            frames = await subscriber.next_frames()
+            if subscriber.dropped:
+                yield b"event: resync\ndata: {}\n\n"
+                return
+            yield b"".join(frames)
+    finally:
+        updates.unsubscribe(subscriber)
+
+
+def publish_charge(charge: Dict[str, Any]) -> None:
+    """
+    Publishes a created or refunded charge to dashboard viewers. Never raises.
+
+    :param charge: The charge details, as returned by the payments service.
+    """
+    try:
+        live_updates.record_charge(charge["status"], charge["amount"])
+        live_updates.publish("charge", {
+            "charge_id": charge["charge_id"],
+            "customer_id": charge["customer_id"],
+            "amount": charge["amount"],
+            "status": charge["status"],
+        })
+    except Exception as exc:
+        # Viewers missing an update must never fail the charge itself
+        logger.error("Failed to publish charge %s to the dashboard stream: %s", charge.get("charge_id"), exc)
+
+
+live_updates = LiveUpdates()
+
+_publish_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _publish_periodically(metrics_interval: float, heartbeat_interval: float) -> None:
+    since_heartbeat = 0.0
+    while True:
+        await asyncio.sleep(metrics_interval)
+        since_heartbeat += metrics_interval
+        try:
+            live_updates.flush_metrics()
+            if since_heartbeat >= heartbeat_interval:
+                since_heartbeat = 0.0
+                live_updates.heartbeat()
+        except Exception as exc:
+            logger.error("Failed to publish dashboard metrics: %s", exc)
+
+
+async def start_live_updates() -> None:
+    """
+    Starts publishing metric deltas and heartbeats. Intended as an application startup handler.
+    """
+    global _publish_task
+    if _publish_task is None:
+        _publish_task = asyncio.create_task(
+            _publish_periodically(DASHBOARD_STREAM_METRICS_SECONDS, DASHBOARD_STREAM_HEARTBEAT_SECONDS)
+        )
+
+
+async def stop_live_updates() -> None:
+    """
+    Stops the periodic publishing. Intended as an application shutdown handler.
+    """
+    global _publish_task
+    if _publish_task is not None:
+        _publish_task.cancel()
+        try:
+            await _publish_task
+        except asyncio.CancelledError:
+            pass
+        _publish_task = None
@@ -0,0 +1,342 @@
+"""
+Bucketed charge time series computed with NumPy.
+
+The (created_at, amount) columns of the payments in a range are loaded straight
+into NumPy arrays, with timestamps converted to epoch seconds by the database
+so no datetime objects are built per row. Counts and volumes per bucket are
+single bincount calls, and amount percentiles are read from each bucket's
+sorted slice with vectorized indexing.
+
+Row fetching dominates, so the arrays of settled days are kept in a bounded
+SegmentCache: a range that overlaps earlier requests only queries the days
+not loaded yet and the current, unsettled one.
+
+Only rows in the 'payments' table are counted. payments_service does not write
+to it yet (charges live in its in-memory store), so its charges are missing
+from the series until charges are persisted there.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from payments.payments_models import Payment, PaymentStatus
+
+logger = logging.getLogger(__name__)
+
+# Cached responses are recomputed in the background after this long; see dashboard_router.timeseries_cache.
+TIMESERIES_CACHE_TTL_SECONDS = float(os.getenv("TIMESERIES_CACHE_TTL_SECONDS", "30"))
+TIMESERIES_CACHE_MAX_ENTRIES = int(os.getenv("TIMESERIES_CACHE_MAX_ENTRIES", "64"))
+# Payments held in cached day segments, at 16 bytes each
+TIMESERIES_SEGMENT_CACHE_ROWS = int(os.getenv("TIMESERIES_SEGMENT_CACHE_ROWS", "10000000"))
+# Cached days are reloaded after this long, which bounds how long a late status change goes unseen
+TIMESERIES_SEGMENT_TTL_SECONDS = float(os.getenv("TIMESERIES_SEGMENT_TTL_SECONDS", "600"))
+# A day is cached only once it ended this long ago, since recent payments still change status
+TIMESERIES_SEGMENT_SETTLE_SECONDS = float(os.getenv("TIMESERIES_SEGMENT_SETTLE_SECONDS", "3600"))
+SEGMENT_SECONDS = 86400
+PERCENTILES = (50, 95, 99)
+# Upper bound on the number of buckets one request may produce; keeps bucket indexes within int16.
+MAX_TIMESERIES_BUCKETS = 10000
+# Rows fetched from the cursor per batch while filling the arrays.
+FETCH_BATCH_ROWS = 100000
+EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_seconds(session: Session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", Payment.created_at), Integer)
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", Payment.created_at), BigInteger)
+    raise NotImplementedError(f"Time series are not supported on {dialect}")
+
+
+def _to_epoch(value: datetime) -> int:
+    # Stored timestamps are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((value - EPOCH).total_seconds())
+
+
+def load_payment_arrays(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    statuses: Sequence[PaymentStatus] = (PaymentStatus.COMPLETED,),
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Loads the creation times and amounts of the payments in a range.
+
+    :param session: Database session to read from.
+    :param start: Start of the range, inclusive.
+    :param end: End of the range, exclusive.
+    :param statuses: Payment statuses to include.
+    :return: Epoch seconds (int64) and amounts (float64), ordered by creation time.
+    """
+    # Executed on the connection: ORM result processing would cost more than the query itself
+    result = session.connection().execute(
+        select(_epoch_seconds(session), Payment.amount)
+        .where(Payment.created_at >= start, Payment.created_at < end, Payment.status.in_(list(statuses)))
+        .order_by(Payment.created_at)
+    )
+    timestamps: List[np.ndarray] = []
+    amounts: List[np.ndarray] = []
+    while True:
+        rows = result.fetchmany(FETCH_BATCH_ROWS)
+        if not rows:
+            break
+        pairs = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows))
+        timestamps.append(pairs[0::2].astype(np.int64))
+        amounts.append(pairs[1::2])
+    if not timestamps:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(timestamps), np.concatenate(amounts)
+
+
+def bucket_statistics(
+    timestamps: np.ndarray,
+    amounts: np.ndarray,
+    start: int,
+    bucket_seconds: int,
+    buckets: int,
+    percentiles: Sequence[int] = PERCENTILES,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes count, volume and amount percentiles per bucket.
+
+    Percentiles use linear interpolation, like numpy.percentile; empty buckets get NaN.
+
+    :param timestamps: Epoch seconds of each payment.
+    :param amounts: Amount of each payment.
+    :param start: Epoch seconds at which the first bucket starts.
+    :param bucket_seconds: Width of each bucket.
+    :param buckets: Number of buckets.
+    :param percentiles: Percentiles to compute, between 0 and 100.
+    :return: Arrays 'count', 'volume' and 'p<N>' for each percentile, one entry per bucket.
+    """
+    index = (timestamps - start) // bucket_seconds
+    inside = (index >= 0) & (index < buckets)
+    index, amounts = index[inside], amounts[inside]
+    if np.any(index[1:] < index[:-1]):
+        # Radix sort on the narrow bucket index; loaded arrays are usually in order already
+        order = np.argsort(index.astype(np.int16 if buckets <= np.iinfo(np.int16).max else np.int64), kind="stable")
+        index, amounts = index[order], amounts[order]
+
+    counts = np.bincount(index, minlength=buckets)
+    stats: Dict[str, np.ndarray] = {
+        "count": counts,
+        "volume": np.bincount(index, weights=amounts, minlength=buckets),
+    }
+
+    # Sorting each bucket's slice separately is much cheaper than one sort by (bucket, amount)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    ordered = amounts.copy()
+    for bucket in np.flatnonzero(counts > 1):
+        ordered[bounds[bucket]:bounds[bucket + 1]].sort()
+
+    offsets = bounds[:-1]
+    filled = counts > 0
+    for percentile in percentiles:
+        values = np.full(buckets, np.nan)
+        position = offsets[filled] + (counts[filled] - 1) * (percentile / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, offsets[filled] + counts[filled] - 1)
+        values[filled] = ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+        stats[f"p{percentile}"] = values
+    return stats
+
+
+class SegmentCache:
+    """
+    Bounded LRU of the payment arrays of whole settled days.
+
+    Thread-safe; two requests missing the same day may both load it.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = TIMESERIES_SEGMENT_CACHE_ROWS,
+        ttl: float = TIMESERIES_SEGMENT_TTL_SECONDS,
+        settle_seconds: float = TIMESERIES_SEGMENT_SETTLE_SECONDS,
+    ) -> None:
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.settle_seconds = settle_seconds
+        self._segments: "OrderedDict[Tuple[int, Tuple[str, ...]], Tuple[float, np.ndarray, np.ndarray]]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(
+        self,
+        session: Session,
+        start: datetime,
+        end: datetime,
+        statuses: Sequence[PaymentStatus] = (PaymentStatus.COMPLETED,),
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the same arrays as load_payment_arrays(), reading settled days from the cache.
+
+        :param session: Database session to read missing days from.
+        :param start: Start of the range, inclusive.
+        :param end: End of the range, exclusive.
+        :param statuses: Payment statuses to include.
+        :return: Epoch seconds (int64) and amounts (float64), ordered by creation time.
+        """
+        position, end_seconds = _to_epoch(start), _to_epoch(end)
+        settled_before = _to_epoch(datetime.utcnow()) - self.settle_seconds
+        timestamps: List[np.ndarray] = []
+        amounts: List[np.ndarray] = []
+        while position < end_seconds:
+            day = position // SEGMENT_SECONDS * SEGMENT_SECONDS
+            if day + SEGMENT_SECONDS > settled_before:
+                # Everything from here on is too recent to cache
+                day_timestamps, day_amounts = load_payment_arrays(
+                    session, EPOCH + timedelta(seconds=position), end, statuses
+                )
+                timestamps.append(day_timestamps)
+                amounts.append(day_amounts)
+                break
+            day_timestamps, day_amounts = self._segment(session, day, statuses)
+            stop = min(end_seconds, day + SEGMENT_SECONDS)
+            lower, upper = np.searchsorted(day_timestamps, [position, stop])
+            timestamps.append(day_timestamps[lower:upper])
+            amounts.append(day_amounts[lower:upper])
+            position = stop
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(timestamps), np.concatenate(amounts)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of cached days and rows and the hit and miss counters.
+        """
+        with self._lock:
+            return {"segments": len(self._segments), "rows": self._rows, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        """
+        Drops every cached day.
+        """
+        with self._lock:
+            self._segments.clear()
+            self._rows = 0
+
+    def _segment(self, session: Session, day: int, statuses: Sequence[PaymentStatus]) -> Tuple[np.ndarray, np.ndarray]:
+        key = (day, tuple(sorted(status.value for status in statuses)))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._segments.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.hits += 1
+                self._segments.move_to_end(key)
+                return entry[1], entry[2]
+            self.misses += 1
+
+        timestamps, amounts = load_payment_arrays(
+            session, EPOCH + timedelta(seconds=day), EPOCH + timedelta(seconds=day + SEGMENT_SECONDS), statuses
+        )
+        # Shared between threads from here on
+        timestamps.setflags(write=False)
+        amounts.setflags(write=False)
+        with self._lock:
+            previous = self._segments.pop(key, None)
+            if previous is not None:
+                self._rows -= previous[1].size
+            if timestamps.size <= self.max_rows:
+                self._segments[key] = (now, timestamps, amounts)
+                self._rows += timestamps.size
+                while self._rows > self.max_rows:
+                    _, (_, evicted, _) = self._segments.popitem(last=False)
+                    self._rows -= evicted.size
+        return timestamps, amounts
+
+
+def align_range(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    bucket_seconds: int,
+    default_buckets: int = 24,
+) -> Tuple[datetime, datetime]:
+    """
+    Snaps a range to bucket boundaries so repeated requests share cache entries.
+
+    :param start: Requested start; defaults to default_buckets buckets before the end.
+    :param end: Requested end; defaults to now. Rounded up to the next bucket boundary.
+    :param bucket_seconds: Width of each bucket.
+    :param default_buckets: Number of buckets covered when no start is given.
+    :return: The aligned (start, end) as naive UTC datetimes.
+    :raises ValueError: If the range is empty or has more than MAX_TIMESERIES_BUCKETS buckets.
+    """
+    end_seconds = _to_epoch(end or datetime.utcnow())
+    end_seconds = -(-end_seconds // bucket_seconds) * bucket_seconds
+    if start is None:
+        start_seconds = end_seconds - default_buckets * bucket_seconds
+    else:
+        start_seconds = _to_epoch(start) // bucket_seconds * bucket_seconds
+    if start_seconds >= end_seconds:
+        raise ValueError("The range must end after it starts.")
+    if (end_seconds - start_seconds) // bucket_seconds > MAX_TIMESERIES_BUCKETS:
+        raise ValueError(f"A time series may have at most {MAX_TIMESERIES_BUCKETS} buckets.")
+    return EPOCH + timedelta(seconds=start_seconds), EPOCH + timedelta(seconds=end_seconds)
+
+
+def charge_timeseries(
+    session: Session,
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int,
+    statuses: Sequence[PaymentStatus] = (PaymentStatus.COMPLETED,),
+    segments: Optional[SegmentCache] = None,
+) -> Dict[str, Any]:
+    """
+    Returns charge counts, volumes and amount percentiles per bucket.
+
+    :param session: Database session to read from.
+    :param start: Start of the range, on a bucket boundary; see align_range().
+    :param end: End of the range, on a bucket boundary.
+    :param bucket_seconds: Width of each bucket.
+    :param statuses: Payment statuses to include.
+    :param segments: Cache of settled days; defaults to the process-wide segment_cache.
+    :return: A dictionary with the range, 'totals' and one entry per bucket in 'buckets'.
+    """
+    start_seconds = _to_epoch(start)
+    buckets = (_to_epoch(end) - start_seconds) // bucket_seconds
+    timestamps, amounts = (segment_cache if segments is None else segments).load(session, start, end, statuses)
+    stats = bucket_statistics(timestamps, amounts, start_seconds, bucket_seconds, buckets)
+
+    # Rounded in bulk and converted with tolist(), which is far cheaper than per-element float()
+    columns = {"count": stats["count"].tolist(), "volume": np.round(stats["volume"], 2).tolist()}
+    for q in PERCENTILES:
+        # NaN (the only value not equal to itself) marks an empty bucket
+        columns[f"p{q}"] = [None if value != value else value for value in np.round(stats[f"p{q}"], 2).tolist()]
+    names = list(columns)
+
+    return {
+        "start": start,
+        "end": end,
+        "bucket_seconds": bucket_seconds,
+        "statuses": [status.value for status in statuses],
+        "totals": {
+            "count": int(amounts.size),
+            "volume": round(float(amounts.sum()), 2),
+            **{f"p{q}": round(float(np.percentile(amounts, q)), 2) if amounts.size else None for q in PERCENTILES},
+        },
+        "buckets": [
+            {"bucket_start": start + timedelta(seconds=position * bucket_seconds), **dict(zip(names, values))}
+            for position, values in enumerate(zip(*columns.values()))
+        ],
+    }
+
+
+segment_cache = SegmentCache()
@@ -0,0 +1,156 @@
+"""Shared SQLAlchemy engine and session helpers used by the service modules."""
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import get_database_url
+
+__all__ = ["SessionLocal", "get_engine", "reset_engine", "session_scope", "get_db", "upsert_add", "insert_new"]
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+_engine: Optional[Engine] = None
+
+
+def get_engine() -> Engine:
+    """
+    Returns the process-wide engine, creating it from DATABASE_URL on first use.
+
+    :return: The SQLAlchemy engine bound to SessionLocal.
+    :raises ValueError: If the 'DATABASE_URL' environment variable is missing.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(get_database_url(), pool_pre_ping=True)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def reset_engine(database_url: Optional[str] = None) -> Engine:
+    """
+    Disposes of the current engine and creates a new one.
+
+    Engines must not be shared across a fork, so worker processes call this
+    on start-up before touching the database. Pooled connections are dropped
+    without being closed so a forked child never closes its parent's sockets.
+
+    :param database_url: Optional URL overriding DATABASE_URL.
+    :return: The newly created engine.
+    """
+    global _engine
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+    if database_url is None:
+        return get_engine()
+    _engine = create_engine(database_url, pool_pre_ping=True)
+    SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Provides a transactional scope around a series of operations.
+
+    Commits when the block exits normally and rolls back on any exception.
+
+    :return: An open SQLAlchemy session.
+    """
+    get_engine()
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_db() -> Iterator[Session]:
+    """
+    FastAPI dependency yielding a session that is closed after the request.
+
+    :return: An open SQLAlchemy session.
+    """
+    get_engine()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def upsert_add(
+    session: Session,
+    model: Any,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    add_columns: Sequence[str],
+) -> None:
+    """
+    Inserts rows, or adds their values onto the existing rows on a key conflict.
+
+    Runs inside the caller's transaction; nothing is committed here.
+
+    :param session: Database session used for the write.
+    :param model: Mapped class of the target table.
+    :param rows: Row dictionaries including the key columns.
+    :param index_elements: Columns of the unique key that identifies a row.
+    :param add_columns: Columns whose values are added rather than replaced on conflict.
+    :raises NotImplementedError: If the database has no INSERT ... ON CONFLICT support.
+    """
+    if not rows:
+        return
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(model)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(model)
+    else:
+        raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+    updates = {column: getattr(model, column) + statement.excluded[column] for column in add_columns}
+    if hasattr(model, "updated_at"):
+        updates["updated_at"] = datetime.utcnow()
+    session.execute(statement.on_conflict_do_update(index_elements=list(index_elements), set_=updates), rows)
+
+
+def insert_new(
+    session: Session,
+    model: Any,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+) -> List[Any]:
+    """
+    Inserts only the rows whose key does not exist yet, in a single statement.
+
+    Runs inside the caller's transaction; nothing is committed here.
+
+    :param session: Database session used for the write.
+    :param model: Mapped class of the target table.
+    :param rows: Row dictionaries including the key columns.
+    :param index_elements: Columns of the unique key; the first one is returned for inserted rows.
+    :return: Values of the first key column for the rows that were inserted.
+    :raises NotImplementedError: If the database has no INSERT ... ON CONFLICT support.
+    """
+    if not rows:
+        return []
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(model)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(model)
+    else:
+        raise NotImplementedError(f"Insert-if-new is not supported on {dialect}")
+
+    statement = statement.values(rows).on_conflict_do_nothing(index_elements=list(index_elements))
+    return list(session.execute(statement.returning(getattr(model, index_elements[0]))).scalars())
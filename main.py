@@ -1,7 +1,11 @@
 import uvicorn
 from fastapi import FastAPI
 
-# TODO: Import routers (e.g. from .routers import payments, customers)
+from customers import customers_router
+from dashboard import dashboard_rollups, dashboard_router, live_updates
+from payments import payments_router
+from subscriptions import dunning, plan_catalog, subscriptions_router, usage_metering
+from webhooks import event_log, webhook_dedupe, webhook_delivery, webhook_ingestion, webhooks_router, webhooks_service
 
 
 def create_app() -> FastAPI:
@@ -13,12 +17,35 @@ def create_app() -> FastAPI:
     """
     app = FastAPI(title="Stripe_lite")
 
-    # TODO: Include your routers here
-    # Example:
-    # app.include_router(payments.router, prefix="/payments", tags=["Payments"])
-    # app.include_router(customers.router, prefix="/customers", tags=["Customers"])
+    app.include_router(payments_router.router, prefix="/payments", tags=["Payments"])
+    app.include_router(customers_router.router)
+    app.include_router(subscriptions_router.router)
+    app.include_router(webhooks_router.router, prefix="/webhooks", tags=["Webhooks"])
+    app.include_router(webhooks_router.admin_router, prefix="/webhooks", tags=["Webhooks"])
+    app.include_router(dashboard_router.router)
 
-    # TODO: Add middleware, event handlers, and other configurations as needed
+    app.add_event_handler("startup", plan_catalog.start_plan_catalog)
+    app.add_event_handler("startup", usage_metering.start_usage_metering)
+    app.add_event_handler("startup", dunning.start_dunning)
+    app.add_event_handler("startup", event_log.start_event_log)
+    app.add_event_handler("startup", webhooks_service.start_renewal_batcher)
+    app.add_event_handler("startup", webhook_ingestion.start_webhook_workers)
+    app.add_event_handler("startup", webhook_dedupe.start_claim_recovery)
+    app.add_event_handler("startup", webhook_delivery.start_webhook_delivery)
+    app.add_event_handler("startup", dashboard_rollups.start_dashboard_rollups)
+    app.add_event_handler("startup", live_updates.start_live_updates)
+    app.add_event_handler("shutdown", plan_catalog.stop_plan_catalog)
+    app.add_event_handler("shutdown", usage_metering.stop_usage_metering)
+    app.add_event_handler("shutdown", dunning.stop_dunning)
+    app.add_event_handler("shutdown", webhook_dedupe.stop_claim_recovery)
+    app.add_event_handler("shutdown", webhook_ingestion.stop_webhook_workers)
+    app.add_event_handler("shutdown", webhooks_service.stop_renewal_batcher)
+    app.add_event_handler("shutdown", event_log.stop_event_log)
+    app.add_event_handler("shutdown", webhook_delivery.stop_webhook_delivery)
+    app.add_event_handler("shutdown", dashboard_rollups.stop_dashboard_rollups)
+    app.add_event_handler("shutdown", live_updates.stop_live_updates)
+
+    # TODO: Add middleware and other configurations as needed
 
     return app
 
@@ -1,6 +1,9 @@
 import logging
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from dashboard import dashboard_rollups, live_updates
+from webhooks.webhook_delivery import emit_event
 
 # In-memory store for demonstration purposes
 # TODO: Replace with a real database or persistent storage in production
@@ -16,6 +19,26 @@ class PaymentServiceError(Exception):
     pass
 
 
+def _publish_charge(charge_details: Dict[str, Any], event_type: Optional[str] = None) -> None:
+    """
+    Feeds a charge that has been created or refunded to the dashboard and, optionally,
+    to merchant webhooks. Never raises: the charge itself has already happened.
+
+    :param charge_details: The charge, with its new status.
+    :param event_type: Webhook event to emit, if any.
+    """
+    try:
+        dashboard_rollups.rollup_buffer.record("charges", charge_details["status"], volume=charge_details["amount"])
+    except Exception as e:
+        logger.error("Failed to record charge %s in the dashboard rollups: %s", charge_details["charge_id"], e)
+    live_updates.publish_charge(charge_details)
+    if event_type is not None:
+        try:
+            emit_event(event_type, dict(charge_details))
+        except Exception as e:
+            logger.error("Failed to emit %s for charge %s: %s", event_type, charge_details["charge_id"], e)
+
+
 def create_charge(customer_id: str, amount: float, payment_method: str) -> Dict[str, Any]:
     """
     Creates a new charge for a given customer, storing charge details
@@ -49,11 +72,13 @@ def create_charge(customer_id: str, amount: float, payment_method: str) -> Dict[
         charge_details["status"] = "successful"
 
         logger.info("Charge created successfully: %s", charge_details)
-        return charge_details
     except Exception as e:
         logger.error("Error creating charge: %s", e)
         raise PaymentServiceError("Failed to create charge") from e
 
+    _publish_charge(charge_details, "charge.succeeded")
+    return charge_details
+
 
 def refund_charge(charge_id: str) -> Dict[str, Any]:
     """
@@ -75,7 +100,9 @@ def refund_charge(charge_id: str) -> Dict[str, Any]:
         charge_details["status"] = "refunded"
 
         logger.info("Charge refunded successfully: %s", charge_details)
-        return charge_details
     except Exception as e:
         logger.error("Error refunding charge: %s", e)
-        raise PaymentServiceError("Failed to refund charge") from e
\ No newline at end of file
+        raise PaymentServiceError("Failed to refund charge") from e
+
+    _publish_charge(charge_details)
+    return charge_details
\ No newline at end of file
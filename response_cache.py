@@ -0,0 +1,213 @@
+"""
+Stale-while-revalidate cache for read-heavy JSON endpoints.
+
+Responses are cached per route and query string as pre-serialized bytes with
+an ETag, so a cache hit costs no query and no JSON encoding, and a client
+sending a matching If-None-Match gets an empty 304. An entry is fresh for
+'ttl' seconds; for 'stale_ttl' seconds after that it is still served while a
+single background task recomputes it. Concurrent misses for the same key share
+one computation, which runs as its own task: a caller that is cancelled stops
+waiting for it without cancelling it for the others.
+
+Computations may be plain functions, which run in the thread pool, or
+coroutine functions, which run on the event loop and can fan out themselves.
+Returning a ComputedResponse attaches headers to the cached entry.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Set
+
+import orjson
+from fastapi import Request, Response, status
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "2"))
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+
+@dataclass(frozen=True)
+class ComputedResponse:
+    """
+    Response data together with headers to send whenever it is served.
+    """
+    data: Any
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """
+    A serialized response body, its ETag, when it was computed (monotonic seconds) and extra headers.
+    """
+    body: bytes
+    etag: str
+    created_at: float
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def cache_key(request: Request) -> str:
+    """
+    Returns the cache key of a request: its path and its query parameters in sorted order.
+    """
+    query = sorted(request.query_params.multi_items())
+    return request.url.path + ("?" + "&".join(f"{name}={value}" for name, value in query) if query else "")
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    # Weak comparison, as for GET requests
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class ResponseCache:
+    """
+    Bounded LRU of serialized responses with stale-while-revalidate refreshes.
+
+    Must be used from the event loop; computations run in the thread pool.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        stale_ttl: float = RESPONSE_CACHE_STALE_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[CachedResponse]"] = {}
+        self._refreshing: Set["asyncio.Task[CachedResponse]"] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """
+        Drops every cached response.
+        """
+        self._entries.clear()
+
+    async def get(self, key: str, compute: Callable[[], Any]) -> CachedResponse:
+        """
+        Returns the cached response for a key, computing it on a miss.
+
+        :param key: The cache key, usually from cache_key().
+        :param compute: Function returning the JSON-serializable response data, or a
+            ComputedResponse. Synchronous functions run in the thread pool, coroutine
+            functions on the event loop. It must not depend on the request's lifetime,
+            since a stale entry is refreshed after the request has been answered.
+        :return: The cached response.
+        :raises Exception: Whatever compute raises when there is nothing to serve instead.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._refresh(key, compute)
+                return entry
+        self.misses += 1
+        return await self._load(key, compute)
+
+    async def respond(self, request: Request, compute: Callable[[], Any], key: Optional[str] = None) -> Response:
+        """
+        Answers a request from the cache, with 304 Not Modified when the client's ETag matches.
+
+        :param request: The incoming request.
+        :param compute: Synchronous function returning the response data; see get().
+        :param key: Cache key; defaults to cache_key(request).
+        :return: A JSON response carrying the ETag, or an empty 304.
+        """
+        entry = await self.get(key or cache_key(request), compute)
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": f"max-age={int(self.ttl)}"}
+        if _etag_matches(request.headers.get("If-None-Match"), entry.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit, miss and refresh counters.
+        """
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+    async def _load(self, key: str, compute: Callable[[], Any]) -> CachedResponse:
+        # Callers only wait on the shared task, so cancelling one leaves it running for the rest
+        return await asyncio.shield(self._start(key, compute))
+
+    def _start(self, key: str, compute: Callable[[], Any]) -> "asyncio.Task[CachedResponse]":
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._load_done, key))
+        return task
+
+    async def _compute(self, key: str, compute: Callable[[], Any]) -> CachedResponse:
+        if inspect.iscoroutinefunction(compute):
+            data = await compute()
+        else:
+            data = await run_in_threadpool(compute)
+        headers: Dict[str, str] = {}
+        if isinstance(data, ComputedResponse):
+            data, headers = data.data, data.headers
+        body = orjson.dumps(data)
+        entry = CachedResponse(
+            body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', time.monotonic(), headers
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _load_done(self, key: str, task: "asyncio.Task[CachedResponse]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller stopped waiting
+        if not task.cancelled():
+            task.exception()
+
+    def _refresh(self, key: str, compute: Callable[[], Any]) -> None:
+        if key in self._inflight:
+            return
+        self.refreshes += 1
+        task = self._start(key, compute)
+        self._refreshing.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: "asyncio.Task[CachedResponse]") -> None:
+        self._refreshing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.error("Failed to refresh cached response; serving stale data: %s", task.exception())
@@ -0,0 +1,238 @@
+"""
+Month-start billing run that invoices every active subscription.
+
+Active subscriptions are partitioned into contiguous ID ranges and the ranges
+are fanned out to a process pool. Each worker writes the invoices for its
+range in a single transaction, and subscriptions that already have an invoice
+for the period are skipped, so a run can be resumed after a crash without
+double-invoicing. Each invoice carries the plan price for the period plus the
+metered usage of the period before it, and is committed together with its
+dunning attempt. Once a chunk is committed its payments are attempted; first
+payments that a crashed run never attempted are made by the dunning scheduler.
+
+Usage:
+    python -m subscriptions.billing_cycle --period-start 2025-01-01 --workers 8
+"""
+
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, create_engine, func, insert, select
+from sqlalchemy.orm import Session
+
+import database
+from config import get_database_url
+from subscriptions import dunning
+from subscriptions.invoice_numbering import DEFAULT_ACCOUNT, allocator
+from subscriptions.plan_catalog import catalog
+from subscriptions.subscriptions_models import Invoice, Subscription
+from subscriptions.proration import previous_period
+from subscriptions.subscriptions_service import billing_period, calculate_amount_due
+from subscriptions.usage_metering import period_usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def partition_id_range(min_id: int, max_id: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits the inclusive ID range [min_id, max_id] into half-open chunks.
+
+    :param min_id: The smallest subscription ID.
+    :param max_id: The largest subscription ID.
+    :param chunk_size: The width of each ID range.
+    :return: A list of (low, high) tuples, where high is exclusive.
+    :raises ValueError: If chunk_size is not a positive integer.
+    """
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be a positive integer.")
+    return [(low, min(low + chunk_size, max_id + 1)) for low in range(min_id, max_id + 1, chunk_size)]
+
+
+def _init_worker(database_url: str) -> None:
+    """
+    Gives each worker process its own engine, plan catalog and invoice number
+    blocks; pooled connections and reserved blocks must not cross a fork.
+    """
+    database.reset_engine(database_url)
+    allocator.reset()
+    with database.session_scope() as session:
+        catalog.load(session)
+
+
+def _bill_chunk(low: int, high: int, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
+    """
+    Invoices the active subscriptions whose IDs fall in [low, high) in one transaction,
+    then collects the new invoices.
+
+    :return: A dictionary with the chunk bounds, the number of invoices written, paid
+        and left past due, the invoice-number reservations made and the elapsed time.
+    """
+    started = time.perf_counter()
+    round_trips_before = allocator.round_trips
+    already_invoiced = select(Invoice.id).where(
+        and_(Invoice.subscription_id == Subscription.id, Invoice.period_start == period_start)
+    ).exists()
+
+    with database.session_scope() as session:
+        subscriptions = session.execute(
+            select(Subscription.id, Subscription.user_id, Subscription.plan_type)
+            .where(Subscription.id >= low, Subscription.id < high)
+            .where(Subscription.is_active.is_(True))
+            .where(~already_invoiced)
+        ).all()
+
+        usage = period_usage(session, previous_period(period_start)[0], low, high) if subscriptions else {}
+        numbers = allocator.allocate(DEFAULT_ACCOUNT, len(subscriptions)) if subscriptions else []
+        rows = [
+            {
+                "subscription_id": subscription_id,
+                "account_id": DEFAULT_ACCOUNT,
+                "number": number,
+                "period_start": period_start,
+                "period_end": period_end,
+                "amount_due": calculate_amount_due(plan_type, usage.get(subscription_id)),
+                "status": "unpaid",
+            }
+            for (subscription_id, _, plan_type), number in zip(subscriptions, numbers)
+        ]
+        inserted = session.execute(
+            insert(Invoice).returning(Invoice.id, Invoice.subscription_id, Invoice.amount_due), rows
+        ).all() if rows else []
+        # Committed with the invoices, so a crash before collection still leaves them to dunning
+        dunning.open_first_attempts(session, [
+            {"invoice_id": invoice_id, "subscription_id": subscription_id}
+            for invoice_id, subscription_id, _ in inserted
+        ])
+
+    # Payments are only attempted for invoices that are committed
+    customers = {subscription_id: user_id for subscription_id, user_id, _ in subscriptions}
+    collected = {"paid": 0, "past_due": 0}
+    if inserted:
+        with database.session_scope() as session:
+            collected = dunning.collect_invoices(session, [
+                {
+                    "invoice_id": invoice_id,
+                    "subscription_id": subscription_id,
+                    "customer_id": customers[subscription_id],
+                    "amount_due": amount_due,
+                }
+                for invoice_id, subscription_id, amount_due in inserted
+            ])
+
+    return {
+        "low": low,
+        "high": high,
+        "invoiced": len(rows),
+        "paid": collected["paid"],
+        "past_due": collected["past_due"],
+        "elapsed_seconds": time.perf_counter() - started,
+        "numbering_round_trips": allocator.round_trips - round_trips_before,
+    }
+
+
+def run_billing_cycle(
+    period_start: Optional[datetime] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    database_url: Optional[str] = None,
+    on_progress: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Invoices every active subscription for one billing period.
+
+    Failed chunks are reported rather than raised so the remaining chunks still
+    complete; re-running the same period afterwards only bills what is missing.
+
+    :param period_start: Any datetime inside the period to bill; defaults to the current month.
+    :param workers: Number of worker processes; defaults to the number of CPUs.
+    :param chunk_size: Width of the subscription ID range billed per transaction.
+    :param database_url: Optional URL overriding DATABASE_URL.
+    :param on_progress: Optional callback invoked with (chunk_result, completed, total) after each chunk.
+    :return: A dictionary summarising the run, including per-chunk results and failures.
+    :raises ValueError: If chunk_size is not a positive integer.
+    """
+    database_url = database_url or get_database_url()
+    start, end = billing_period(period_start)
+    run_started = time.perf_counter()
+
+    # The calling process keeps its own engine; only the workers replace theirs
+    engine = create_engine(database_url)
+    try:
+        with Session(engine) as session:
+            min_id, max_id = session.execute(
+                select(func.min(Subscription.id), func.max(Subscription.id)).where(Subscription.is_active.is_(True))
+            ).one()
+    finally:
+        engine.dispose()
+
+    chunks = [] if min_id is None else partition_id_range(min_id, max_id, chunk_size)
+    results: List[Dict[str, Any]] = []
+    failures: List[Dict[str, Any]] = []
+    logger.info("Billing period %s: %d chunk(s) of %d subscription IDs", start.date(), len(chunks), chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(database_url,)) as pool:
+        futures = {pool.submit(_bill_chunk, low, high, start, end): (low, high) for low, high in chunks}
+        for future in as_completed(futures):
+            low, high = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                logger.error("Billing chunk [%s, %s) failed: %s", low, high, exc)
+                failures.append({"low": low, "high": high, "error": str(exc)})
+                continue
+
+            results.append(result)
+            completed = len(results) + len(failures)
+            logger.info(
+                "Billed chunk [%s, %s): %d invoice(s) in %.3fs (%d/%d)",
+                low, high, result["invoiced"], result["elapsed_seconds"], completed, len(chunks),
+            )
+            if on_progress is not None:
+                on_progress(result, completed, len(chunks))
+
+    return {
+        "period_start": start,
+        "period_end": end,
+        "chunks": sorted(results, key=lambda chunk: chunk["low"]),
+        "failed_chunks": failures,
+        "invoiced": sum(chunk["invoiced"] for chunk in results),
+        "paid": sum(chunk["paid"] for chunk in results),
+        "past_due": sum(chunk["past_due"] for chunk in results),
+        "numbering_round_trips": sum(chunk["numbering_round_trips"] for chunk in results),
+        "elapsed_seconds": time.perf_counter() - run_started,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Command-line entry point for the billing run.
+
+    :param argv: Optional argument list; defaults to sys.argv.
+    :return: The process exit code; non-zero if any chunk failed.
+    """
+    parser = argparse.ArgumentParser(description="Invoice every active subscription for a billing period.")
+    parser.add_argument("--period-start", type=datetime.fromisoformat, default=None,
+                        help="Any date inside the period to bill (YYYY-MM-DD); defaults to the current month.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Subscription IDs billed per transaction.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    report = run_billing_cycle(period_start=args.period_start, workers=args.workers, chunk_size=args.chunk_size)
+    logger.info(
+        "Billing run finished: %d invoice(s) (%d paid, %d past due), %d failed chunk(s) in %.2fs",
+        report["invoiced"], report["paid"], report["past_due"], len(report["failed_chunks"]), report["elapsed_seconds"],
+    )
+    return 1 if report["failed_chunks"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
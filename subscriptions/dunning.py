@@ -0,0 +1,327 @@
+"""
+Dunning: scheduled payment retries for unpaid invoices.
+
+New invoices get a row in dunning_attempts in the transaction that issues them
+(generate_invoice and the billing cycle), and their first payment is made by
+collect_invoices() right after; an issuer that dies in between leaves the row
+for the scheduler. Each invoice whose payment fails keeps its row with a due
+time for the next retry. On every tick the scheduler claims a batch of due
+rows, retries their payments with a bounded number of concurrent provider
+calls, and either marks the invoice paid, schedules the next attempt, or
+downgrades the subscription after the final failure.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from payments import payments_service
+from subscriptions import subscription_metrics
+from subscriptions.subscriptions_models import DunningAttempt, Invoice, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Delay before each retry, counted from the previous failure.
+DUNNING_SCHEDULE: Sequence[timedelta] = (timedelta(hours=1), timedelta(days=1), timedelta(days=3))
+DUNNING_TICK_SECONDS = float(os.getenv("DUNNING_TICK_SECONDS", "60"))
+DUNNING_BATCH_SIZE = int(os.getenv("DUNNING_BATCH_SIZE", "200"))
+DUNNING_MAX_CONCURRENCY = int(os.getenv("DUNNING_MAX_CONCURRENCY", "8"))
+# Plan that subscriptions fall back to after the final failure; unset deactivates them instead.
+DUNNING_DOWNGRADE_PLAN = os.getenv("DUNNING_DOWNGRADE_PLAN")
+# How long a claimed attempt stays invisible to other schedulers while its payment is retried.
+DUNNING_CLAIM_LEASE = timedelta(minutes=10)
+
+ChargeInvoice = Callable[[Dict[str, Any]], None]
+
+
+def charge_invoice(invoice: Dict[str, Any]) -> None:
+    """
+    Retries payment of an invoice through the payments service.
+
+    :param invoice: The invoice being retried, with 'customer_id' and 'amount_due'.
+    :raises payments_service.PaymentServiceError: If the payment does not succeed.
+    """
+    charge = payments_service.create_charge(str(invoice["customer_id"]), invoice["amount_due"], "dunning_retry")
+    if charge["status"] != "successful":
+        raise payments_service.PaymentServiceError(f"Charge {charge['charge_id']} was {charge['status']}")
+
+
+def schedule_retry(invoice_id: int, db_session: Session, failed_at: Optional[datetime] = None) -> DunningAttempt:
+    """
+    Starts dunning for an invoice whose first payment attempt failed.
+
+    :param invoice_id: The unpaid invoice.
+    :param db_session: Database session used for the write; committed on success.
+    :param failed_at: When the payment failed; defaults to now (UTC).
+    :return: The scheduled dunning attempt.
+    :raises ValueError: If the invoice does not exist.
+    """
+    invoice = db_session.get(Invoice, invoice_id)
+    if invoice is None:
+        raise ValueError(f"Invoice {invoice_id} not found.")
+
+    failed_at = failed_at or datetime.utcnow()
+    attempt = DunningAttempt(
+        invoice_id=invoice.id,
+        subscription_id=invoice.subscription_id,
+        attempts=0,
+        status="scheduled",
+        next_attempt_at=failed_at + DUNNING_SCHEDULE[0],
+    )
+    invoice.status = "past_due"
+    db_session.add(attempt)
+    db_session.commit()
+    logger.info("Scheduled dunning for invoice %s at %s", invoice_id, attempt.next_attempt_at)
+    return attempt
+
+
+def open_first_attempts(
+    db_session: Session, invoices: Sequence[Dict[str, Any]], now: Optional[datetime] = None
+) -> None:
+    """
+    Adds a dunning attempt for each newly issued invoice inside the caller's transaction.
+
+    The attempt is held for the issuer for DUNNING_CLAIM_LEASE, like a claimed
+    retry: collect_invoices() records the first payment on it, and if the issuer
+    never gets that far the scheduler makes the first attempt once the lease lapses.
+
+    :param db_session: Database session the invoices are being written in; not committed.
+    :param invoices: Invoices with 'invoice_id' and 'subscription_id'.
+    :param now: When the invoices are issued; defaults to now (UTC).
+    """
+    if not invoices:
+        return
+    now = now or datetime.utcnow()
+    db_session.execute(insert(DunningAttempt), [
+        {
+            "invoice_id": invoice["invoice_id"],
+            "subscription_id": invoice["subscription_id"],
+            "attempts": 0,
+            "status": "scheduled",
+            "next_attempt_at": now + DUNNING_CLAIM_LEASE,
+        }
+        for invoice in invoices
+    ])
+
+
+def collect_invoices(
+    db_session: Session,
+    invoices: Sequence[Dict[str, Any]],
+    now: Optional[datetime] = None,
+    max_concurrency: int = DUNNING_MAX_CONCURRENCY,
+    charge: ChargeInvoice = charge_invoice,
+) -> Dict[str, int]:
+    """
+    Makes the first payment attempt for newly issued invoices and starts dunning for those that fail.
+
+    The invoices must have their attempts opened by open_first_attempts(). Paid
+    invoices are marked 'paid'; the others become 'past_due' with their first
+    retry scheduled, all in one transaction.
+
+    :param db_session: Database session used for the results; committed on success.
+    :param invoices: Invoices with 'invoice_id', 'subscription_id', 'customer_id' and 'amount_due'.
+    :param now: When the payments are attempted; defaults to now (UTC).
+    :param max_concurrency: Maximum number of concurrent payment calls.
+    :param charge: Callable that pays one invoice and raises on failure.
+    :return: Counts of 'paid' and 'past_due' invoices.
+    """
+    summary = {"paid": 0, "past_due": 0}
+    if not invoices:
+        return summary
+    now = now or datetime.utcnow()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(invoices)))) as pool:
+        errors = list(pool.map(lambda invoice: _retry_payment(charge, invoice), invoices))
+
+    attempts = {
+        attempt.invoice_id: (attempt, invoice)
+        for attempt, invoice in db_session.execute(
+            select(DunningAttempt, Invoice)
+            .join(Invoice, Invoice.id == DunningAttempt.invoice_id)
+            .where(DunningAttempt.invoice_id.in_([invoice["invoice_id"] for invoice in invoices]))
+        ).all()
+    }
+    for invoice_data, error in zip(invoices, errors):
+        attempt, invoice = attempts[invoice_data["invoice_id"]]
+        outcome = _record_payment(db_session, attempt, invoice, error, now)
+        summary["paid" if outcome == "succeeded" else "past_due"] += 1
+    db_session.commit()
+
+    if summary["past_due"]:
+        logger.info(
+            "Collected %d invoice(s); %d failed and were scheduled for dunning", summary["paid"], summary["past_due"]
+        )
+    return summary
+
+
+def _claim_due_attempts(db_session: Session, now: datetime, batch_size: int) -> List[Dict[str, Any]]:
+    rows = db_session.execute(
+        select(DunningAttempt, Invoice, Subscription)
+        .join(Invoice, Invoice.id == DunningAttempt.invoice_id)
+        .join(Subscription, Subscription.id == DunningAttempt.subscription_id)
+        .where(DunningAttempt.status == "scheduled")
+        .where(DunningAttempt.next_attempt_at <= now)
+        .order_by(DunningAttempt.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=DunningAttempt)
+    ).all()
+
+    claimed = []
+    for attempt, invoice, subscription in rows:
+        attempt.next_attempt_at = now + DUNNING_CLAIM_LEASE
+        claimed.append({
+            "attempt_id": attempt.id,
+            "invoice_id": invoice.id,
+            "subscription_id": subscription.id,
+            "customer_id": subscription.user_id,
+            "amount_due": invoice.amount_due,
+        })
+    db_session.commit()
+    return claimed
+
+
+def _retry_payment(charge: ChargeInvoice, invoice: Dict[str, Any]) -> Optional[str]:
+    try:
+        charge(invoice)
+        return None
+    except Exception as exc:
+        return str(exc) or exc.__class__.__name__
+
+
+def _downgrade(db_session: Session, subscription: Subscription, now: datetime) -> None:
+    if not subscription.is_active:
+        return
+    if DUNNING_DOWNGRADE_PLAN:
+        if subscription.plan_type != DUNNING_DOWNGRADE_PLAN:
+            subscription_metrics.record_plan_changes(db_session, {subscription.plan_type: 1}, DUNNING_DOWNGRADE_PLAN)
+            subscription.plan_type = DUNNING_DOWNGRADE_PLAN
+    else:
+        subscription.is_active = False
+        subscription.canceled_at = now
+        subscription_metrics.record_subscription_canceled(db_session, subscription.plan_type, now)
+
+
+def _record_payment(
+    db_session: Session, attempt: DunningAttempt, invoice: Invoice, error: Optional[str], now: datetime
+) -> str:
+    """
+    Writes the outcome of one payment to its attempt and invoice.
+
+    An invoice that is still 'unpaid' has never been charged, so its failure starts
+    the retry schedule instead of using up one of its retries.
+
+    :return: 'succeeded', 'past_due', 'rescheduled' or 'exhausted'.
+    """
+    if error is None:
+        if invoice.status != "unpaid":
+            attempt.attempts += 1
+        attempt.status = "succeeded"
+        attempt.last_error = None
+        invoice.status = "paid"
+        return "succeeded"
+    attempt.last_error = error
+    if invoice.status == "unpaid":
+        invoice.status = "past_due"
+        attempt.next_attempt_at = now + DUNNING_SCHEDULE[0]
+        return "past_due"
+    attempt.attempts += 1
+    if attempt.attempts >= len(DUNNING_SCHEDULE):
+        attempt.status = "exhausted"
+        invoice.status = "uncollectible"
+        _downgrade(db_session, db_session.get(Subscription, attempt.subscription_id), now)
+        return "exhausted"
+    attempt.next_attempt_at = now + DUNNING_SCHEDULE[attempt.attempts]
+    return "rescheduled"
+
+
+def run_dunning_tick(
+    db_session: Session,
+    now: Optional[datetime] = None,
+    batch_size: int = DUNNING_BATCH_SIZE,
+    max_concurrency: int = DUNNING_MAX_CONCURRENCY,
+    charge: ChargeInvoice = charge_invoice,
+) -> Dict[str, int]:
+    """
+    Retries one batch of due invoice payments.
+
+    Due attempts are claimed with a short lease, their payments are retried with
+    at most max_concurrency calls in flight, and all outcomes are written back in
+    a single transaction.
+
+    :param db_session: Database session used for the claim and the results.
+    :param now: The current time; defaults to now (UTC).
+    :param batch_size: Maximum number of attempts retried in this tick.
+    :param max_concurrency: Maximum number of concurrent payment calls.
+    :param charge: Callable that retries one invoice payment and raises on failure.
+    :return: Counts of 'retried', 'succeeded', 'rescheduled' and 'exhausted' attempts.
+    """
+    now = now or datetime.utcnow()
+    claimed = _claim_due_attempts(db_session, now, batch_size)
+    summary = {"retried": len(claimed), "succeeded": 0, "rescheduled": 0, "exhausted": 0}
+    if not claimed:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(claimed)))) as pool:
+        errors = list(pool.map(lambda invoice: _retry_payment(charge, invoice), claimed))
+
+    for invoice_data, error in zip(claimed, errors):
+        attempt = db_session.get(DunningAttempt, invoice_data["attempt_id"])
+        invoice = db_session.get(Invoice, invoice_data["invoice_id"])
+        outcome = _record_payment(db_session, attempt, invoice, error, now)
+        # A first payment that fails simply enters the retry schedule
+        summary["rescheduled" if outcome == "past_due" else outcome] += 1
+    db_session.commit()
+
+    logger.info(
+        "Dunning tick: %d retried, %d succeeded, %d rescheduled, %d exhausted",
+        summary["retried"], summary["succeeded"], summary["rescheduled"], summary["exhausted"],
+    )
+    return summary
+
+
+_tick_task: Optional["asyncio.Task[None]"] = None
+
+
+def _run_tick() -> Dict[str, int]:
+    with database.session_scope() as session:
+        return run_dunning_tick(session)
+
+
+async def _tick_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_run_tick)
+        except Exception as exc:
+            logger.error("Dunning tick failed: %s", exc)
+
+
+async def start_dunning() -> None:
+    """
+    Starts the periodic dunning tick. Intended as an application startup handler.
+    """
+    global _tick_task
+    if _tick_task is None:
+        _tick_task = asyncio.create_task(_tick_periodically(DUNNING_TICK_SECONDS))
+
+
+async def stop_dunning() -> None:
+    """
+    Stops the periodic dunning tick. Intended as an application shutdown handler.
+    """
+    global _tick_task
+    if _tick_task is not None:
+        _tick_task.cancel()
+        try:
+            await _tick_task
+        except asyncio.CancelledError:
+            pass
+        _tick_task = None
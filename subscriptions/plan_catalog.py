@@ -0,0 +1,209 @@
+"""
+In-process cache of the plan catalog.
+
+Every worker keeps the whole catalog in a dict, so plan lookups on the
+subscription-create and invoicing paths never touch the database. Plan changes
+bump a single version row; each worker polls that row on an interval and
+reloads when it moves, which keeps multiple uvicorn workers consistent without
+a message bus.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from subscriptions.subscriptions_models import Plan, PlanCatalogVersion
+
+logger = logging.getLogger(__name__)
+
+PLAN_CATALOG_REFRESH_SECONDS = float(os.getenv("PLAN_CATALOG_REFRESH_SECONDS", "5"))
+
+_VERSION_ROW_ID = 1
+
+
+class PlanCatalog:
+    """
+    Immutable-snapshot cache of all plans keyed by plan ID.
+
+    Readers never lock: a reload builds a new dict and swaps the reference.
+    """
+
+    def __init__(self) -> None:
+        self._plans: Dict[str, Dict[str, Any]] = {}
+        self._load_lock = threading.Lock()
+        self.version: Optional[int] = None
+
+    def get(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a plan by ID, or None if the catalog does not contain it.
+
+        :param plan_id: The plan identifier.
+        :return: The cached plan as a dictionary.
+        """
+        return self._plans.get(plan_id)
+
+    def require(self, plan_id: str, active_only: bool = False) -> Dict[str, Any]:
+        """
+        Returns a plan by ID, raising if it is unknown.
+
+        :param plan_id: The plan identifier.
+        :param active_only: Also reject plans that are no longer offered.
+        :return: The cached plan as a dictionary.
+        :raises ValueError: If the plan is unknown or, with active_only, inactive.
+        """
+        plan = self._plans.get(plan_id)
+        if plan is None or (active_only and not plan["is_active"]):
+            raise ValueError(f"Unknown plan: {plan_id}")
+        return plan
+
+    def all(self) -> List[Dict[str, Any]]:
+        """
+        Returns every cached plan.
+        """
+        return list(self._plans.values())
+
+    def load(self, session: Session) -> None:
+        """
+        Replaces the cache with the current plans and version stamp.
+
+        :param session: Database session to read from.
+        """
+        with self._load_lock:
+            version = read_catalog_version(session)
+            plans = {
+                plan.id: {
+                    "id": plan.id,
+                    "name": plan.name,
+                    "price": plan.price,
+                    "interval": plan.interval,
+                    "currency": plan.currency,
+                    "unit_price": plan.unit_price,
+                    "metric_prices": dict(plan.metric_prices or {}),
+                    "is_active": bool(plan.is_active),
+                }
+                for plan in session.execute(select(Plan)).scalars()
+            }
+            self._plans = plans
+            self.version = version
+        logger.info("Loaded plan catalog version %s with %d plan(s)", version, len(plans))
+
+    def refresh_if_changed(self, session: Session) -> bool:
+        """
+        Reloads the cache if the stored version stamp differs from the cached one.
+
+        :param session: Database session to read from.
+        :return: True if the catalog was reloaded.
+        """
+        if read_catalog_version(session) == self.version:
+            return False
+        self.load(session)
+        return True
+
+    def clear(self) -> None:
+        """
+        Empties the cache so the next refresh reloads it.
+        """
+        with self._load_lock:
+            self._plans = {}
+            self.version = None
+
+
+catalog = PlanCatalog()
+
+_refresh_task: Optional["asyncio.Task[None]"] = None
+
+
+def read_catalog_version(session: Session) -> int:
+    """
+    Returns the current catalog version stamp, or 0 if no plan has been written yet.
+    """
+    version = session.execute(
+        select(PlanCatalogVersion.version).where(PlanCatalogVersion.id == _VERSION_ROW_ID)
+    ).scalar_one_or_none()
+    return version or 0
+
+
+def bump_catalog_version(session: Session) -> None:
+    """
+    Increments the catalog version stamp inside the caller's transaction.
+    """
+    result = session.execute(
+        update(PlanCatalogVersion)
+        .where(PlanCatalogVersion.id == _VERSION_ROW_ID)
+        .values(version=PlanCatalogVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(PlanCatalogVersion(id=_VERSION_ROW_ID, version=1))
+
+
+def upsert_plan(plan_data: Dict[str, Any], db_session: Session) -> Dict[str, Any]:
+    """
+    Creates or replaces a plan and invalidates every worker's catalog.
+
+    Invoices, proration and MRR all assume one calendar month per billing
+    cycle, so only monthly plans are accepted.
+
+    :param plan_data: Plan fields, including 'id'.
+    :param db_session: Database session used for the write.
+    :return: The plan as now cached.
+    :raises ValueError: If the plan's interval is not 'month'.
+    """
+    if plan_data.get("interval", "month") != "month":
+        raise ValueError(f"Plan {plan_data['id']} has interval {plan_data['interval']!r}; only 'month' is billed.")
+    db_session.merge(Plan(**plan_data))
+    bump_catalog_version(db_session)
+    db_session.commit()
+    catalog.load(db_session)
+    logger.info("Upserted plan %s", plan_data["id"])
+    return catalog.require(plan_data["id"])
+
+
+def _refresh_catalog() -> None:
+    with database.session_scope() as session:
+        catalog.refresh_if_changed(session)
+
+
+async def _refresh_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_refresh_catalog)
+        except Exception as exc:
+            logger.error("Failed to refresh plan catalog: %s", exc)
+
+
+async def start_plan_catalog() -> None:
+    """
+    Loads the catalog and starts the background version poll.
+
+    Intended as an application startup handler. A failed initial load is logged
+    and retried by the poll rather than preventing start-up.
+    """
+    global _refresh_task
+    try:
+        await run_in_threadpool(_refresh_catalog)
+    except Exception as exc:
+        logger.error("Failed to load plan catalog at startup: %s", exc)
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_periodically(PLAN_CATALOG_REFRESH_SECONDS))
+
+
+async def stop_plan_catalog() -> None:
+    """
+    Stops the background version poll. Intended as an application shutdown handler.
+    """
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
@@ -0,0 +1,113 @@
+"""
+Vectorized proration for cancellations and plan changes.
+
+Every input is an array with one entry per subscription, so a migration of tens
+of thousands of subscriptions is a handful of NumPy operations instead of a
+Python loop.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+
+def billing_period(period_start: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    Returns the monthly billing period that contains the given date.
+
+    :param period_start: Any datetime inside the period; defaults to now (UTC).
+    :return: A (start, end) tuple of the first day of the month and the first day of the next month.
+    """
+    reference = period_start or datetime.utcnow()
+    start = datetime(reference.year, reference.month, 1)
+    if start.month == 12:
+        end = datetime(start.year + 1, 1, 1)
+    else:
+        end = datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+def previous_period(period_start: datetime) -> Tuple[datetime, datetime]:
+    """
+    Returns the monthly billing period that ends where the given one starts.
+
+    :param period_start: Start of a billing period.
+    :return: A (start, end) tuple of the period before it.
+    """
+    return billing_period(period_start - timedelta(days=1))
+
+
+def prorate_batch(
+    period_start: ArrayLike,
+    period_end: ArrayLike,
+    price: ArrayLike,
+    changed_at: ArrayLike,
+    new_price: Optional[ArrayLike] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Calculates the prorated credit and charge for a batch of subscriptions.
+
+    The unused fraction of the current period is credited at the old price and,
+    for a plan change, charged at the new price. Changes before the period
+    starts credit the whole period; changes after it ends credit nothing.
+
+    :param period_start: Start of each subscription's current period (datetime64 or datetimes).
+    :param period_end: End of each subscription's current period.
+    :param price: Price of each subscription's current plan for a full period.
+    :param changed_at: When each cancellation or plan change takes effect.
+    :param new_price: Full-period price of each new plan; omit for cancellations.
+    :return: A dictionary of arrays: 'unused_fraction', 'credit', 'charge' and 'net' (charge minus credit).
+    :raises ValueError: If any period ends before it starts.
+    """
+    start = np.asarray(period_start, dtype="datetime64[s]").astype(np.int64)
+    end = np.asarray(period_end, dtype="datetime64[s]").astype(np.int64)
+    changed = np.asarray(changed_at, dtype="datetime64[s]").astype(np.int64)
+    old_price = np.asarray(price, dtype=np.float64)
+
+    length = end - start
+    if np.any(length <= 0):
+        raise ValueError("Billing periods must end after they start.")
+
+    unused_fraction = np.clip((end - changed) / length, 0.0, 1.0)
+    credit = np.round(old_price * unused_fraction, 2)
+    if new_price is None:
+        charge = np.zeros_like(credit)
+    else:
+        charge = np.round(np.asarray(new_price, dtype=np.float64) * unused_fraction, 2)
+
+    return {
+        "unused_fraction": unused_fraction,
+        "credit": credit,
+        "charge": charge,
+        "net": np.round(charge - credit, 2),
+    }
+
+
+def prorate(
+    period_start: datetime,
+    period_end: datetime,
+    price: float,
+    changed_at: datetime,
+    new_price: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Calculates proration for a single subscription.
+
+    :param period_start: Start of the current billing period.
+    :param period_end: End of the current billing period.
+    :param price: Full-period price of the current plan.
+    :param changed_at: When the cancellation or plan change takes effect.
+    :param new_price: Full-period price of the new plan; omit for cancellations.
+    :return: A dictionary with 'unused_fraction', 'credit', 'charge' and 'net'.
+    :raises ValueError: If the period ends before it starts.
+    """
+    result = prorate_batch(
+        [period_start],
+        [period_end],
+        [price],
+        [changed_at],
+        None if new_price is None else [new_price],
+    )
+    return {key: float(values[0]) for key, values in result.items()}
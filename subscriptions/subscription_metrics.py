@@ -0,0 +1,216 @@
+"""
+Incrementally maintained subscription metrics.
+
+Per-plan active counts and per-day started/canceled counts are adjusted in the
+same transaction as every subscription change, so reading metrics touches one
+row per plan instead of every subscription. MRR is derived at read time from
+the per-plan counts and the cached plan prices. If the aggregates ever drift,
+rebuild them with:
+
+    python -m subscriptions.subscription_metrics rebuild
+"""
+
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+import database
+from dashboard import dashboard_rollups
+from subscriptions.plan_catalog import catalog
+from subscriptions.subscriptions_models import DailySubscriptionMetrics, PlanSubscriptionMetrics, Subscription
+
+logger = logging.getLogger(__name__)
+
+def _apply(
+    session: Session,
+    active_deltas: Dict[str, int],
+    daily_deltas: Dict[Tuple[date, str], Tuple[int, int]],
+) -> None:
+    database.upsert_add(
+        session,
+        PlanSubscriptionMetrics,
+        [{"plan_type": plan, "active_count": delta} for plan, delta in active_deltas.items() if delta],
+        ["plan_type"],
+        ["active_count"],
+    )
+    database.upsert_add(
+        session,
+        DailySubscriptionMetrics,
+        [
+            {"day": day, "plan_type": plan, "started_count": started, "canceled_count": canceled}
+            for (day, plan), (started, canceled) in daily_deltas.items()
+        ],
+        ["day", "plan_type"],
+        ["started_count", "canceled_count"],
+    )
+
+
+def record_subscription_started(session: Session, plan_type: str, at: Optional[datetime] = None) -> None:
+    """
+    Counts a new subscription. Runs inside the caller's transaction.
+
+    :param session: Database session of the transaction creating the subscription.
+    :param plan_type: The plan subscribed to.
+    :param at: When the subscription started; defaults to now (UTC).
+    """
+    at = at or datetime.utcnow()
+    _apply(session, {plan_type: 1}, {(at.date(), plan_type): (1, 0)})
+    dashboard_rollups.record_in_session(session, "subscriptions", "started", at=at)
+
+
+def record_subscription_canceled(session: Session, plan_type: str, at: Optional[datetime] = None) -> None:
+    """
+    Counts a cancellation. Runs inside the caller's transaction.
+
+    :param session: Database session of the transaction canceling the subscription.
+    :param plan_type: The plan the subscription was on.
+    :param at: When the subscription was canceled; defaults to now (UTC).
+    """
+    at = at or datetime.utcnow()
+    _apply(session, {plan_type: -1}, {(at.date(), plan_type): (0, 1)})
+    dashboard_rollups.record_in_session(session, "subscriptions", "canceled", at=at)
+
+
+def record_plan_changes(session: Session, from_plans: Dict[str, int], to_plan: str) -> None:
+    """
+    Moves active subscriptions between plans. Runs inside the caller's transaction.
+
+    :param session: Database session of the transaction changing the plans.
+    :param from_plans: Number of subscriptions leaving each plan.
+    :param to_plan: The plan they all move to.
+    """
+    deltas: Dict[str, int] = defaultdict(int)
+    for plan, count in from_plans.items():
+        deltas[plan] -= count
+        deltas[to_plan] += count
+    _apply(session, deltas, {})
+
+
+def get_subscription_metrics(session: Session) -> Dict[str, Any]:
+    """
+    Returns active counts and MRR per plan and in total, reading one row per plan.
+
+    :param session: Database session to read from.
+    :return: A dictionary with 'active_subscriptions', 'mrr' (per currency) and 'plans'.
+    """
+    plans: List[Dict[str, Any]] = []
+    mrr_by_currency: Dict[str, float] = defaultdict(float)
+    for plan_type, active_count in session.execute(
+        select(PlanSubscriptionMetrics.plan_type, PlanSubscriptionMetrics.active_count)
+        .order_by(PlanSubscriptionMetrics.plan_type)
+    ):
+        plan = catalog.get(plan_type)
+        mrr = None
+        if plan is not None:
+            # Plans are billed monthly (see plan_catalog.upsert_plan), so the price is the MRR per subscription
+            mrr = round(active_count * plan["price"], 2)
+            mrr_by_currency[plan["currency"]] += mrr
+        plans.append({"plan_id": plan_type, "active_count": active_count, "mrr": mrr})
+
+    return {
+        "active_subscriptions": sum(plan["active_count"] for plan in plans),
+        "mrr": {currency: round(amount, 2) for currency, amount in mrr_by_currency.items()},
+        "plans": plans,
+    }
+
+
+def get_daily_subscription_metrics(session: Session, since: date, until: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Returns subscriptions started and canceled per day across all plans.
+
+    :param session: Database session to read from.
+    :param since: First day to include.
+    :param until: Last day to include; defaults to today (UTC).
+    :return: One dictionary per day with 'day', 'started' and 'canceled'.
+    """
+    until = until or datetime.utcnow().date()
+    rows = session.execute(
+        select(
+            DailySubscriptionMetrics.day,
+            func.sum(DailySubscriptionMetrics.started_count),
+            func.sum(DailySubscriptionMetrics.canceled_count),
+        )
+        .where(DailySubscriptionMetrics.day >= since, DailySubscriptionMetrics.day <= until)
+        .group_by(DailySubscriptionMetrics.day)
+        .order_by(DailySubscriptionMetrics.day)
+    ).all()
+    return [{"day": day, "started": int(started), "canceled": int(canceled)} for day, started, canceled in rows]
+
+
+def _as_date(value: Any) -> date:
+    # SQLite returns DATE() results as ISO strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_subscription_metrics(session: Session) -> Dict[str, int]:
+    """
+    Recomputes every aggregate row from the subscriptions table.
+
+    This is the repair path and scans all subscriptions; it commits on success.
+
+    :param session: Database session used for the rebuild.
+    :return: The number of plan and day rows written.
+    """
+    session.execute(delete(PlanSubscriptionMetrics))
+    session.execute(delete(DailySubscriptionMetrics))
+
+    plan_rows = [
+        {"plan_type": plan_type, "active_count": count}
+        for plan_type, count in session.execute(
+            select(Subscription.plan_type, func.count())
+            .where(Subscription.is_active.is_(True))
+            .group_by(Subscription.plan_type)
+        )
+    ]
+
+    daily: Dict[Tuple[date, str], List[int]] = defaultdict(lambda: [0, 0])
+    for day, plan_type, count in session.execute(
+        select(func.date(Subscription.created_at), Subscription.plan_type, func.count())
+        .group_by(func.date(Subscription.created_at), Subscription.plan_type)
+    ):
+        daily[(_as_date(day), plan_type)][0] += count
+    for day, plan_type, count in session.execute(
+        select(func.date(Subscription.canceled_at), Subscription.plan_type, func.count())
+        .where(Subscription.canceled_at.is_not(None))
+        .group_by(func.date(Subscription.canceled_at), Subscription.plan_type)
+    ):
+        daily[(_as_date(day), plan_type)][1] += count
+    daily_rows = [
+        {"day": day, "plan_type": plan_type, "started_count": started, "canceled_count": canceled}
+        for (day, plan_type), (started, canceled) in daily.items()
+    ]
+
+    if plan_rows:
+        session.execute(insert(PlanSubscriptionMetrics), plan_rows)
+    if daily_rows:
+        session.execute(insert(DailySubscriptionMetrics), daily_rows)
+    session.commit()
+    logger.info("Rebuilt subscription metrics: %d plan row(s), %d day row(s)", len(plan_rows), len(daily_rows))
+    return {"plans": len(plan_rows), "days": len(daily_rows)}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Command-line entry point for metric maintenance.
+
+    :param argv: Optional argument list; defaults to sys.argv.
+    :return: The process exit code.
+    """
+    parser = argparse.ArgumentParser(description="Maintain the subscription metric aggregates.")
+    parser.add_argument("command", choices=["rebuild"], help="'rebuild' recomputes every aggregate row.")
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    with database.session_scope() as session:
+        rebuild_subscription_metrics(session)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
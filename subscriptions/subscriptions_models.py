@@ -1,7 +1,7 @@
-from typing import Optional
+from typing import Dict, Literal, Optional
 from datetime import datetime
-from pydantic import BaseModel
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from pydantic import BaseModel, Field, NonNegativeFloat
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, Index, JSON, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 # TODO: Replace this with your project's base class import if needed
@@ -14,6 +14,11 @@ class Subscription(Base):
     Represents a subscription record in the database.
     """
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Serve the filtered, id-ordered listings in list_subscriptions without a table scan
+        Index("ix_subscriptions_user_id_is_active_id", "user_id", "is_active", "id"),
+        Index("ix_subscriptions_plan_type_is_active_id", "plan_type", "is_active", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -21,10 +26,170 @@ class Subscription(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    canceled_at = Column(DateTime, nullable=True)
 
     # TODO: Consider adding billing_cycle, next_billing_date, or other fields
 
 
+class Invoice(Base):
+    """
+    SQLAlchemy model for invoice data.
+    Each subscription has at most one invoice per billing period, which keeps
+    billing runs idempotent when they are resumed after a failure.
+    """
+    __tablename__ = "invoices"
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "period_start", name="uq_invoices_subscription_period"),
+        UniqueConstraint("account_id", "number", name="uq_invoices_account_number"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=False)
+    account_id = Column(String, nullable=False, default="default")
+    number = Column(Integer, nullable=True)  # Allocated in blocks; see invoice_numbering.py
+    period_start = Column(DateTime, nullable=False)
+    period_end = Column(DateTime, nullable=False)
+    amount_due = Column(Float, nullable=False)
+    status = Column(String, nullable=False, default="unpaid")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class InvoiceNumberSequence(Base):
+    """
+    SQLAlchemy model holding the next unreserved invoice number per account.
+    Workers reserve whole blocks from this row, so it is touched once per block, not once per invoice.
+    """
+    __tablename__ = "invoice_number_sequences"
+
+    account_id = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False, default=1)
+
+
+class PlanSubscriptionMetrics(Base):
+    """
+    SQLAlchemy model holding the running count of active subscriptions per plan.
+    Maintained in the same transaction as every subscription change; see subscription_metrics.py.
+    """
+    __tablename__ = "plan_subscription_metrics"
+
+    plan_type = Column(String, primary_key=True)
+    active_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DailySubscriptionMetrics(Base):
+    """
+    SQLAlchemy model holding subscriptions started and canceled per plan per day.
+    """
+    __tablename__ = "daily_subscription_metrics"
+
+    day = Column(Date, primary_key=True)
+    plan_type = Column(String, primary_key=True)
+    started_count = Column(Integer, nullable=False, default=0)
+    canceled_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DunningAttempt(Base):
+    """
+    SQLAlchemy model tracking payment retries for an unpaid invoice.
+    The (status, next_attempt_at) index is the due-time index scanned on every scheduler tick.
+    """
+    __tablename__ = "dunning_attempts"
+    __table_args__ = (
+        Index("ix_dunning_attempts_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, unique=True)
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="scheduled")
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UsageAggregate(Base):
+    """
+    SQLAlchemy model for metered usage, pre-summed per subscription, billing period and metric.
+    Rows are written by the usage buffer in usage_metering.py rather than once per event.
+    """
+    __tablename__ = "usage_aggregates"
+    __table_args__ = (
+        UniqueConstraint("subscription_id", "period_start", "metric", name="uq_usage_subscription_period_metric"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # No foreign key: flushes must not fail as a whole because one event named an unknown subscription
+    subscription_id = Column(Integer, nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    metric = Column(String, nullable=False, default="units")
+    quantity = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Plan(Base):
+    """
+    SQLAlchemy model for a subscription plan.
+    Plans are read through the in-process catalog in plan_catalog.py rather than queried directly.
+    """
+    __tablename__ = "plans"
+
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    price = Column(Float, nullable=False)
+    interval = Column(String, nullable=False, default="month")  # Only 'month' is billed; see upsert_plan
+    currency = Column(String(3), nullable=False, default="usd")
+    unit_price = Column(Float, nullable=True)  # Price per metered unit of 'units'; None for flat-rate plans
+    metric_prices = Column(JSON, nullable=True)  # Price per unit of any other metric, keyed by metric name
+    is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PlanCatalogVersion(Base):
+    """
+    SQLAlchemy model holding the single version stamp of the plan catalog.
+    Bumped on every plan change so each worker knows when to reload its cache.
+    """
+    __tablename__ = "plan_catalog_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PlanBase(BaseModel):
+    """
+    Base Pydantic model for plan data.
+    """
+    name: str
+    price: float = Field(..., ge=0)
+    # Every plan is invoiced once per calendar month; other intervals are not billed yet
+    interval: Literal["month"] = "month"
+    currency: str = Field("usd", min_length=3, max_length=3)
+    unit_price: Optional[float] = Field(None, ge=0)
+    metric_prices: Optional[Dict[str, NonNegativeFloat]] = None
+    is_active: Optional[bool] = True
+
+
+class PlanCreate(PlanBase):
+    """
+    Pydantic model for creating or replacing a plan.
+    """
+    id: str
+
+
+class PlanRead(PlanCreate):
+    """
+    Pydantic model for reading a plan.
+    """
+
+    class Config:
+        orm_mode = True
+
+
 class SubscriptionBase(BaseModel):
     """
     Base Pydantic model for subscription data.
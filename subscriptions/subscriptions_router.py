@@ -1,6 +1,19 @@
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, status
-from pydantic import BaseModel
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from database import get_db
+from subscriptions import (
+    invoice_numbering,
+    plan_catalog,
+    subscription_metrics,
+    subscriptions_service,
+    usage_metering,
+)
+from subscriptions.subscriptions_models import PlanCreate, PlanRead
+from utils.auth import require_admin
 
 router = APIRouter(
     prefix="/subscriptions",
@@ -8,6 +21,13 @@ router = APIRouter(
 )
 
 
+def _as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps are naive UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 class SubscriptionCreateRequest(BaseModel):
     """
     Data required to create a new subscription.
@@ -26,6 +46,74 @@ class SubscriptionResponse(BaseModel):
     status: str
 
 
+class SubscriptionListResponse(BaseModel):
+    """
+    One page of subscriptions. Pass next_cursor as starting_after to fetch the next page.
+    """
+    data: List[SubscriptionResponse]
+    has_more: bool
+    next_cursor: Optional[int] = None
+
+
+class PlanMigrationRequest(BaseModel):
+    """
+    Data required to move a batch of subscriptions to a new plan.
+    """
+    subscription_ids: List[int] = Field(..., min_length=1)
+    new_plan_id: str
+    effective_at: Optional[datetime] = None
+
+
+class ProratedSubscription(BaseModel):
+    """
+    Prorated amounts for one migrated subscription.
+    """
+    subscription_id: int
+    credit: float
+    charge: float
+    net: float
+
+
+class PlanMigrationResponse(BaseModel):
+    """
+    Response schema for a bulk plan migration.
+    """
+    migrated: int
+    new_plan_id: str
+    net_total: float
+    items: List[ProratedSubscription]
+
+
+class UsageRecord(BaseModel):
+    """
+    A single metered usage event for a subscription.
+    """
+    quantity: float = Field(..., gt=0)
+    metric: str = "units"
+    timestamp: Optional[datetime] = None
+
+
+class BatchUsageRecord(UsageRecord):
+    """
+    A metered usage event that names its subscription, for batch ingestion.
+    """
+    subscription_id: int
+
+
+class BatchUsageRequest(BaseModel):
+    """
+    A batch of metered usage events across any number of subscriptions.
+    """
+    events: List[BatchUsageRecord] = Field(..., min_length=1)
+
+
+class UsageAcceptedResponse(BaseModel):
+    """
+    Response schema for accepted usage events.
+    """
+    accepted: int
+
+
 @router.post("/create", response_model=SubscriptionResponse)
 def create_subscription_endpoint(request_data: SubscriptionCreateRequest) -> SubscriptionResponse:
     """
@@ -37,6 +125,7 @@ def create_subscription_endpoint(request_data: SubscriptionCreateRequest) -> Sub
     # TODO: Implement the logic to create a subscription in the database or API
     # Example of error handling:
     try:
+        plan_catalog.catalog.require(request_data.plan_id, active_only=True)
         # Example placeholder subscription ID for demonstration
         created_subscription_id = "sub_12345"
         return SubscriptionResponse(
@@ -52,6 +141,109 @@ def create_subscription_endpoint(request_data: SubscriptionCreateRequest) -> Sub
         )
 
 
+@router.post("/usage/batch", response_model=UsageAcceptedResponse, status_code=status.HTTP_202_ACCEPTED)
+def record_usage_batch_endpoint(request_data: BatchUsageRequest) -> UsageAcceptedResponse:
+    """
+    Buffers a batch of usage events; they are aggregated in memory and flushed periodically.
+
+    :param request_data: The usage events
+    :return: The number of events accepted
+    """
+    try:
+        accepted = usage_metering.usage_buffer.record_many(
+            (event.subscription_id, event.quantity, event.metric, _as_naive_utc(event.timestamp))
+            for event in request_data.events
+        )
+    except usage_metering.UsageBufferFullError as exc:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc))
+    return UsageAcceptedResponse(accepted=accepted)
+
+
+@router.post("/{subscription_id}/usage", response_model=UsageAcceptedResponse, status_code=status.HTTP_202_ACCEPTED)
+def record_usage_endpoint(subscription_id: int, request_data: UsageRecord) -> UsageAcceptedResponse:
+    """
+    Buffers one usage event for a subscription.
+
+    :param subscription_id: Unique identifier for the subscription
+    :param request_data: The usage event
+    :return: The number of events accepted
+    """
+    try:
+        usage_metering.usage_buffer.record(
+            subscription_id, request_data.quantity, request_data.metric, _as_naive_utc(request_data.timestamp)
+        )
+    except usage_metering.UsageBufferFullError as exc:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc))
+    return UsageAcceptedResponse(accepted=1)
+
+
+@router.get("/metrics", response_model=Dict[str, Any])
+def get_subscription_metrics_endpoint(db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """
+    Returns active subscription counts and MRR per plan from the maintained aggregates.
+
+    :param db: Database session
+    :return: Subscription metrics
+    """
+    return subscription_metrics.get_subscription_metrics(db)
+
+
+@router.get("/metrics/daily", response_model=List[Dict[str, Any]])
+def get_daily_subscription_metrics_endpoint(
+    since: date,
+    until: Optional[date] = None,
+    db: Session = Depends(get_db)
+) -> List[Dict[str, Any]]:
+    """
+    Returns subscriptions started and canceled per day.
+
+    :param since: First day to include
+    :param until: Last day to include; defaults to today
+    :param db: Database session
+    :return: One entry per day
+    """
+    return subscription_metrics.get_daily_subscription_metrics(db, since, until)
+
+
+@router.get("/invoice-numbers/metrics", response_model=Dict[str, int])
+def get_invoice_numbering_metrics_endpoint() -> Dict[str, int]:
+    """
+    Returns this worker's invoice number allocator counters, including database round trips.
+
+    :return: Allocator counters
+    """
+    return invoice_numbering.allocator.stats()
+
+
+@router.get("/plans", response_model=List[PlanRead])
+def list_plans_endpoint() -> List[PlanRead]:
+    """
+    Lists all plans from the in-process catalog.
+
+    :return: List of plans
+    """
+    return [PlanRead(**plan) for plan in plan_catalog.catalog.all()]
+
+
+@router.put("/plans/{plan_id}", response_model=PlanRead, dependencies=[Depends(require_admin)])
+def upsert_plan_endpoint(plan_id: str, request_data: PlanCreate, db: Session = Depends(get_db)) -> PlanRead:
+    """
+    Creates or replaces a plan and invalidates the catalog on every worker.
+    Requires an admin token.
+
+    :param plan_id: Unique identifier for the plan
+    :param request_data: Plan details
+    :param db: Database session
+    :return: The stored plan
+    """
+    if request_data.id != plan_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Plan ID in the path and body must match."
+        )
+    return PlanRead(**plan_catalog.upsert_plan(request_data.model_dump(), db_session=db))
+
+
 @router.delete("/{subscription_id}")
 def cancel_subscription_endpoint(subscription_id: str) -> dict:
     """
@@ -71,26 +263,72 @@ def cancel_subscription_endpoint(subscription_id: str) -> dict:
         )
 
 
-@router.get("/", response_model=List[SubscriptionResponse])
-def list_subscriptions_endpoint() -> List[SubscriptionResponse]:
+@router.post("/migrate-plan", response_model=PlanMigrationResponse, dependencies=[Depends(require_admin)])
+def migrate_plan_endpoint(
+    request_data: PlanMigrationRequest,
+    db: Session = Depends(get_db)
+) -> PlanMigrationResponse:
     """
-    Lists all subscriptions.
+    Moves a batch of subscriptions to a new plan with prorated credits and charges.
+    Requires an admin token.
 
-    :return: List of current subscriptions
+    :param request_data: The subscriptions to migrate and the target plan
+    :param db: Database session
+    :return: Prorated amounts for every migrated subscription
     """
-    # TODO: Implement the logic to list all subscriptions from the database or API
-    # Placeholder example:
-    return [
-        SubscriptionResponse(
-            subscription_id="sub_12345",
-            customer_id="cust_abc",
-            plan_id="plan_gold",
-            status="active"
-        ),
-        SubscriptionResponse(
-            subscription_id="sub_67890",
-            customer_id="cust_xyz",
-            plan_id="plan_silver",
-            status="canceled"
-        ),
-    ]
\ No newline at end of file
+    try:
+        result = subscriptions_service.migrate_subscriptions_plan(
+            request_data.subscription_ids,
+            request_data.new_plan_id,
+            db_session=db,
+            changed_at=request_data.effective_at
+        )
+        return PlanMigrationResponse(**result)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
+
+
+@router.get("/", response_model=SubscriptionListResponse)
+def list_subscriptions_endpoint(
+    customer_id: Optional[int] = None,
+    plan_id: Optional[str] = None,
+    subscription_status: Optional[Literal["active", "canceled"]] = Query(None, alias="status"),
+    starting_after: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=100),
+    db: Session = Depends(get_db)
+) -> SubscriptionListResponse:
+    """
+    Lists subscriptions, optionally filtered by customer, plan and status.
+
+    :param customer_id: Only subscriptions belonging to this customer
+    :param plan_id: Only subscriptions on this plan
+    :param subscription_status: Only 'active' or 'canceled' subscriptions
+    :param starting_after: Cursor from the previous page's next_cursor
+    :param limit: Maximum number of subscriptions per page
+    :param db: Database session
+    :return: One page of subscriptions
+    """
+    page = subscriptions_service.list_subscriptions(
+        db,
+        customer_id=customer_id,
+        plan_id=plan_id,
+        status=subscription_status,
+        starting_after=starting_after,
+        limit=limit
+    )
+    return SubscriptionListResponse(
+        data=[
+            SubscriptionResponse(
+                subscription_id=str(item["subscription_id"]),
+                customer_id=str(item["customer_id"]),
+                plan_id=item["plan_id"],
+                status=item["status"]
+            )
+            for item in page["data"]
+        ],
+        has_more=page["has_more"],
+        next_cursor=page["next_cursor"]
+    )
@@ -1,27 +1,78 @@
 import logging
-from typing import Any, Dict
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from subscriptions import dunning, invoice_numbering, subscription_metrics
+from subscriptions.plan_catalog import catalog
+from subscriptions.proration import billing_period, previous_period, prorate, prorate_batch
+from subscriptions.subscriptions_models import Invoice, Subscription
+from subscriptions.usage_metering import usage_totals
+from webhooks.webhook_delivery import emit_event
 
 logger = logging.getLogger(__name__)
 
+# Placeholder amount for invoices generated without a database session.
+DEFAULT_PLAN_PRICE = 49.99
+
+
+def calculate_amount_due(plan_type: str, usage: Optional[Mapping[str, float]] = None) -> float:
+    """
+    Calculates the amount due for one billing cycle of a plan.
+
+    The price is read from the in-process plan catalog; no query is issued.
+    Each metric is priced at its own unit price: 'units' at the plan's unit_price,
+    any other metric at its entry in metric_prices. Metrics the plan does not
+    price are not billed.
+
+    :param plan_type: The plan the subscription is on.
+    :param usage: Metered quantities to bill, keyed by metric.
+    :return: The amount due for the billing cycle.
+    :raises ValueError: If the plan is not in the catalog.
+    """
+    # TODO: Add taxes and discounts.
+    plan = catalog.require(plan_type)
+    amount = plan["price"]
+    for metric, quantity in (usage or {}).items():
+        unit_price = plan["unit_price"] if metric == "units" else plan["metric_prices"].get(metric)
+        if unit_price and quantity:
+            amount += unit_price * quantity
+    return round(amount, 2)
+
 
-def create_subscription(customer_id: int, plan_id: int) -> Dict[str, Any]:
+def create_subscription(customer_id: int, plan_id: str, db_session: Optional[Session] = None) -> Dict[str, Any]:
     """
     Creates a subscription record and sets up recurring billing.
 
     :param customer_id: The unique identifier for the customer.
     :param plan_id: The unique identifier for the subscription plan.
+    :param db_session: Optional database session; when given, the subscription and
+        its metric updates are committed in one transaction.
     :return: A dictionary containing subscription details.
-    :raises ValueError: If invalid IDs are provided.
+    :raises ValueError: If invalid IDs are provided or the plan is not offered.
     """
-    if customer_id <= 0 or plan_id <= 0:
+    if customer_id <= 0 or not plan_id:
         logger.error("Invalid customer_id or plan_id provided.")
-        raise ValueError("Customer ID and Plan ID must be positive integers.")
+        raise ValueError("Customer ID must be a positive integer and Plan ID is required.")
 
-    # TODO: Insert logic to create a subscription in the database.
     # TODO: Integrate with payment gateway to handle recurring billing setup.
 
+    subscription_id = 123  # Example output used when no database session is given.
+    if db_session is not None:
+        catalog.require(plan_id, active_only=True)
+        record = Subscription(user_id=customer_id, plan_type=plan_id, is_active=True)
+        db_session.add(record)
+        db_session.flush()
+        subscription_metrics.record_subscription_started(db_session, plan_id, record.created_at)
+        db_session.commit()
+        subscription_id = record.id
+
     subscription = {
-        "subscription_id": 123,  # Example output. Replace with real ID from DB.
+        "subscription_id": subscription_id,
         "customer_id": customer_id,
         "plan_id": plan_id,
         "status": "active"
@@ -31,54 +82,261 @@ def create_subscription(customer_id: int, plan_id: int) -> Dict[str, Any]:
     return subscription
 
 
-def cancel_subscription(subscription_id: int) -> Dict[str, Any]:
+def list_subscriptions(
+    db_session: Session,
+    customer_id: Optional[int] = None,
+    plan_id: Optional[str] = None,
+    status: Optional[str] = None,
+    starting_after: Optional[int] = None,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """
+    Lists subscriptions matching the filters, one keyset page at a time.
+
+    Pages are ordered by ID and continue after the last ID of the previous page,
+    so every page is an index range scan on the composite indexes regardless of
+    how deep the caller pages.
+
+    :param db_session: Database session to read from.
+    :param customer_id: Only subscriptions belonging to this customer.
+    :param plan_id: Only subscriptions on this plan.
+    :param status: Only 'active' or 'canceled' subscriptions.
+    :param starting_after: ID of the last subscription on the previous page.
+    :param limit: Maximum number of subscriptions to return.
+    :return: A dictionary with 'data', 'has_more' and 'next_cursor'.
+    :raises ValueError: If the status or limit is invalid.
+    """
+    if status not in (None, "active", "canceled"):
+        raise ValueError("Status must be 'active' or 'canceled'.")
+    if limit <= 0:
+        raise ValueError("Limit must be a positive integer.")
+
+    query = select(Subscription.id, Subscription.user_id, Subscription.plan_type, Subscription.is_active)
+    if customer_id is not None:
+        query = query.where(Subscription.user_id == customer_id)
+    if plan_id is not None:
+        query = query.where(Subscription.plan_type == plan_id)
+    if status is not None:
+        query = query.where(Subscription.is_active.is_(status == "active"))
+    if starting_after is not None:
+        query = query.where(Subscription.id > starting_after)
+    rows = db_session.execute(query.order_by(Subscription.id).limit(limit + 1)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "data": [
+            {
+                "subscription_id": row.id,
+                "customer_id": row.user_id,
+                "plan_id": row.plan_type,
+                "status": "active" if row.is_active else "canceled",
+            }
+            for row in rows
+        ],
+        "has_more": has_more,
+        "next_cursor": rows[-1].id if has_more else None,
+    }
+
+
+def cancel_subscription(
+    subscription_id: int,
+    db_session: Optional[Session] = None,
+    canceled_at: Optional[datetime] = None,
+) -> Dict[str, Any]:
     """
     Cancels an existing subscription and handles any necessary proration.
 
     :param subscription_id: The unique identifier for the subscription.
+    :param db_session: Optional database session; when given, the subscription is
+        deactivated and the unused part of the current period is credited.
+    :param canceled_at: When the cancellation takes effect; defaults to now (UTC).
     :return: A dictionary containing updated subscription details.
-    :raises ValueError: If invalid subscription_id is provided.
+    :raises ValueError: If invalid subscription_id is provided or the subscription is not active.
     """
     if subscription_id <= 0:
         logger.error("Invalid subscription_id provided.")
         raise ValueError("Subscription ID must be a positive integer.")
 
-    # TODO: Retrieve the subscription from the database.
-    # TODO: Determine if any proration or refunds are required.
     # TODO: Integrate with payment gateway to halt recurring billing.
 
-    updated_subscription = {
+    updated_subscription: Dict[str, Any] = {
         "subscription_id": subscription_id,
         "status": "canceled"
     }
 
+    if db_session is not None:
+        subscription = db_session.get(Subscription, subscription_id)
+        if subscription is None or not subscription.is_active:
+            logger.error("Subscription %s not found or already canceled.", subscription_id)
+            raise ValueError(f"Subscription {subscription_id} not found or already canceled.")
+
+        canceled_at = canceled_at or datetime.utcnow()
+        period_start, period_end = billing_period(canceled_at)
+        proration = prorate(period_start, period_end, calculate_amount_due(subscription.plan_type), canceled_at)
+
+        subscription.is_active = False
+        subscription.canceled_at = canceled_at
+        subscription_metrics.record_subscription_canceled(db_session, subscription.plan_type, canceled_at)
+        db_session.commit()
+        updated_subscription["prorated_credit"] = proration["credit"]
+
     logger.info("Canceled subscription with ID: %s", subscription_id)
     return updated_subscription
 
 
-def generate_invoice(subscription_id: int) -> Dict[str, Any]:
+def migrate_subscriptions_plan(
+    subscription_ids: List[int],
+    new_plan_type: str,
+    db_session: Session,
+    changed_at: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    Moves a batch of subscriptions to a new plan, prorating the current period.
+
+    Proration for the whole batch is computed in one vectorized call and the
+    plan change is written with a single bulk update.
+
+    :param subscription_ids: The subscriptions to migrate.
+    :param new_plan_type: The plan the subscriptions move to.
+    :param db_session: Database session used to load and update the subscriptions.
+    :param changed_at: When the change takes effect; defaults to now (UTC).
+    :return: A dictionary with the migrated count, the net total and per-subscription amounts.
+    :raises ValueError: If no IDs are given, the new plan is not offered, or any subscription is missing or inactive.
+    """
+    if not subscription_ids:
+        raise ValueError("At least one subscription ID is required.")
+    catalog.require(new_plan_type, active_only=True)
+
+    changed_at = changed_at or datetime.utcnow()
+    if changed_at.tzinfo is not None:
+        changed_at = changed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    rows = db_session.execute(
+        select(Subscription.id, Subscription.plan_type)
+        .where(Subscription.id.in_(subscription_ids))
+        .where(Subscription.is_active.is_(True))
+    ).all()
+    missing = set(subscription_ids) - {row.id for row in rows}
+    if missing:
+        logger.error("Cannot migrate missing or inactive subscriptions: %s", sorted(missing))
+        raise ValueError(f"Subscriptions not found or inactive: {sorted(missing)}")
+
+    prices = {plan: calculate_amount_due(plan) for plan in {row.plan_type for row in rows} | {new_plan_type}}
+    period_start, period_end = billing_period(changed_at)
+    count = len(rows)
+    proration = prorate_batch(
+        np.full(count, np.datetime64(period_start, "s")),
+        np.full(count, np.datetime64(period_end, "s")),
+        np.fromiter((prices[row.plan_type] for row in rows), dtype=np.float64, count=count),
+        np.full(count, np.datetime64(changed_at, "s")),
+        np.full(count, prices[new_plan_type]),
+    )
+
+    moved = [row for row in rows if row.plan_type != new_plan_type]
+    if moved:
+        db_session.execute(
+            update(Subscription),
+            [{"id": row.id, "plan_type": new_plan_type} for row in moved],
+        )
+        subscription_metrics.record_plan_changes(db_session, Counter(row.plan_type for row in moved), new_plan_type)
+    db_session.commit()
+
+    items = [
+        {"subscription_id": row.id, "credit": credit, "charge": charge, "net": net}
+        for row, credit, charge, net in zip(
+            rows, proration["credit"].tolist(), proration["charge"].tolist(), proration["net"].tolist()
+        )
+    ]
+    logger.info("Migrated %d subscription(s) to plan %s", count, new_plan_type)
+    return {
+        "migrated": count,
+        "new_plan_id": new_plan_type,
+        "net_total": round(float(proration["net"].sum()), 2),
+        "items": items,
+    }
+
+
+def generate_invoice(subscription_id: int, db_session: Optional[Session] = None) -> Dict[str, Any]:
     """
     Generates an invoice for the current billing cycle of a subscription.
 
     :param subscription_id: The unique identifier for the subscription.
+    :param db_session: Optional database session; when given, the invoice for the
+        current period is stored with an allocated invoice number, priced from the
+        subscription's plan plus the flushed usage of the period that just closed
+        (usage is billed in arrears), and its payment is attempted right
+        away; if it fails the invoice is left 'past_due' and enrolled in dunning.
+        An existing invoice for the period is returned instead of creating a second one.
     :return: A dictionary representing the generated invoice.
-    :raises ValueError: If invalid subscription_id is provided.
+    :raises ValueError: If invalid subscription_id is provided or the subscription is not active.
     """
     if subscription_id <= 0:
         logger.error("Invalid subscription_id provided.")
         raise ValueError("Subscription ID must be a positive integer.")
 
-    # TODO: Fetch subscription details from the database.
-    # TODO: Calculate the amount due based on the plan, usage, taxes, etc.
-    # TODO: Create and save the invoice record in the database.
-    # TODO: Optionally, handle automatic payment.
+    if db_session is None:
+        invoice = {
+            "invoice_id": 999,  # Example output used when no database session is given.
+            "invoice_number": None,
+            "subscription_id": subscription_id,
+            "amount_due": DEFAULT_PLAN_PRICE,
+            "currency": "usd",
+            "status": "unpaid"
+        }
+        logger.info("Generated invoice with ID: %s for subscription ID: %s", invoice["invoice_id"], subscription_id)
+        return invoice
+
+    subscription = db_session.get(Subscription, subscription_id)
+    if subscription is None or not subscription.is_active:
+        logger.error("Subscription %s not found or inactive.", subscription_id)
+        raise ValueError(f"Subscription {subscription_id} not found or inactive.")
+
+    plan = catalog.require(subscription.plan_type)
+    period_start, period_end = billing_period()
+    record = db_session.execute(
+        select(Invoice)
+        .where(Invoice.subscription_id == subscription_id)
+        .where(Invoice.period_start == period_start)
+    ).scalar_one_or_none()
+    created = record is None
+    if created:
+        number = invoice_numbering.allocator.next_number(invoice_numbering.DEFAULT_ACCOUNT, db_session=db_session)
+        usage = usage_totals(db_session, subscription_id, previous_period(period_start)[0])
+        record = Invoice(
+            subscription_id=subscription_id,
+            account_id=invoice_numbering.DEFAULT_ACCOUNT,
+            number=number,
+            period_start=period_start,
+            period_end=period_end,
+            amount_due=calculate_amount_due(subscription.plan_type, usage),
+            status="unpaid",
+        )
+        db_session.add(record)
+        db_session.flush()
+        # Committed with the invoice, so a failure before collection still leaves it to dunning
+        dunning.open_first_attempts(db_session, [{"invoice_id": record.id, "subscription_id": subscription_id}])
+        db_session.commit()
+        dunning.collect_invoices(db_session, [{
+            "invoice_id": record.id,
+            "subscription_id": subscription_id,
+            "customer_id": subscription.user_id,
+            "amount_due": record.amount_due,
+        }])
 
     invoice = {
-        "invoice_id": 999,  # Example output. Replace with real ID from DB.
+        "invoice_id": record.id,
+        "invoice_number": record.number,
         "subscription_id": subscription_id,
-        "amount_due": 49.99,  # Example amount. Replace with real calculation.
-        "status": "unpaid"
+        "amount_due": record.amount_due,
+        "currency": plan["currency"],
+        "status": record.status
     }
 
+    if created:
+        # The invoice is already committed, so a delivery failure must not fail this call
+        try:
+            emit_event("invoice.created", invoice)
+        except Exception as e:
+            logger.error("Failed to emit invoice.created for invoice %s: %s", invoice["invoice_id"], e)
     logger.info("Generated invoice with ID: %s for subscription ID: %s", invoice["invoice_id"], subscription_id)
-    return invoice
\ No newline at end of file
+    return invoice
@@ -0,0 +1,237 @@
+"""
+High-volume usage ingestion with in-memory aggregation.
+
+Usage events are summed per (subscription, billing period, metric) in a bounded
+in-process buffer and flushed periodically as one upserted row per key, so the
+database sees a few writes per subscription per flush instead of one per event.
+The buffer is flushed on shutdown, and a failed flush is merged back so no
+usage is dropped.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from subscriptions.subscriptions_models import UsageAggregate
+from subscriptions.proration import billing_period
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "5"))
+USAGE_BUFFER_MAX_KEYS = int(os.getenv("USAGE_BUFFER_MAX_KEYS", "100000"))
+
+UsageKey = Tuple[int, datetime, str]
+
+
+class UsageBufferFullError(Exception):
+    """
+    Raised when the buffer already holds the maximum number of distinct keys.
+    """
+    pass
+
+
+class UsageBuffer:
+    """
+    Thread-safe, bounded map of pending usage totals.
+
+    The bound is on distinct keys, not events: repeated events for a key that is
+    already buffered are always accepted.
+    """
+
+    def __init__(self, max_keys: int = USAGE_BUFFER_MAX_KEYS) -> None:
+        self.max_keys = max_keys
+        self._totals: Dict[UsageKey, float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def record(self, subscription_id: int, quantity: float, metric: str = "units",
+               timestamp: Optional[datetime] = None) -> None:
+        """
+        Adds one usage event to the buffer.
+
+        :param subscription_id: The subscription the usage belongs to.
+        :param quantity: Units consumed.
+        :param metric: Name of the metered dimension.
+        :param timestamp: When the usage happened; defaults to now (UTC).
+        :raises UsageBufferFullError: If the event needs a new key and the buffer is full.
+        """
+        self.record_many([(subscription_id, quantity, metric, timestamp)])
+
+    def record_many(self, events: Iterable[Tuple[int, float, str, Optional[datetime]]]) -> int:
+        """
+        Adds a batch of usage events to the buffer atomically.
+
+        :param events: Tuples of (subscription_id, quantity, metric, timestamp).
+        :return: The number of events recorded.
+        :raises UsageBufferFullError: If the batch needs more new keys than there is room for;
+            nothing from the batch is recorded in that case.
+        """
+        now = datetime.utcnow()
+        pending: Dict[UsageKey, float] = defaultdict(float)
+        count = 0
+        for subscription_id, quantity, metric, timestamp in events:
+            period_start, _ = billing_period(timestamp or now)
+            pending[(subscription_id, period_start, metric)] += quantity
+            count += 1
+
+        with self._lock:
+            new_keys = sum(1 for key in pending if key not in self._totals)
+            if len(self._totals) + new_keys > self.max_keys:
+                raise UsageBufferFullError("Usage buffer is full; retry after the next flush.")
+            for key, quantity in pending.items():
+                self._totals[key] += quantity
+        return count
+
+    def drain(self) -> Dict[UsageKey, float]:
+        """
+        Removes and returns everything buffered so far.
+        """
+        with self._lock:
+            drained, self._totals = self._totals, defaultdict(float)
+        return drained
+
+    def restore(self, totals: Dict[UsageKey, float]) -> None:
+        """
+        Merges totals back into the buffer after a failed flush, ignoring the key bound.
+        """
+        with self._lock:
+            for key, quantity in totals.items():
+                self._totals[key] += quantity
+
+    def flush(self, session: Session) -> int:
+        """
+        Writes buffered totals to the database as pre-summed rows.
+
+        :param session: Database session used for the write; committed on success.
+        :return: The number of rows upserted.
+        """
+        with self._flush_lock:
+            totals = self.drain()
+            if not totals:
+                return 0
+            try:
+                _upsert_usage(session, totals)
+                session.commit()
+            except Exception:
+                session.rollback()
+                self.restore(totals)
+                raise
+        logger.debug("Flushed %d usage aggregate(s)", len(totals))
+        return len(totals)
+
+
+def _upsert_usage(session: Session, totals: Dict[UsageKey, float]) -> None:
+    rows = [
+        {"subscription_id": subscription_id, "period_start": period_start, "metric": metric, "quantity": quantity}
+        for (subscription_id, period_start, metric), quantity in totals.items()
+    ]
+    database.upsert_add(session, UsageAggregate, rows, ["subscription_id", "period_start", "metric"], ["quantity"])
+
+
+def usage_totals(session: Session, subscription_id: int, period_start: datetime) -> Dict[str, float]:
+    """
+    Returns flushed usage for one subscription and billing period, keyed by metric.
+
+    :param session: Database session to read from.
+    :param subscription_id: The subscription to total.
+    :param period_start: Start of the billing period.
+    :return: A dictionary of metric name to quantity.
+    """
+    rows = session.execute(
+        select(UsageAggregate.metric, func.sum(UsageAggregate.quantity))
+        .where(UsageAggregate.subscription_id == subscription_id)
+        .where(UsageAggregate.period_start == period_start)
+        .group_by(UsageAggregate.metric)
+    ).all()
+    return {metric: float(quantity) for metric, quantity in rows}
+
+
+def period_usage(session: Session, period_start: datetime, low: int, high: int) -> Dict[int, Dict[str, float]]:
+    """
+    Returns flushed usage for a range of subscriptions in one billing period.
+
+    :param session: Database session to read from.
+    :param period_start: Start of the billing period.
+    :param low: The smallest subscription ID to include.
+    :param high: The subscription ID to stop before.
+    :return: A dictionary of subscription ID to its usage, keyed by metric.
+    """
+    rows = session.execute(
+        select(UsageAggregate.subscription_id, UsageAggregate.metric, func.sum(UsageAggregate.quantity))
+        .where(UsageAggregate.subscription_id >= low, UsageAggregate.subscription_id < high)
+        .where(UsageAggregate.period_start == period_start)
+        .group_by(UsageAggregate.subscription_id, UsageAggregate.metric)
+    ).all()
+    usage: Dict[int, Dict[str, float]] = defaultdict(dict)
+    for subscription_id, metric, quantity in rows:
+        usage[subscription_id][metric] = float(quantity)
+    return dict(usage)
+
+
+usage_buffer = UsageBuffer()
+
+_flush_task: Optional["asyncio.Task[None]"] = None
+
+
+def flush_usage_buffer() -> int:
+    """
+    Flushes the process-wide buffer in its own transaction.
+
+    :return: The number of rows upserted.
+    """
+    database.get_engine()
+    session = database.SessionLocal()
+    try:
+        return usage_buffer.flush(session)
+    finally:
+        session.close()
+
+
+async def _flush_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(flush_usage_buffer)
+        except Exception as exc:
+            logger.error("Failed to flush usage buffer: %s", exc)
+
+
+async def start_usage_metering() -> None:
+    """
+    Starts the periodic flush. Intended as an application startup handler.
+    """
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_periodically(USAGE_FLUSH_SECONDS))
+
+
+async def stop_usage_metering() -> None:
+    """
+    Stops the periodic flush and writes whatever is still buffered.
+    Intended as an application shutdown handler.
+    """
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    try:
+        flushed = await run_in_threadpool(flush_usage_buffer)
+        logger.info("Flushed %d usage aggregate(s) on shutdown", flushed)
+    except Exception as exc:
+        logger.error("Failed to flush usage buffer on shutdown; %d key(s) lost: %s", len(usage_buffer), exc)
@@ -40,3 +40,95 @@ def test_db():
     db.close()
     # Teardown
     Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def subscriptions_session():
+    # In-memory database holding the subscription tables
+    from sqlalchemy import Column, Integer, Table
+    from sqlalchemy.pool import StaticPool
+    from dashboard.dashboard_models import Base as DashboardBase
+    from subscriptions.subscriptions_models import Base as SubscriptionsBase
+
+    if "users" not in SubscriptionsBase.metadata.tables:
+        # Subscriptions reference users.id, which is not modelled in this repo yet
+        Table("users", SubscriptionsBase.metadata, Column("id", Integer, primary_key=True))
+
+    subscriptions_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SubscriptionsBase.metadata.create_all(bind=subscriptions_engine)
+    # Subscription changes also maintain the dashboard rollups
+    DashboardBase.metadata.create_all(bind=subscriptions_engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=subscriptions_engine)()
+    yield session
+    session.close()
+    subscriptions_engine.dispose()
+
+
+@pytest.fixture
+def webhooks_session():
+    # In-memory database holding the webhook tables
+    from sqlalchemy.pool import StaticPool
+    from webhooks.webhooks_models import Base as WebhooksBase
+
+    webhooks_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    WebhooksBase.metadata.create_all(bind=webhooks_engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=webhooks_engine)()
+    yield session
+    session.close()
+    webhooks_engine.dispose()
+
+
+@pytest.fixture
+def webhook_deduplicator(webhooks_session, monkeypatch):
+    # Process-wide deduplicator backed by the in-memory webhook tables
+    from contextlib import contextmanager
+    from webhooks import webhook_dedupe
+
+    @contextmanager
+    def session_factory():
+        yield webhooks_session
+
+    deduplicator = webhook_dedupe.EventDeduplicator(session_factory=session_factory)
+    monkeypatch.setattr(webhook_dedupe, "deduplicator", deduplicator)
+    return deduplicator
+
+
+@pytest.fixture
+def dead_letter_store(webhooks_session, monkeypatch):
+    # Process-wide dead-letter store backed by the in-memory webhook tables, without retry delays
+    from contextlib import contextmanager
+    from webhooks import dead_letter
+
+    @contextmanager
+    def session_factory():
+        yield webhooks_session
+
+    store = dead_letter.DeadLetterStore(max_attempts=3, retry_delay=0, session_factory=session_factory)
+    monkeypatch.setattr(dead_letter, "dead_letter_store", store)
+    return store
+
+
+@pytest.fixture(scope="session", autouse=True)
+def webhook_event_log(tmp_path_factory):
+    # Keeps the event log apps open on startup out of the working directory;
+    # session-scoped so that module-scoped clients are covered too
+    from webhooks import event_log
+
+    with pytest.MonkeyPatch.context() as patch:
+        log = event_log.EventLog(str(tmp_path_factory.mktemp("webhook_event_log")))
+        patch.setattr(event_log, "event_log", log)
+        yield log
+        log.close()
+
+
+@pytest.fixture
+def admin_headers(monkeypatch):
+    # Authorization header accepted by the admin routes
+    from utils import auth
+
+    monkeypatch.setattr(auth, "ADMIN_API_TOKENS", ["test-admin-token"])
+    return {"Authorization": "Bearer test-admin-token"}
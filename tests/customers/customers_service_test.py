@@ -50,6 +50,18 @@ class TestCreateCustomer:
         assert created_customer.name == name
         assert created_customer.email == email
 
+    @pytest.mark.it("Creates the customer even if the dashboard rollup fails")
+    def test_create_customer_survives_rollup_failure(self):
+        """
+        Test that a failure to record the new customer in the dashboard rollups
+        is logged rather than failing the creation.
+        """
+        with patch("customers.customers_service.dashboard_rollups.rollup_buffer.record",
+                   side_effect=RuntimeError("rollup buffer unavailable")):
+            created_customer = create_customer("John Doe", "john.doe@example.com", {})
+
+        assert created_customer["email"] == "john.doe@example.com"
+
     @pytest.mark.it("Fails to create a customer with invalid email")
     def test_create_customer_failure_invalid_email(self, mock_session):
         """
@@ -0,0 +1,170 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from customers.customers_service import create_customer
+from dashboard import dashboard_rollups, dashboard_router, dashboard_sections
+from dashboard.dashboard_models import DashboardRollup
+from dashboard.dashboard_rollups import RollupBuffer, bucket_start, get_dashboard_rollups, prune_rollups
+from dashboard.dashboard_sections import DashboardAssembler
+from main import create_app
+from payments.payments_service import create_charge, refund_charge
+from response_cache import ResponseCache
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.subscriptions_service import cancel_subscription, create_subscription
+
+
+@pytest.fixture
+def rollup_buffer(monkeypatch):
+    """
+    Replaces the process-wide rollup buffer with an empty one.
+    """
+    buffer = RollupBuffer()
+    monkeypatch.setattr(dashboard_rollups, "rollup_buffer", buffer)
+    return buffer
+
+
+@pytest.fixture
+def monthly_plan(subscriptions_session):
+    upsert_plan({"id": "plan_monthly", "name": "Monthly", "price": 20.0}, subscriptions_session)
+    yield
+    catalog.clear()
+
+
+def test_bucket_start_truncates_per_granularity():
+    at = datetime(2026, 3, 14, 15, 9, 26, 535)
+    assert bucket_start(at, "minute") == datetime(2026, 3, 14, 15, 9)
+    assert bucket_start(at, "hour") == datetime(2026, 3, 14, 15)
+    assert bucket_start(at, "day") == datetime(2026, 3, 14)
+    with pytest.raises(ValueError):
+        bucket_start(at, "week")
+
+
+def test_charges_and_customers_roll_up_before_and_after_flush(subscriptions_session, rollup_buffer):
+    """
+    Charges and customers are summed in the buffer, readable before the flush and
+    stored as one row per bucket, metric and status after it.
+    """
+    first = create_charge("cus_1", 10.0, "card")
+    create_charge("cus_2", 15.5, "card")
+    refund_charge(first["charge_id"])
+    create_customer("Jane", "jane@example.com", {})
+
+    before = get_dashboard_rollups(subscriptions_session, "hour", 1)
+    assert rollup_buffer.flush(subscriptions_session) == 3 * len(dashboard_rollups.GRANULARITIES)
+    after = get_dashboard_rollups(subscriptions_session, "hour", 1)
+
+    assert before == after
+    assert after["recent_charges"] == [
+        {"status": "refunded", "count": 1, "volume": 10.0},
+        {"status": "successful", "count": 2, "volume": 25.5},
+    ]
+    assert after["new_customers"] == 1
+    assert len(after["series"]) == 1
+    assert subscriptions_session.query(DashboardRollup).count() == 9
+
+
+def test_flush_adds_onto_existing_rows(subscriptions_session, rollup_buffer):
+    at = datetime.utcnow()
+    for _ in range(2):
+        rollup_buffer.record("charges", "successful", volume=5.0, at=at)
+        rollup_buffer.flush(subscriptions_session)
+
+    row = subscriptions_session.get(DashboardRollup, ("day", bucket_start(at, "day"), "charges", "successful"))
+    assert (row.count, row.volume) == (2, 10.0)
+
+
+def test_subscription_changes_update_rollups_in_their_transaction(subscriptions_session, rollup_buffer, monthly_plan):
+    """
+    Starting and canceling subscriptions writes rollups directly, without the buffer.
+    """
+    ids = [create_subscription(index, "plan_monthly", db_session=subscriptions_session)["subscription_id"]
+           for index in (1, 2, 3)]
+    cancel_subscription(ids[0], db_session=subscriptions_session)
+
+    data = get_dashboard_rollups(subscriptions_session, "day", 1)
+
+    assert len(rollup_buffer) == 0
+    assert data["subscriptions"] == {"started": 3, "canceled": 1}
+
+
+def test_rollups_cover_only_the_requested_buckets(subscriptions_session, rollup_buffer):
+    now = datetime(2026, 3, 14, 15, 30)
+    rollup_buffer.record("customers", "new", at=now)
+    rollup_buffer.record("customers", "new", at=now - timedelta(minutes=5))
+    rollup_buffer.record("customers", "new", at=now - timedelta(hours=2))
+    rollup_buffer.flush(subscriptions_session)
+
+    assert get_dashboard_rollups(subscriptions_session, "minute", 10, now)["new_customers"] == 2
+    assert get_dashboard_rollups(subscriptions_session, "hour", 2, now)["new_customers"] == 2
+    assert get_dashboard_rollups(subscriptions_session, "hour", 3, now)["new_customers"] == 3
+    with pytest.raises(ValueError):
+        get_dashboard_rollups(subscriptions_session, "minute", 10000, now)
+
+
+def test_prune_keeps_day_rollups(subscriptions_session, rollup_buffer):
+    now = datetime.utcnow()
+    rollup_buffer.record("customers", "new", at=now - timedelta(days=120))
+    rollup_buffer.record("customers", "new", at=now)
+    rollup_buffer.flush(subscriptions_session)
+
+    assert prune_rollups(subscriptions_session, now) == 2
+    granularities = [row.granularity for row in subscriptions_session.query(DashboardRollup)]
+    assert sorted(granularities) == ["day", "day", "hour", "minute"]
+
+
+@pytest.fixture
+def dashboard_client(subscriptions_session, monkeypatch):
+    """
+    Client whose dashboard reads go to the in-memory database, with an empty response cache.
+    """
+    lock = threading.Lock()
+
+    @contextmanager
+    def session_scope():
+        # Dashboard sections load in parallel threads but share the one test session
+        with lock:
+            yield subscriptions_session
+
+    monkeypatch.setattr(database, "session_scope", session_scope)
+    monkeypatch.setattr(dashboard_router, "dashboard_cache", ResponseCache())
+    monkeypatch.setattr(dashboard_sections, "dashboard_assembler", DashboardAssembler())
+    return TestClient(create_app())
+
+
+def test_dashboard_data_endpoint_reads_rollups(subscriptions_session, rollup_buffer, monthly_plan, dashboard_client):
+    create_subscription(1, "plan_monthly", db_session=subscriptions_session)
+    create_charge("cus_1", 42.0, "card")
+    client = dashboard_client
+
+    response = client.get("/dashboard/data", params={"granularity": "minute", "buckets": 5})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["recent_charges"] == [{"status": "successful", "count": 1, "volume": 42.0}]
+    assert data["subscription_metrics"] == {"active_subscriptions": 1, "mrr": {"usd": 20.0}, "started": 1, "canceled": 0}
+    assert data["stale"] == [] and len(data["series"]) == 1
+    assert [timing.split(";")[0] for timing in response.headers["Server-Timing"].split(", ")] == [
+        "recent_charges", "new_customers", "subscription_metrics"
+    ]
+    assert client.get("/dashboard/data", params={"granularity": "minute", "buckets": 300}).status_code == 400
+
+
+def test_dashboard_data_is_cached_with_etag(subscriptions_session, rollup_buffer, dashboard_client):
+    """
+    Repeated polls are served from the cache, and a matching If-None-Match gets 304.
+    """
+    create_charge("cus_1", 42.0, "card")
+    first = dashboard_client.get("/dashboard/data")
+    create_charge("cus_2", 8.0, "card")
+    second = dashboard_client.get("/dashboard/data")
+    not_modified = dashboard_client.get("/dashboard/data", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert second.content == first.content
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert dashboard_client.get("/dashboard/data", params={"buckets": 2}).json()["recent_charges"][0]["count"] == 2
+    assert dashboard_router.dashboard_cache.stats()["hits"] == 2
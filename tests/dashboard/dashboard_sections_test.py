@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+from dashboard.dashboard_sections import DashboardAssembler, SectionResult, server_timing
+
+NOW = datetime(2026, 3, 14, 15, 30)
+BUCKET = datetime(2026, 3, 14, 15)
+
+
+def _loader(value, metric, calls=None, release=None, error=None):
+    def load(granularity, buckets, now):
+        if calls is not None:
+            calls.append(now)
+        if release is not None:
+            release.wait(5)
+        if error is not None:
+            raise error
+        return value, [{"bucket_start": BUCKET, "charges": {}, "customers": {}, "subscriptions": {},
+                        metric: {"new": {"count": 1, "volume": 0.0}}}]
+    return load
+
+
+def test_sections_are_merged():
+    assembler = DashboardAssembler(sections={
+        "recent_charges": (_loader([{"status": "successful", "count": 1}], "charges"), "charges"),
+        "new_customers": (_loader(3, "customers"), "customers"),
+    })
+
+    data, results = asyncio.run(assembler.assemble("hour", 2, NOW))
+
+    assert data["since"] == datetime(2026, 3, 14, 14)
+    assert data["recent_charges"] == [{"status": "successful", "count": 1}]
+    assert data["new_customers"] == 3
+    assert data["stale"] == []
+    assert data["series"] == [{"bucket_start": BUCKET, "charges": {"new": {"count": 1, "volume": 0.0}},
+                               "customers": {"new": {"count": 1, "volume": 0.0}}, "subscriptions": {}}]
+    assert [result.name for result in results] == ["recent_charges", "new_customers"]
+
+
+def test_slow_section_serves_its_last_value_while_its_load_finishes():
+    """
+    A section past its timeout is flagged stale with its previous value; the load keeps
+    running, later requests wait on it instead of starting another, and its result
+    becomes the section's last value.
+    """
+    release = threading.Event()
+    calls = []
+    values = iter([1, 2, 3])
+
+    def customers(granularity, buckets, now):
+        calls.append(now)
+        value = next(values)
+        if value == 2:
+            release.wait(5)
+        return value, []
+
+    assembler = DashboardAssembler(timeout=0.05, sections={
+        "recent_charges": (_loader([], "charges"), "charges"),
+        "new_customers": (customers, "customers"),
+    })
+
+    async def scenario():
+        first, _ = await assembler.assemble("hour", 1, NOW)
+        slow = await asyncio.gather(*(assembler.assemble("hour", 1, NOW) for _ in range(3)))
+        release.set()
+        await asyncio.sleep(0.1)
+        completed = assembler._last[("new_customers", "hour", 1)][0]
+        return first, slow, completed, (await assembler.assemble("hour", 1, NOW))[0]
+
+    first, slow, completed, finished = asyncio.run(scenario())
+
+    assert first["new_customers"] == 1
+    for data, results in slow:
+        assert data["new_customers"] == 1 and data["stale"] == ["new_customers"]
+        assert results[1].stale and results[1].elapsed >= 0.05
+    assert completed == 2
+    assert finished["new_customers"] == 3 and finished["stale"] == []
+    assert len(calls) == 3
+
+
+def test_failed_section_without_previous_value_is_null():
+    assembler = DashboardAssembler(sections={
+        "recent_charges": (_loader([], "charges"), "charges"),
+        "new_customers": (_loader(None, "customers", error=RuntimeError("database down")), "customers"),
+    })
+
+    data, _ = asyncio.run(assembler.assemble("hour", 1, NOW))
+
+    assert data["new_customers"] is None and data["stale"] == ["new_customers"]
+
+
+def test_all_sections_failing_is_an_error():
+    assembler = DashboardAssembler(sections={
+        "new_customers": (_loader(None, "customers", error=RuntimeError("database down")), "customers"),
+    })
+    with pytest.raises(RuntimeError):
+        asyncio.run(assembler.assemble("hour", 1, NOW))
+
+
+def test_server_timing():
+    results = [
+        SectionResult("recent_charges", [], elapsed=0.0123),
+        SectionResult("new_customers", 1, elapsed=1.0, stale=True),
+    ]
+    assert server_timing(results) == 'recent_charges;dur=12.3, new_customers;dur=1000.0;desc="stale"'
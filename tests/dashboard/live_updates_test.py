@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from dashboard import dashboard_rollups, live_updates
+from dashboard.dashboard_rollups import RollupBuffer
+from dashboard.live_updates import LiveUpdates, TooManySubscribersError, encode_event, stream
+from main import create_app
+from payments.payments_service import create_charge, refund_charge
+
+
+@pytest.fixture
+def updates(monkeypatch):
+    """
+    Replaces the process-wide pub/sub with an empty one.
+    """
+    updates = LiveUpdates(max_buffered=4)
+    monkeypatch.setattr(live_updates, "live_updates", updates)
+    return updates
+
+
+def _events(frames):
+    """
+    Parses SSE frames into (event, data) pairs, skipping comments.
+    """
+    events = []
+    for frame in b"".join(frames).split(b"\n\n"):
+        fields = dict(line.split(b": ", 1) for line in frame.split(b"\n") if line and not line.startswith(b":"))
+        if b"event" in fields:
+            events.append((fields[b"event"].decode(), orjson.loads(fields[b"data"])))
+    return events
+
+
+def test_encode_event():
+    assert encode_event(7, "charge", {"amount": 1.5}) == b'id: 7\nevent: charge\ndata: {"amount":1.5}\n\n'
+
+
+def test_events_published_from_other_threads_reach_every_subscriber(updates):
+    async def scenario():
+        subscribers = [updates.subscribe() for _ in range(2000)]
+        publisher = threading.Thread(target=updates.publish, args=("charge", {"n": 1}))
+        publisher.start()
+        publisher.join()
+        return await asyncio.gather(*(subscriber.next_frames() for subscriber in subscribers))
+
+    received = asyncio.run(scenario())
+
+    assert all(_events(frames) == [("charge", {"n": 1})] for frames in received)
+    # The frame is encoded once and shared
+    assert len({id(frames[0]) for frames in received}) == 1
+
+
+def test_slow_subscribers_are_dropped_and_told_to_resync(updates):
+    """
+    A viewer that stops reading is disconnected once its buffer is full; others are unaffected.
+    """
+    async def scenario():
+        slow, fast = updates.subscribe(), updates.subscribe()
+        body = stream(slow)
+        first = await body.__anext__()
+        fast_frames = []
+        for n in range(6):
+            updates.publish("charge", {"n": n})
+            fast_frames += await fast.next_frames()
+        rest = [frame async for frame in body]
+        return first, rest, fast_frames
+
+    first, rest, fast_frames = asyncio.run(scenario())
+
+    assert first.startswith(b"retry: ")
+    assert _events(rest) == [("resync", {})]
+    assert len(_events(fast_frames)) == 6
+    assert updates.stats() == {"subscribers": 1, "published": 6, "dropped": 1}
+
+
+def test_metric_deltas_are_coalesced(updates):
+    async def scenario():
+        subscriber = updates.subscribe()
+        updates.record_charge("successful", 10.0)
+        updates.record_charge("successful", 2.5)
+        updates.record_charge("refunded", 10.0)
+        flushed = updates.flush_metrics(), updates.flush_metrics()
+        return flushed, await subscriber.next_frames()
+
+    flushed, frames = asyncio.run(scenario())
+
+    assert flushed == (True, False)
+    assert _events(frames) == [("metrics", {"recent_charges": [
+        {"status": "refunded", "count": 1, "volume": 10.0},
+        {"status": "successful", "count": 2, "volume": 12.5},
+    ]})]
+
+
+def test_charges_are_published(updates, monkeypatch):
+    monkeypatch.setattr(dashboard_rollups, "rollup_buffer", RollupBuffer())
+
+    async def scenario():
+        subscriber = updates.subscribe()
+        charge = create_charge("cus_1", 42.0, "card")
+        refund_charge(charge["charge_id"])
+        updates.flush_metrics()
+        return charge, await subscriber.next_frames()
+
+    charge, frames = asyncio.run(scenario())
+
+    events = _events(frames)
+    assert [event for event, _ in events] == ["charge", "charge", "metrics"]
+    assert events[0][1] == {"charge_id": charge["charge_id"], "customer_id": "cus_1", "amount": 42.0,
+                            "status": "successful"}
+    assert events[1][1]["status"] == "refunded"
+
+
+def test_subscriber_limit(monkeypatch):
+    updates = LiveUpdates(max_subscribers=1)
+    monkeypatch.setattr(live_updates, "live_updates", updates)
+
+    async def scenario():
+        updates.subscribe()
+        with pytest.raises(TooManySubscribersError):
+            updates.subscribe()
+
+    asyncio.run(scenario())
+    monkeypatch.setattr(live_updates, "live_updates", LiveUpdates(max_subscribers=0))
+    assert TestClient(create_app()).get("/dashboard/stream").status_code == 503
@@ -0,0 +1,171 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import database
+from dashboard import dashboard_router, timeseries
+from dashboard.timeseries import SegmentCache, align_range, bucket_statistics, charge_timeseries
+from main import create_app
+from payments.payments_models import Base, Payment, PaymentStatus
+from response_cache import ResponseCache
+
+START = datetime(2026, 3, 1)
+
+
+@pytest.fixture
+def payments_session():
+    # In-memory database holding the payments table
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _add_payments(session, *payments):
+    for at, amount, status in payments:
+        session.add(Payment(amount=amount, status=status, created_at=at, updated_at=at))
+    session.commit()
+
+
+def test_bucket_statistics_match_numpy_percentiles():
+    rng = np.random.default_rng(7)
+    timestamps = rng.integers(0, 10 * 3600, 5000)
+    amounts = np.round(rng.lognormal(3, 1, 5000), 2)
+
+    stats = bucket_statistics(timestamps, amounts, 0, 3600, 12)
+
+    for bucket in range(10):
+        values = amounts[timestamps // 3600 == bucket]
+        assert stats["count"][bucket] == values.size
+        assert stats["volume"][bucket] == pytest.approx(values.sum())
+        for q in timeseries.PERCENTILES:
+            assert stats[f"p{q}"][bucket] == pytest.approx(np.percentile(values, q))
+    assert stats["count"][10:].tolist() == [0, 0]
+    assert np.isnan(stats["p50"][10:]).all()
+
+
+def test_bucket_statistics_ignore_values_outside_the_buckets():
+    stats = bucket_statistics(np.array([-1, 0, 59, 60, 120]), np.array([1.0, 2.0, 4.0, 8.0, 16.0]), 0, 60, 2)
+
+    assert stats["count"].tolist() == [2, 1]
+    assert stats["volume"].tolist() == [6.0, 8.0]
+    assert stats["p50"].tolist() == [3.0, 8.0]
+
+
+def test_align_range_snaps_to_bucket_boundaries():
+    assert align_range(datetime(2026, 3, 1, 10, 20), datetime(2026, 3, 1, 12, 5), 3600) == (
+        datetime(2026, 3, 1, 10), datetime(2026, 3, 1, 13)
+    )
+    assert align_range(None, datetime(2026, 3, 2), 3600) == (datetime(2026, 3, 1), datetime(2026, 3, 2))
+    with pytest.raises(ValueError):
+        align_range(datetime(2026, 3, 2), datetime(2026, 3, 1), 3600)
+    with pytest.raises(ValueError):
+        align_range(datetime(2020, 1, 1), datetime(2026, 1, 1), 60)
+
+
+def test_charge_timeseries_reads_payments_in_range(payments_session):
+    _add_payments(
+        payments_session,
+        (START + timedelta(minutes=5), 10.0, PaymentStatus.COMPLETED),
+        (START + timedelta(minutes=50), 30.0, PaymentStatus.COMPLETED),
+        (START + timedelta(hours=1, minutes=1), 7.5, PaymentStatus.COMPLETED),
+        (START + timedelta(minutes=10), 99.0, PaymentStatus.FAILED),
+        (START + timedelta(hours=3), 50.0, PaymentStatus.COMPLETED),
+    )
+
+    data = charge_timeseries(payments_session, START, START + timedelta(hours=3), 3600, segments=SegmentCache())
+
+    assert data["totals"] == {"count": 3, "volume": 47.5, "p50": 10.0, "p95": 28.0, "p99": 29.6}
+    assert [bucket["count"] for bucket in data["buckets"]] == [2, 1, 0]
+    assert data["buckets"][0] == {
+        "bucket_start": START, "count": 2, "volume": 40.0, "p50": 20.0, "p95": 29.0, "p99": 29.8
+    }
+    assert data["buckets"][2]["p50"] is None
+
+    both = charge_timeseries(payments_session, START, START + timedelta(hours=1), 3600,
+                             [PaymentStatus.COMPLETED, PaymentStatus.FAILED], segments=SegmentCache())
+    assert both["totals"]["count"] == 3
+
+
+def test_segment_cache_reuses_settled_days(payments_session):
+    """
+    Whole past days are loaded once and sliced for later ranges; recent days are always queried.
+    """
+    now = datetime.utcnow()
+    _add_payments(
+        payments_session,
+        (START + timedelta(hours=2), 10.0, PaymentStatus.COMPLETED),
+        (START + timedelta(hours=20), 20.0, PaymentStatus.COMPLETED),
+        (START + timedelta(days=1, hours=1), 40.0, PaymentStatus.COMPLETED),
+        (now - timedelta(seconds=5), 80.0, PaymentStatus.COMPLETED),
+    )
+    segments = SegmentCache()
+
+    _, amounts = segments.load(payments_session, START + timedelta(hours=1), START + timedelta(days=2))
+    assert amounts.tolist() == [10.0, 20.0, 40.0]
+    _add_payments(payments_session, (START + timedelta(hours=3), 1000.0, PaymentStatus.COMPLETED))
+    _, amounts = segments.load(payments_session, START + timedelta(hours=10), START + timedelta(days=1, hours=2))
+    assert amounts.tolist() == [20.0, 40.0]
+    assert segments.stats() == {"segments": 2, "rows": 3, "hits": 2, "misses": 2}
+
+    _, amounts = segments.load(payments_session, now - timedelta(minutes=1), now + timedelta(minutes=1))
+    assert amounts.tolist() == [80.0]
+    assert segments.stats()["segments"] == 2
+
+
+def test_segment_cache_evicts_least_recently_used_days(payments_session):
+    _add_payments(payments_session, *[(START + timedelta(days=day), 1.0, PaymentStatus.COMPLETED) for day in range(3)])
+    segments = SegmentCache(max_rows=2)
+
+    segments.load(payments_session, START, START + timedelta(days=3))
+
+    assert segments.stats()["segments"] == 2 and segments.stats()["rows"] == 2
+
+
+@pytest.fixture
+def timeseries_client(payments_session, monkeypatch):
+    """
+    Client whose time series reads go to the in-memory database, with empty caches.
+    """
+    @contextmanager
+    def session_scope():
+        yield payments_session
+
+    monkeypatch.setattr(database, "session_scope", session_scope)
+    monkeypatch.setattr(dashboard_router, "timeseries_cache", ResponseCache(max_entries=4))
+    monkeypatch.setattr(timeseries, "segment_cache", SegmentCache())
+    return TestClient(create_app())
+
+
+def test_timeseries_endpoint_is_cached_per_aligned_range(payments_session, timeseries_client):
+    _add_payments(payments_session, (START + timedelta(minutes=30), 12.0, PaymentStatus.COMPLETED))
+    params = {"start": "2026-03-01T00:10:00", "end": "2026-03-01T01:30:00", "bucket_seconds": 3600}
+
+    first = timeseries_client.get("/dashboard/timeseries", params=params)
+    same_buckets = timeseries_client.get("/dashboard/timeseries", params={**params, "start": "2026-03-01T00:00:00"})
+    not_modified = timeseries_client.get(
+        "/dashboard/timeseries", params=params, headers={"If-None-Match": first.headers["ETag"]}
+    )
+
+    assert first.status_code == 200
+    data = first.json()
+    assert (data["start"], data["end"]) == ("2026-03-01T00:00:00", "2026-03-01T02:00:00")
+    assert data["totals"]["count"] == 1 and [bucket["count"] for bucket in data["buckets"]] == [1, 0]
+    assert same_buckets.content == first.content
+    assert not_modified.status_code == 304
+    assert dashboard_router.timeseries_cache.stats()["hits"] == 2
+
+
+def test_timeseries_endpoint_validates_range(timeseries_client):
+    backwards = {"start": "2026-03-02T00:00:00", "end": "2026-03-01T00:00:00"}
+    assert timeseries_client.get("/dashboard/timeseries", params=backwards).status_code == 400
+    assert timeseries_client.get("/dashboard/timeseries", params={"bucket_seconds": 1}).status_code == 422
+    assert timeseries_client.get("/dashboard/timeseries", params={"status": "UNKNOWN"}).status_code == 422
@@ -104,4 +104,21 @@ class TestRefundCharge:
 
         # Assert
         assert refunded_charge.status == "refunded"  # No change
-        mock_db_session.commit.assert_not_called()  # No new DB write needed if it's already refunded
\ No newline at end of file
+        mock_db_session.commit.assert_not_called()  # No new DB write needed if it's already refunded
+
+
+def test_charge_side_effect_failures_do_not_fail_the_charge(monkeypatch):
+    """
+    Once a charge has gone through, a failing rollup or webhook emit is logged, not raised.
+    """
+    from payments import payments_service
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("side effect failed")
+
+    monkeypatch.setattr(payments_service.dashboard_rollups.rollup_buffer, "record", fail)
+    monkeypatch.setattr(payments_service, "emit_event", fail)
+
+    charge = create_charge("cus_1", 10.0, "card")
+    assert charge["status"] == "successful"
+    assert refund_charge(charge["charge_id"])["status"] == "refunded"
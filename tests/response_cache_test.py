@@ -0,0 +1,182 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, _etag_matches
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Controllable replacement for time.monotonic inside the cache.
+    """
+    now = [1000.0]
+    # Only the cache's view of time is replaced; the event loop keeps the real clock
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _counter(values=None):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if values:
+            value = values.pop(0)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return {"n": len(calls)}
+
+    compute.calls = calls
+    return compute
+
+
+def test_fresh_entries_are_served_without_recomputing(clock):
+    cache = ResponseCache(ttl=2, stale_ttl=10)
+    compute = _counter()
+
+    async def scenario():
+        first = await cache.get("k", compute)
+        clock[0] += 1
+        return first, await cache.get("k", compute)
+
+    first, second = asyncio.run(scenario())
+
+    assert first is second and first.body == b'{"n":1}'
+    assert len(compute.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(clock):
+    """
+    After the TTL, callers keep getting the stale body and only one refresh is started.
+    """
+    cache = ResponseCache(ttl=2, stale_ttl=10)
+    compute = _counter()
+
+    async def scenario():
+        await cache.get("k", compute)
+        clock[0] += 5
+        stale = [await cache.get("k", compute) for _ in range(5)]
+        await asyncio.gather(*cache._refreshing)
+        return stale, await cache.get("k", compute)
+
+    stale, refreshed = asyncio.run(scenario())
+
+    assert {entry.body for entry in stale} == {b'{"n":1}'}
+    assert refreshed.body == b'{"n":2}' and refreshed.etag != stale[0].etag
+    assert len(compute.calls) == 2
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_expired_entry_is_recomputed_before_responding(clock):
+    cache = ResponseCache(ttl=2, stale_ttl=10)
+    compute = _counter()
+
+    async def scenario():
+        await cache.get("k", compute)
+        clock[0] += 20
+        return await cache.get("k", compute)
+
+    assert asyncio.run(scenario()).body == b'{"n":2}'
+
+
+def test_concurrent_misses_share_one_computation(clock):
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return {"ok": True}
+
+    async def scenario():
+        waiters = [asyncio.create_task(cache.get("k", slow)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*waiters)
+
+    entries = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert len({id(entry) for entry in entries}) == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_computation(clock):
+    """
+    The caller that started a computation can go away; the others still get its result.
+    """
+    cache = ResponseCache()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow():
+            calls.append(1)
+            await release.wait()
+            return {"ok": True}
+
+        first = asyncio.create_task(cache.get("k", slow))
+        second = asyncio.create_task(cache.get("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()).body == b'{"ok":true}'
+    assert len(calls) == 1 and len(cache) == 1
+
+
+def test_failed_refresh_keeps_serving_stale_data(clock):
+    cache = ResponseCache(ttl=2, stale_ttl=10)
+    compute = _counter([{"n": 1}, RuntimeError("database down")])
+
+    async def scenario():
+        await cache.get("k", compute)
+        clock[0] += 5
+        await cache.get("k", compute)
+        await asyncio.gather(*cache._refreshing, return_exceptions=True)
+        return await cache.get("k", compute)
+
+    assert asyncio.run(scenario()).body == b'{"n":1}'
+    assert cache.stats()["refresh_errors"] == 1
+
+
+def test_miss_errors_propagate(clock):
+    cache = ResponseCache()
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get("k", _counter([RuntimeError("boom")])))
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ResponseCache(max_entries=2)
+    compute = _counter()
+
+    async def scenario():
+        for key in ("a", "b", "a", "c"):
+            await cache.get(key, compute)
+
+    asyncio.run(scenario())
+    assert list(cache._entries) == ["a", "c"]
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('"xyz"', False),
+])
+def test_etag_matching(header, expected):
+    assert _etag_matches(header, '"abc"') is expected
@@ -0,0 +1,129 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import Column, Integer, Table, create_engine, func, select, update
+from sqlalchemy.orm import Session
+
+import database
+from subscriptions.billing_cycle import billing_period, partition_id_range, run_billing_cycle
+from subscriptions.subscriptions_models import Base, Invoice, Plan, Subscription, UsageAggregate
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    """
+    Provides a file-backed SQLite database seeded with active and inactive subscriptions.
+    A file is used rather than ':memory:' so the worker processes share the data.
+    """
+    if "users" not in Base.metadata.tables:
+        # The subscriptions table references users.id, which lives outside this module.
+        Table("users", Base.metadata, Column("id", Integer, primary_key=True))
+
+    url = f"sqlite:///{tmp_path / 'billing.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        session.add(Plan(id="plan_gold", name="Gold", price=49.99))
+        for index in range(1, 26):
+            session.add(Subscription(user_id=index, plan_type="plan_gold", is_active=index % 5 != 0))
+        session.commit()
+    engine.dispose()
+    return url
+
+
+def _invoice_count(database_url):
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        count = connection.execute(select(func.count()).select_from(Invoice)).scalar_one()
+    engine.dispose()
+    return count
+
+
+def _invoice_numbers(database_url):
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        numbers = connection.execute(select(Invoice.number)).scalars().all()
+    engine.dispose()
+    return numbers
+
+
+def test_billing_period_wraps_year():
+    """
+    Test that the December period ends on the first day of the next year.
+    """
+    assert billing_period(datetime(2024, 12, 15)) == (datetime(2024, 12, 1), datetime(2025, 1, 1))
+
+
+def test_partition_id_range_covers_every_id():
+    """
+    Test that the half-open chunks cover the inclusive ID range exactly once.
+    """
+    assert partition_id_range(1, 10, 4) == [(1, 5), (5, 9), (9, 11)]
+    with pytest.raises(ValueError):
+        partition_id_range(1, 10, 0)
+
+
+def test_run_billing_cycle_invoices_active_subscriptions(database_url):
+    """
+    Test that every active subscription receives exactly one invoice for the period.
+    """
+    progress = []
+    report = run_billing_cycle(
+        period_start=datetime(2025, 3, 1),
+        workers=2,
+        chunk_size=4,
+        database_url=database_url,
+        on_progress=lambda chunk, completed, total: progress.append((completed, total)),
+    )
+
+    assert report["invoiced"] == 20
+    assert report["paid"] == 20
+    assert report["failed_chunks"] == []
+    assert len(report["chunks"]) == 6
+    assert progress[-1] == (6, 6)
+    assert _invoice_count(database_url) == 20
+    numbers = _invoice_numbers(database_url)
+    assert None not in numbers and len(set(numbers)) == 20
+
+
+def test_run_billing_cycle_resume_does_not_double_invoice(database_url):
+    """
+    Test that re-running a completed period writes no additional invoices.
+    """
+    run_billing_cycle(period_start=datetime(2025, 3, 1), workers=2, chunk_size=10, database_url=database_url)
+    report = run_billing_cycle(period_start=datetime(2025, 3, 1), workers=2, chunk_size=10, database_url=database_url)
+
+    assert report["invoiced"] == 0
+    assert _invoice_count(database_url) == 20
+
+
+def test_run_billing_cycle_bills_usage_of_the_closed_period(database_url):
+    """
+    Test that invoices carry the metered usage of the previous period, not of the one being opened.
+    """
+    engine = create_engine(database_url)
+    with Session(engine) as session:
+        session.execute(update(Plan).where(Plan.id == "plan_gold").values(unit_price=0.5))
+        session.add(UsageAggregate(subscription_id=1, period_start=datetime(2025, 2, 1), metric="units", quantity=10.0))
+        session.add(UsageAggregate(subscription_id=1, period_start=datetime(2025, 3, 1), metric="units", quantity=99.0))
+        session.commit()
+
+    run_billing_cycle(period_start=datetime(2025, 3, 1), workers=2, chunk_size=10, database_url=database_url)
+
+    with Session(engine) as session:
+        amounts = dict(session.execute(select(Invoice.subscription_id, Invoice.amount_due)).all())
+    engine.dispose()
+    assert amounts[1] == 54.99
+    assert amounts[2] == 49.99
+
+
+def test_run_billing_cycle_leaves_the_callers_engine_alone(database_url, monkeypatch):
+    """
+    Test that only the worker processes replace their engine, not the process starting the run.
+    """
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(database, "_engine", engine)
+
+    run_billing_cycle(period_start=datetime(2025, 3, 1), workers=2, chunk_size=10, database_url=database_url)
+
+    assert database._engine is engine
+    engine.dispose()
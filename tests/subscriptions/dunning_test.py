@@ -0,0 +1,206 @@
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+
+from payments import payments_service
+from subscriptions import dunning
+from subscriptions.dunning import (
+    DUNNING_CLAIM_LEASE,
+    DUNNING_SCHEDULE,
+    collect_invoices,
+    open_first_attempts,
+    run_dunning_tick,
+    schedule_retry,
+)
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.subscriptions_models import DunningAttempt, Invoice, Subscription
+from subscriptions.subscriptions_service import generate_invoice
+
+FAILED_AT = datetime(2025, 4, 1, 9, 0)
+
+
+@pytest.fixture
+def past_due_invoices(subscriptions_session):
+    """
+    Creates subscriptions with one failed invoice each and schedules their retries.
+    """
+    invoice_ids = []
+    for index in range(1, 6):
+        subscription = Subscription(user_id=index, plan_type="plan_gold")
+        subscriptions_session.add(subscription)
+        subscriptions_session.flush()
+        invoice = Invoice(
+            subscription_id=subscription.id,
+            period_start=datetime(2025, 4, 1),
+            period_end=datetime(2025, 5, 1),
+            amount_due=49.99,
+        )
+        subscriptions_session.add(invoice)
+        subscriptions_session.commit()
+        schedule_retry(invoice.id, subscriptions_session, failed_at=FAILED_AT)
+        invoice_ids.append(invoice.id)
+    return invoice_ids
+
+
+def _fail(invoice):
+    raise RuntimeError("card_declined")
+
+
+def test_tick_skips_attempts_that_are_not_due(subscriptions_session, past_due_invoices):
+    """
+    Test that nothing is retried before the first delay has elapsed.
+    """
+    summary = run_dunning_tick(subscriptions_session, now=FAILED_AT + timedelta(minutes=30), charge=_fail)
+    assert summary["retried"] == 0
+
+
+def test_tick_marks_successful_retries_paid(subscriptions_session, past_due_invoices):
+    """
+    Test that a successful retry pays the invoice and closes the attempt.
+    """
+    summary = run_dunning_tick(subscriptions_session, now=FAILED_AT + DUNNING_SCHEDULE[0], charge=lambda invoice: None)
+
+    assert summary["succeeded"] == 5
+    assert {subscriptions_session.get(Invoice, id_).status for id_ in past_due_invoices} == {"paid"}
+
+
+def test_final_failure_downgrades_subscription(subscriptions_session, past_due_invoices):
+    """
+    Test that the schedule is followed and the subscription is deactivated after the last retry.
+    """
+    now = FAILED_AT
+    for delay in DUNNING_SCHEDULE:
+        now += delay
+        summary = run_dunning_tick(subscriptions_session, now=now, charge=_fail)
+        assert summary["retried"] == 5
+
+    assert summary["exhausted"] == 5
+    attempt = subscriptions_session.query(DunningAttempt).first()
+    assert attempt.status == "exhausted"
+    assert attempt.last_error == "card_declined"
+    subscription = subscriptions_session.get(Subscription, attempt.subscription_id)
+    assert subscription.is_active is False
+
+
+def test_tick_respects_batch_size_and_concurrency(subscriptions_session, past_due_invoices):
+    """
+    Test that one tick retries at most batch_size attempts with at most
+    max_concurrency payment calls in flight.
+    """
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_charge(invoice):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+
+    summary = run_dunning_tick(
+        subscriptions_session, now=FAILED_AT + DUNNING_SCHEDULE[0], batch_size=4, max_concurrency=2, charge=slow_charge
+    )
+
+    assert summary["retried"] == 4
+    assert peak <= 2
+
+
+def _new_invoice(subscriptions_session, user_id):
+    subscription = Subscription(user_id=user_id, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.flush()
+    invoice = Invoice(
+        subscription_id=subscription.id,
+        period_start=datetime(2025, 4, 1),
+        period_end=datetime(2025, 5, 1),
+        amount_due=49.99,
+        status="unpaid",
+    )
+    subscriptions_session.add(invoice)
+    subscriptions_session.flush()
+    invoice_data = {"invoice_id": invoice.id, "subscription_id": subscription.id, "customer_id": user_id,
+                    "amount_due": 49.99}
+    open_first_attempts(subscriptions_session, [invoice_data], now=FAILED_AT)
+    subscriptions_session.commit()
+    return invoice_data
+
+
+def test_collect_invoices_enrolls_failed_payments(subscriptions_session):
+    """
+    Test that new invoices are paid when the charge succeeds and enrolled in dunning when it fails.
+    """
+    invoices = [_new_invoice(subscriptions_session, user_id) for user_id in (1, 2, 3)]
+
+    def charge(invoice):
+        if invoice["customer_id"] == 2:
+            raise RuntimeError("card_declined")
+
+    summary = collect_invoices(subscriptions_session, invoices, now=FAILED_AT, charge=charge)
+
+    assert summary == {"paid": 2, "past_due": 1}
+    statuses = {invoice["customer_id"]: subscriptions_session.get(Invoice, invoice["invoice_id"]).status
+                for invoice in invoices}
+    assert statuses == {1: "paid", 2: "past_due", 3: "paid"}
+    attempt = subscriptions_session.query(DunningAttempt).filter_by(status="scheduled").one()
+    assert attempt.invoice_id == invoices[1]["invoice_id"]
+    assert attempt.attempts == 0
+    assert attempt.next_attempt_at == FAILED_AT + DUNNING_SCHEDULE[0]
+    assert attempt.last_error == "card_declined"
+
+
+def test_generate_invoice_enrolls_failed_payment(subscriptions_session, monkeypatch):
+    """
+    Test that an invoice whose first payment fails is left past due and retried by dunning.
+    """
+    def decline(customer_id, amount, payment_method):
+        raise payments_service.PaymentServiceError("card_declined")
+
+    monkeypatch.setattr(payments_service, "create_charge", decline)
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 49.99}, subscriptions_session)
+    subscription = Subscription(user_id=1, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    invoice = generate_invoice(subscription.id, db_session=subscriptions_session)
+    catalog.clear()
+
+    assert invoice["status"] == "past_due"
+    attempt = subscriptions_session.query(DunningAttempt).one()
+    assert attempt.invoice_id == invoice["invoice_id"]
+    assert attempt.status == "scheduled"
+
+
+def test_invoice_left_uncollected_is_charged_by_the_scheduler(subscriptions_session, monkeypatch):
+    """
+    Test that an invoice whose issuer failed before collecting it keeps a dunning
+    attempt, which the scheduler picks up once the issuer's lease lapses.
+    """
+    def crash(*args, **kwargs):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(dunning, "collect_invoices", crash)
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 49.99}, subscriptions_session)
+    subscription = Subscription(user_id=1, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    with pytest.raises(RuntimeError):
+        generate_invoice(subscription.id, db_session=subscriptions_session)
+    catalog.clear()
+
+    attempt = subscriptions_session.query(DunningAttempt).one()
+    lease_end = attempt.next_attempt_at
+    assert lease_end > datetime.utcnow() + DUNNING_CLAIM_LEASE / 2
+    assert run_dunning_tick(subscriptions_session, now=datetime.utcnow(), charge=_fail)["retried"] == 0
+    summary = run_dunning_tick(subscriptions_session, now=lease_end, charge=_fail)
+
+    assert summary == {"retried": 1, "succeeded": 0, "rescheduled": 1, "exhausted": 0}
+    subscriptions_session.refresh(attempt)
+    # The scheduler made the first payment, so the retry schedule starts from scratch
+    assert attempt.attempts == 0
+    assert attempt.next_attempt_at == lease_end + DUNNING_SCHEDULE[0]
+    assert subscriptions_session.get(Invoice, attempt.invoice_id).status == "past_due"
@@ -0,0 +1,84 @@
+import pytest
+
+from subscriptions.invoice_numbering import InvoiceNumberAllocator
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.subscriptions_models import InvoiceNumberSequence, Subscription
+from subscriptions.subscriptions_service import generate_invoice
+
+
+def test_allocator_reserves_one_block_per_block_size(subscriptions_session):
+    """
+    Test that numbers are handed out locally and the database is hit once per block.
+    """
+    allocator = InvoiceNumberAllocator(block_size=10)
+
+    numbers = [allocator.next_number("acct_1", db_session=subscriptions_session) for _ in range(25)]
+
+    assert numbers == list(range(1, 26))
+    assert allocator.stats()["round_trips"] == 3
+    assert subscriptions_session.get(InvoiceNumberSequence, "acct_1").next_value == 31
+
+
+def test_workers_never_issue_the_same_number(subscriptions_session):
+    """
+    Test that allocators standing in for separate workers draw disjoint blocks.
+    """
+    workers = [InvoiceNumberAllocator(block_size=5) for _ in range(3)]
+    issued = []
+    for _ in range(2):
+        for allocator in workers:
+            issued.extend(allocator.allocate("acct_1", 6, db_session=subscriptions_session))
+
+    assert len(issued) == len(set(issued)) == 36
+
+
+def test_allocate_large_batch_uses_single_round_trip(subscriptions_session):
+    """
+    Test that a request larger than the block size is reserved in one trip.
+    """
+    allocator = InvoiceNumberAllocator(block_size=10)
+
+    numbers = allocator.allocate("acct_2", 250, db_session=subscriptions_session)
+
+    assert numbers == list(range(1, 251))
+    assert allocator.round_trips == 1
+
+
+def test_generate_invoice_persists_numbered_invoice_once(subscriptions_session):
+    """
+    Test that generating twice in one period returns the same stored, numbered invoice.
+    """
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 49.99}, subscriptions_session)
+    subscription = Subscription(user_id=1, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    first = generate_invoice(subscription.id, db_session=subscriptions_session)
+    second = generate_invoice(subscription.id, db_session=subscriptions_session)
+    catalog.clear()
+
+    assert first["invoice_number"] is not None
+    assert first == second
+
+
+def test_generate_invoice_survives_event_delivery_failure(subscriptions_session, monkeypatch):
+    """
+    Test that a failure to emit invoice.created is logged and the committed invoice still returned.
+    """
+    from subscriptions import subscriptions_service
+
+    def unavailable(event_type, data):
+        raise RuntimeError("delivery queue unavailable")
+
+    monkeypatch.setattr(subscriptions_service, "emit_event", unavailable)
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 49.99}, subscriptions_session)
+    subscription = Subscription(user_id=1, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    invoice = generate_invoice(subscription.id, db_session=subscriptions_session)
+    again = generate_invoice(subscription.id, db_session=subscriptions_session)
+    catalog.clear()
+
+    assert invoice["invoice_number"] is not None
+    assert again == invoice
@@ -0,0 +1,66 @@
+import pytest
+
+from subscriptions.plan_catalog import PlanCatalog, bump_catalog_version, read_catalog_version, upsert_plan, catalog
+from subscriptions.subscriptions_models import Plan
+from subscriptions.subscriptions_service import calculate_amount_due
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog():
+    """
+    Keeps the module-level catalog from leaking between tests.
+    """
+    yield
+    catalog.clear()
+
+
+def test_upsert_plan_bumps_version_and_refreshes_cache(subscriptions_session):
+    """
+    Test that writing a plan bumps the version stamp and is immediately visible locally.
+    """
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 49.99}, subscriptions_session)
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 59.99}, subscriptions_session)
+
+    assert read_catalog_version(subscriptions_session) == 2
+    assert catalog.version == 2
+    assert calculate_amount_due("plan_gold") == 59.99
+
+
+def test_other_worker_reloads_when_version_changes(subscriptions_session):
+    """
+    Test that a second catalog (standing in for another worker) only reloads
+    once the version stamp has moved.
+    """
+    other_worker = PlanCatalog()
+    upsert_plan({"id": "plan_silver", "name": "Silver", "price": 19.0}, subscriptions_session)
+    assert other_worker.refresh_if_changed(subscriptions_session) is True
+    assert other_worker.refresh_if_changed(subscriptions_session) is False
+
+    subscriptions_session.add(Plan(id="plan_bronze", name="Bronze", price=9.0))
+    bump_catalog_version(subscriptions_session)
+    subscriptions_session.commit()
+
+    assert other_worker.refresh_if_changed(subscriptions_session) is True
+    assert other_worker.get("plan_bronze")["price"] == 9.0
+
+
+def test_require_rejects_unknown_and_inactive_plans(subscriptions_session):
+    """
+    Test that unknown plans always fail and retired plans fail for new sign-ups only.
+    """
+    upsert_plan({"id": "plan_legacy", "name": "Legacy", "price": 5.0, "is_active": False}, subscriptions_session)
+
+    assert catalog.require("plan_legacy")["price"] == 5.0
+    with pytest.raises(ValueError):
+        catalog.require("plan_legacy", active_only=True)
+    with pytest.raises(ValueError):
+        calculate_amount_due("plan_missing")
+
+
+def test_upsert_plan_rejects_intervals_that_are_not_billed(subscriptions_session):
+    """
+    Test that only monthly plans can be stored, since invoices are issued once a month.
+    """
+    with pytest.raises(ValueError):
+        upsert_plan({"id": "plan_yearly", "name": "Yearly", "price": 120.0, "interval": "year"}, subscriptions_session)
+    assert catalog.get("plan_yearly") is None
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from datetime import datetime
+
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.proration import prorate, prorate_batch
+from subscriptions.subscriptions_models import Subscription
+from subscriptions.subscriptions_service import cancel_subscription, migrate_subscriptions_plan
+
+PERIOD_START = datetime(2025, 4, 1)
+PERIOD_END = datetime(2025, 5, 1)
+
+
+@pytest.fixture
+def plans(subscriptions_session):
+    """
+    Seeds the plan catalog used to price the subscriptions.
+    """
+    upsert_plan({"id": "plan_silver", "name": "Silver", "price": 30.0}, subscriptions_session)
+    upsert_plan({"id": "plan_gold", "name": "Gold", "price": 60.0}, subscriptions_session)
+    yield
+    catalog.clear()
+
+
+def test_prorate_cancellation_mid_period():
+    """
+    Test that cancelling halfway through a 30-day period credits half the price.
+    """
+    result = prorate(PERIOD_START, PERIOD_END, 30.0, datetime(2025, 4, 16))
+
+    assert result["unused_fraction"] == pytest.approx(0.5)
+    assert result["credit"] == 15.0
+    assert result["charge"] == 0.0
+    assert result["net"] == -15.0
+
+
+def test_prorate_batch_matches_single_item():
+    """
+    Test that the vectorized path agrees with the single-item path, including
+    changes before the period starts and after it ends.
+    """
+    changed_at = [datetime(2025, 3, 20), datetime(2025, 4, 11), datetime(2025, 5, 5)]
+    prices = [30.0, 60.0, 90.0]
+    new_prices = [45.0, 45.0, 45.0]
+
+    batch = prorate_batch(
+        [PERIOD_START] * 3, [PERIOD_END] * 3, prices, changed_at, new_prices
+    )
+
+    for index in range(3):
+        single = prorate(PERIOD_START, PERIOD_END, prices[index], changed_at[index], new_prices[index])
+        assert batch["net"][index] == pytest.approx(single["net"])
+    np.testing.assert_allclose(batch["unused_fraction"], [1.0, 2 / 3, 0.0])
+
+
+def test_prorate_batch_rejects_empty_periods():
+    """
+    Test that a period ending before it starts is rejected.
+    """
+    with pytest.raises(ValueError):
+        prorate_batch([PERIOD_END], [PERIOD_START], [10.0], [PERIOD_START])
+
+
+def test_cancel_subscription_credits_unused_period(subscriptions_session, plans):
+    """
+    Test that cancelling with a session deactivates the subscription and reports the credit.
+    """
+    subscription = Subscription(user_id=1, plan_type="plan_gold")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    result = cancel_subscription(subscription.id, db_session=subscriptions_session, canceled_at=datetime(2025, 4, 16))
+
+    assert result["status"] == "canceled"
+    assert result["prorated_credit"] > 0
+    assert subscriptions_session.get(Subscription, subscription.id).is_active is False
+
+
+def test_migrate_subscriptions_plan_updates_batch(subscriptions_session, plans):
+    """
+    Test that a bulk migration changes every plan and returns per-subscription proration.
+    """
+    subscriptions = [Subscription(user_id=index, plan_type="plan_silver") for index in range(1, 6)]
+    subscriptions_session.add_all(subscriptions)
+    subscriptions_session.commit()
+    ids = [subscription.id for subscription in subscriptions]
+
+    result = migrate_subscriptions_plan(ids, "plan_gold", subscriptions_session, changed_at=datetime(2025, 4, 16))
+
+    assert result["migrated"] == 5
+    assert result["net_total"] == pytest.approx(5 * 15.0)
+    assert {item["subscription_id"] for item in result["items"]} == set(ids)
+    subscriptions_session.expire_all()
+    assert all(subscriptions_session.get(Subscription, id_).plan_type == "plan_gold" for id_ in ids)
+
+
+def test_migrate_subscriptions_plan_rejects_unknown_ids(subscriptions_session, plans):
+    """
+    Test that the migration fails before writing anything when an ID is unknown.
+    """
+    with pytest.raises(ValueError):
+        migrate_subscriptions_plan([12345], "plan_gold", subscriptions_session)
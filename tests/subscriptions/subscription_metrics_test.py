@@ -0,0 +1,73 @@
+import pytest
+from datetime import date, datetime
+
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.subscription_metrics import (
+    get_daily_subscription_metrics,
+    get_subscription_metrics,
+    rebuild_subscription_metrics,
+)
+from subscriptions.subscriptions_service import cancel_subscription, create_subscription, migrate_subscriptions_plan
+
+
+@pytest.fixture
+def plans(subscriptions_session):
+    """
+    Seeds two monthly plans.
+    """
+    upsert_plan({"id": "plan_monthly", "name": "Monthly", "price": 20.0}, subscriptions_session)
+    upsert_plan({"id": "plan_basic", "name": "Basic", "price": 10.0}, subscriptions_session)
+    yield
+    catalog.clear()
+
+
+def _plan(metrics, plan_id):
+    return next(plan for plan in metrics["plans"] if plan["plan_id"] == plan_id)
+
+
+def test_create_cancel_and_migrate_maintain_aggregates(subscriptions_session, plans):
+    """
+    Test that every subscription change keeps the per-plan counts and MRR current.
+    """
+    ids = [create_subscription(index, "plan_monthly", db_session=subscriptions_session)["subscription_id"]
+           for index in range(1, 5)]
+    create_subscription(9, "plan_basic", db_session=subscriptions_session)
+    cancel_subscription(ids[0], db_session=subscriptions_session)
+    migrate_subscriptions_plan(ids[1:3], "plan_basic", subscriptions_session)
+
+    metrics = get_subscription_metrics(subscriptions_session)
+
+    assert metrics["active_subscriptions"] == 4
+    assert _plan(metrics, "plan_monthly")["active_count"] == 1
+    assert _plan(metrics, "plan_basic")["active_count"] == 3
+    assert metrics["mrr"] == {"usd": 20.0 + 3 * 10.0}
+
+
+def test_cancel_twice_does_not_double_count(subscriptions_session, plans):
+    """
+    Test that a repeated cancellation is rejected instead of decrementing again.
+    """
+    subscription_id = create_subscription(1, "plan_monthly", db_session=subscriptions_session)["subscription_id"]
+    cancel_subscription(subscription_id, db_session=subscriptions_session)
+
+    with pytest.raises(ValueError):
+        cancel_subscription(subscription_id, db_session=subscriptions_session)
+    assert get_subscription_metrics(subscriptions_session)["active_subscriptions"] == 0
+
+
+def test_rebuild_matches_incremental_aggregates(subscriptions_session, plans):
+    """
+    Test that a full rebuild reproduces the incrementally maintained rows.
+    """
+    ids = [create_subscription(index, "plan_monthly", db_session=subscriptions_session)["subscription_id"]
+           for index in range(1, 4)]
+    cancel_subscription(ids[0], db_session=subscriptions_session, canceled_at=datetime.utcnow())
+    incremental = get_subscription_metrics(subscriptions_session)
+    today = datetime.utcnow().date()
+    incremental_daily = get_daily_subscription_metrics(subscriptions_session, since=date(2000, 1, 1))
+
+    rebuild_subscription_metrics(subscriptions_session)
+
+    assert get_subscription_metrics(subscriptions_session) == incremental
+    assert get_daily_subscription_metrics(subscriptions_session, since=date(2000, 1, 1)) == incremental_daily
+    assert incremental_daily == [{"day": today, "started": 3, "canceled": 1}]
@@ -102,4 +102,31 @@ def test_cancel_subscription_not_found(client, mock_db_session):
         response = client.post(f"/subscriptions/{subscription_id}/cancel")
 
     assert response.status_code == 404
-    assert "detail" in response.json()
\ No newline at end of file
+    assert "detail" in response.json()
+
+def test_plan_changes_require_an_admin_token(subscriptions_session, admin_headers):
+    """
+    Test that plans can only be written and subscriptions only bulk-migrated by operators.
+    """
+    from database import get_db
+    from subscriptions.plan_catalog import catalog
+
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: subscriptions_session
+    client = TestClient(app)
+    plan = {"id": "plan_gold", "name": "Gold", "price": 49.99}
+    migration = {"subscription_ids": [1], "new_plan_id": "plan_gold"}
+
+    assert client.put("/subscriptions/plans/plan_gold", json=plan).status_code == 401
+    assert client.post("/subscriptions/migrate-plan", json=migration).status_code == 401
+    bad_token = {"Authorization": "Bearer wrong"}
+    assert client.put("/subscriptions/plans/plan_gold", json=plan, headers=bad_token).status_code == 403
+    assert catalog.get("plan_gold") is None
+
+    response = client.put("/subscriptions/plans/plan_gold", json=plan, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["price"] == 49.99
+    yearly = dict(plan, interval="year")
+    assert client.put("/subscriptions/plans/plan_gold", json=yearly, headers=admin_headers).status_code == 422
+    assert client.post("/subscriptions/migrate-plan", json=migration, headers=admin_headers).status_code != 401
+    catalog.clear()
@@ -202,4 +202,81 @@ def test_generate_invoice_db_error(mock_log_error, test_db):
         generate_invoice(subscription_id)
 
     # Verify error logging was called
-    mock_log_error.assert_called_once()
\ No newline at end of file
+    mock_log_error.assert_called_once()
+
+# -------------------------------------------------------------------
+# Tests for list_subscriptions(db_session, ...)
+# -------------------------------------------------------------------
+
+@pytest.fixture
+def listed_subscriptions(subscriptions_session):
+    """
+    Seeds subscriptions across two customers, two plans and both statuses.
+    """
+    from subscriptions.subscriptions_models import Subscription
+
+    for index in range(12):
+        subscriptions_session.add(Subscription(
+            user_id=1 if index % 2 == 0 else 2,
+            plan_type="plan_gold" if index % 3 == 0 else "plan_silver",
+            is_active=index % 4 != 0,
+        ))
+    subscriptions_session.commit()
+    return subscriptions_session
+
+
+def test_list_subscriptions_filters_and_pages(listed_subscriptions):
+    """
+    Test that keyset pages cover every matching subscription exactly once, in ID order.
+    """
+    from subscriptions.subscriptions_service import list_subscriptions
+
+    seen = []
+    cursor = None
+    while True:
+        page = list_subscriptions(listed_subscriptions, customer_id=1, status="active", starting_after=cursor, limit=2)
+        seen.extend(item["subscription_id"] for item in page["data"])
+        if not page["has_more"]:
+            break
+        cursor = page["next_cursor"]
+
+    assert seen == sorted(seen)
+    assert len(seen) == 3  # customer 1 owns indexes 0, 2, 4, 6, 8, 10; 0, 4 and 8 are canceled
+
+
+def test_list_subscriptions_rejects_unknown_status(listed_subscriptions):
+    """
+    Test that an unsupported status filter is rejected.
+    """
+    from subscriptions.subscriptions_service import list_subscriptions
+
+    with pytest.raises(ValueError):
+        list_subscriptions(listed_subscriptions, status="paused")
+
+
+def test_list_subscriptions_uses_composite_index(listed_subscriptions):
+    """
+    Test that the query list_subscriptions issues for one customer's active
+    subscriptions is served by an index, not a table scan.
+    """
+    from sqlalchemy import event
+    from subscriptions.subscriptions_service import list_subscriptions
+
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = listed_subscriptions.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        list_subscriptions(listed_subscriptions, customer_id=1, status="active", starting_after=1)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    plan = listed_subscriptions.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    details = " ".join(row[-1] for row in plan)
+
+    assert "ix_subscriptions_user_id_is_active_id" in details
+    assert "SCAN subscriptions" not in details
@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime
+
+from subscriptions.plan_catalog import catalog, upsert_plan
+from subscriptions.proration import billing_period, previous_period
+from subscriptions.subscriptions_models import Subscription
+from subscriptions.subscriptions_service import generate_invoice
+from subscriptions.usage_metering import UsageBuffer, UsageBufferFullError, usage_totals
+
+APRIL = datetime(2025, 4, 1)
+
+
+def test_record_sums_events_per_subscription_period_and_metric():
+    """
+    Test that repeated events collapse into a single buffered key.
+    """
+    buffer = UsageBuffer(max_keys=10)
+    for _ in range(1000):
+        buffer.record(7, 1.5, timestamp=datetime(2025, 4, 3))
+    buffer.record(7, 2.0, metric="api_calls", timestamp=datetime(2025, 4, 9))
+
+    assert buffer.drain() == {(7, APRIL, "units"): 1500.0, (7, APRIL, "api_calls"): 2.0}
+
+
+def test_record_many_rejects_batch_that_overflows_buffer():
+    """
+    Test that a full buffer rejects new keys without partially applying the batch,
+    while events for keys already buffered are still accepted.
+    """
+    buffer = UsageBuffer(max_keys=2)
+    buffer.record(1, 1.0, timestamp=APRIL)
+
+    with pytest.raises(UsageBufferFullError):
+        buffer.record_many([(1, 1.0, "units", APRIL), (2, 1.0, "units", APRIL), (3, 1.0, "units", APRIL)])
+    assert len(buffer) == 1
+
+    buffer.record(1, 1.0, timestamp=APRIL)
+    assert buffer.drain() == {(1, APRIL, "units"): 2.0}
+
+
+def test_flush_upserts_pre_summed_rows(subscriptions_session):
+    """
+    Test that successive flushes add to the stored aggregate instead of inserting duplicates.
+    """
+    buffer = UsageBuffer()
+    buffer.record(3, 10.0, timestamp=APRIL)
+    assert buffer.flush(subscriptions_session) == 1
+    buffer.record(3, 5.0, timestamp=APRIL)
+    buffer.flush(subscriptions_session)
+
+    assert usage_totals(subscriptions_session, 3, APRIL) == {"units": 15.0}
+    assert len(buffer) == 0
+
+
+def test_generate_invoice_bills_flushed_usage(subscriptions_session):
+    """
+    Test that metered plans are invoiced from the flushed aggregates of the period
+    that just closed, with each metric at its own unit price.
+    """
+    upsert_plan(
+        {"id": "plan_metered", "name": "Metered", "price": 10.0, "unit_price": 0.5,
+         "metric_prices": {"api_calls": 0.01}},
+        subscriptions_session,
+    )
+    subscription = Subscription(user_id=1, plan_type="plan_metered")
+    subscriptions_session.add(subscription)
+    subscriptions_session.commit()
+
+    current_start, _ = billing_period()
+    closed_start, _ = previous_period(current_start)
+    buffer = UsageBuffer()
+    buffer.record(subscription.id, 40.0, timestamp=closed_start)
+    buffer.record(subscription.id, 100.0, metric="api_calls", timestamp=closed_start)
+    buffer.record(subscription.id, 5.0, metric="storage_gb", timestamp=closed_start)
+    buffer.record(subscription.id, 1000.0, timestamp=current_start)
+    buffer.flush(subscriptions_session)
+
+    invoice = generate_invoice(subscription.id, db_session=subscriptions_session)
+    catalog.clear()
+
+    assert invoice["amount_due"] == 31.0
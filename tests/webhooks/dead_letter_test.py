@@ -0,0 +1,204 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import get_db
+from main import create_app
+
+from webhooks.dead_letter import list_dead_letters, redrive
+from webhooks.event_registry import handler_name, registry
+from webhooks.webhooks_models import DeadLetterEvent, WebhookPayload
+from webhooks.webhooks_signature import sign_payload
+
+
+def _payload(event_id, event_type="dlq.test", n=1):
+    return WebhookPayload.model_validate(
+        {"event": {"event_id": event_id, "event_type": event_type}, "data": {"n": n}}
+    )
+
+
+@pytest.fixture
+def handler_calls(monkeypatch):
+    """
+    Registers a 'dlq.test' handler that fails while 'failing' is true.
+    """
+    state = {"failing": True, "calls": []}
+
+    def handler(data):
+        state["calls"].append(data["n"])
+        if state["failing"]:
+            raise RuntimeError("downstream unavailable")
+
+    monkeypatch.setitem(registry._handlers, "dlq.test", [handler])
+    monkeypatch.setattr(registry, "_resolved", {})
+    return state
+
+
+def test_dispatch_retries_then_dead_letters(dead_letter_store, webhooks_session, handler_calls):
+    """
+    An event whose handler keeps failing is retried and then recorded with its error and timing.
+    """
+    assert dead_letter_store.dispatch(_payload("evt_1")) is False
+
+    assert handler_calls["calls"] == [1, 1, 1]
+    row = webhooks_session.query(DeadLetterEvent).one()
+    assert (row.event_id, row.event_type, row.status, row.attempts) == ("evt_1", "dlq.test", "dead", 3)
+    assert row.error == "RuntimeError: downstream unavailable"
+    assert row.received_at <= row.first_failed_at <= row.last_failed_at
+    assert _payload("evt_1") == WebhookPayload.model_validate_json(row.payload)
+
+
+def test_dispatch_recovers_within_retries(dead_letter_store, webhooks_session, handler_calls, monkeypatch):
+    """
+    A transient failure that clears before the retries run out is not dead-lettered.
+    """
+    def recover(data):
+        handler_calls["failing"] = False
+
+    monkeypatch.setitem(registry._handlers, "dlq.test", registry._handlers["dlq.test"] + [recover])
+    monkeypatch.setattr(registry, "_resolved", {})
+
+    assert dead_letter_store.dispatch(_payload("evt_1")) is True
+    assert webhooks_session.query(DeadLetterEvent).count() == 0
+
+
+def test_only_the_failing_handler_is_retried_and_redriven(
+    dead_letter_store, webhooks_session, handler_calls, monkeypatch
+):
+    """
+    A handler that succeeded is neither retried with the failing one nor run again by the redrive.
+    """
+    failing_handler = registry._handlers["dlq.test"][0]
+    applied = []
+    monkeypatch.setitem(registry._handlers, "dlq.test", [applied.append, failing_handler])
+    monkeypatch.setattr(registry, "_resolved", {})
+
+    assert dead_letter_store.dispatch(_payload("evt_1")) is False
+
+    assert applied == [{"n": 1}]
+    assert handler_calls["calls"] == [1, 1, 1]
+    row = webhooks_session.query(DeadLetterEvent).one()
+    assert row.handler == handler_name(failing_handler)
+
+    handler_calls["failing"] = False
+    assert redrive(webhooks_session) == {"selected": 1, "redriven": 1, "failed": 0}
+    assert applied == [{"n": 1}]
+    assert handler_calls["calls"] == [1, 1, 1, 1]
+
+
+def test_redrive_fails_when_the_handler_is_gone(dead_letter_store, webhooks_session, handler_calls, monkeypatch):
+    """
+    A row whose handler was removed stays dead instead of running the type's other handlers.
+    """
+    dead_letter_store.dispatch(_payload("evt_1"))
+    applied = []
+    monkeypatch.setitem(registry._handlers, "dlq.test", [applied.append])
+    monkeypatch.setattr(registry, "_resolved", {})
+
+    assert redrive(webhooks_session) == {"selected": 1, "redriven": 0, "failed": 1}
+    assert applied == []
+    assert "no longer registered" in list_dead_letters(webhooks_session)[0]["error"]
+
+
+def test_redrive_filters_and_updates_status(dead_letter_store, webhooks_session, handler_calls):
+    """
+    Redrive only touches the selected events, marks successes and records repeated failures.
+    """
+    for index in range(3):
+        dead_letter_store.dispatch(_payload(f"evt_{index}", n=index))
+    other = webhooks_session.query(DeadLetterEvent).filter_by(event_id="evt_2").one()
+    other.error = "ValueError: bad data"
+    webhooks_session.commit()
+
+    summary = redrive(webhooks_session, event_type="dlq.test", error_contains="downstream")
+    assert summary == {"selected": 2, "redriven": 0, "failed": 2}
+    assert {row["attempts"] for row in list_dead_letters(webhooks_session)} == {3, 4}
+
+    handler_calls["failing"] = False
+    assert redrive(webhooks_session, limit=1) == {"selected": 1, "redriven": 1, "failed": 0}
+
+    redriven = list_dead_letters(webhooks_session, status="redriven")
+    assert [row["event_id"] for row in redriven] == ["evt_0"]
+    assert redriven[0]["redriven_at"] is not None
+    assert [row["event_id"] for row in list_dead_letters(webhooks_session)] == ["evt_1", "evt_2"]
+
+
+def test_redrive_since_until(dead_letter_store, webhooks_session, handler_calls):
+    """
+    The time window selects events by when they last failed.
+    """
+    dead_letter_store.dispatch(_payload("evt_old"))
+    dead_letter_store.dispatch(_payload("evt_new"))
+    old = webhooks_session.query(DeadLetterEvent).filter_by(event_id="evt_old").one()
+    old.last_failed_at = datetime.utcnow() - timedelta(days=2)
+    webhooks_session.commit()
+    handler_calls["failing"] = False
+
+    summary = redrive(webhooks_session, until=datetime.utcnow() - timedelta(days=1))
+
+    assert summary["redriven"] == 1
+    assert [row["event_id"] for row in list_dead_letters(webhooks_session)] == ["evt_new"]
+
+
+def test_redrive_rate_limit(dead_letter_store, webhooks_session, handler_calls):
+    """
+    Redrive waits between events so it stays under the requested rate.
+    """
+    for index in range(3):
+        dead_letter_store.dispatch(_payload(f"evt_{index}"))
+    handler_calls["failing"] = False
+
+    started = time.monotonic()
+    redrive(webhooks_session, rate=20)
+
+    assert time.monotonic() - started >= 0.1
+
+
+def test_dead_letter_endpoints(
+    webhook_deduplicator, dead_letter_store, webhooks_session, handler_calls, monkeypatch, admin_headers
+):
+    """
+    A failing delivery is acknowledged once dead-lettered, listed, and redriven through the API.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: webhooks_session
+    client = TestClient(app)
+    body = b'{"event": {"event_id": "evt_1", "event_type": "dlq.test"}, "data": {"n": 1}}'
+
+    response = client.post(
+        "/webhooks/webhook", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+    )
+    assert response.status_code == 200
+
+    assert client.get("/webhooks/dead-letters").status_code == 401
+    assert client.post("/webhooks/dead-letters/redrive", json={"rate": 1000}).status_code == 401
+    listed = client.get("/webhooks/dead-letters", params={"event_type": "dlq.test"}, headers=admin_headers).json()
+    assert [(row["event_id"], row["attempts"]) for row in listed] == [("evt_1", 3)]
+
+    handler_calls["failing"] = False
+    response = client.post(
+        "/webhooks/dead-letters/redrive", json={"event_type": "dlq.test", "rate": 1000}, headers=admin_headers
+    )
+    assert response.json() == {"selected": 1, "redriven": 1, "failed": 0}
+    assert client.get("/webhooks/dead-letters", headers=admin_headers).json() == []
+
+
+def test_failed_dead_letter_write_releases_claim(webhook_deduplicator, handler_calls, monkeypatch):
+    """
+    If the event cannot be recorded, its claim is released so the sender's retry is processed.
+    """
+    from webhooks import dead_letter
+    from webhooks.webhooks_router import webhook_receiver_endpoint
+
+    def unavailable():
+        raise RuntimeError("database unavailable")
+
+    store = dead_letter.DeadLetterStore(max_attempts=1, retry_delay=0, session_factory=unavailable)
+    monkeypatch.setattr(dead_letter, "dead_letter_store", store)
+
+    with pytest.raises(RuntimeError):
+        webhook_receiver_endpoint(_payload("evt_1"))
+    assert webhook_deduplicator.claim("evt_1", "dlq.test") is True
@@ -0,0 +1,204 @@
+import json
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+
+from webhooks import event_log as event_log_module
+from webhooks.event_log import EventLog, main, replay
+
+
+def _body(index):
+    return json.dumps(
+        {"event": {"event_id": f"evt_{index}", "event_type": "log.test"}, "data": {"n": index}}
+    ).encode()
+
+
+@pytest.fixture
+def filled_log(tmp_path, monkeypatch):
+    """
+    An event log with 300 events spread over several small segments, one second apart.
+    """
+    monkeypatch.setattr(event_log_module, "INDEX_INTERVAL_BYTES", 512)
+    log = EventLog(str(tmp_path), segment_bytes=4096)
+    log.open()
+    for index in range(300):
+        log.append(_body(index), received_at=1_700_000_000 + index)
+    log.flush()
+    yield log
+    log.close()
+
+
+def test_appends_roll_segments_and_read_back_in_order(filled_log, tmp_path):
+    """
+    Segments roll at the size limit, each with an index, and reads return every event in order.
+    """
+    segments = sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))
+    assert len(segments) > 5
+    assert all(os.path.getsize(tmp_path / name) > 0 for name in os.listdir(tmp_path) if name.endswith(".idx"))
+
+    offsets = [offset for offset, _, _ in filled_log.read()]
+    assert offsets == list(range(300))
+
+
+def test_reads_start_at_an_offset_or_timestamp(filled_log):
+    """
+    Reads can start mid-log by offset or by receive time.
+    """
+    from_offset = list(filled_log.read(from_offset=123))
+    assert from_offset[0][0] == 123 and len(from_offset) == 177
+    assert json.loads(from_offset[0][2])["data"]["n"] == 123
+
+    since = list(filled_log.read(since=1_700_000_250))
+    assert [offset for offset, _, _ in since] == list(range(250, 300))
+
+
+def test_timestamp_reads_seek_through_the_index(filled_log, monkeypatch):
+    """
+    A read by receive time opens only the segment holding it and seeks inside it.
+    """
+    scanned = []
+    scan = event_log_module._scan
+
+    def recording_scan(segment, position):
+        scanned.append((os.path.basename(segment.name), position))
+        return scan(segment, position)
+
+    monkeypatch.setattr(event_log_module, "_scan", recording_scan)
+
+    since = list(filled_log.read(since=1_700_000_250))
+
+    assert since[0][0] == 250
+    assert int(scanned[0][0][:-4]) <= 250 < int(scanned[1][0][:-4])
+
+
+def test_reopen_recovers_offset_and_truncates_torn_tail(filled_log, tmp_path):
+    """
+    A partially written record is cut off on reopen, and offsets continue after the last good one.
+    """
+    filled_log.close()
+    last_segment = sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))[-1]
+    with open(tmp_path / last_segment, "ab") as segment:
+        segment.write(b"\x05\x00torn")
+
+    reopened = EventLog(str(tmp_path), segment_bytes=4096)
+    reopened.open()
+    assert reopened.next_offset == 300
+    reopened.append(_body(300))
+    assert [offset for offset, _, _ in reopened.read(from_offset=298)] == [298, 299, 300]
+    reopened.close()
+
+
+def _append_from_process(directory, worker, count):
+    log = EventLog(directory, segment_bytes=4096)
+    log.open()
+    for index in range(count):
+        log.append(json.dumps({"worker": worker, "n": index, "pad": "x" * 200}).encode())
+        if index % 7 == 0:
+            log.flush()
+    log.close()
+
+
+def test_processes_share_one_directory_without_clashing(tmp_path):
+    """
+    Several worker processes appending to the same directory get distinct, gap-free
+    offsets and every record stays readable, across segment rolls.
+    """
+    import multiprocessing
+
+    processes = [
+        multiprocessing.Process(target=_append_from_process, args=(str(tmp_path), worker, 60)) for worker in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    log = EventLog(str(tmp_path), segment_bytes=4096)
+    records = list(log.read())
+    assert [offset for offset, _, _ in records] == list(range(240))
+    bodies = [json.loads(body) for _, _, body in records]
+    for worker in range(4):
+        assert [body["n"] for body in bodies if body["worker"] == worker] == list(range(60))
+    times = [received_at for _, received_at, _ in records]
+    assert times == sorted(times)
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".log")]) > 1
+
+
+def test_unflushed_appends_are_visible_to_readers(tmp_path):
+    """
+    Readers see events still sitting in the write buffer.
+    """
+    log = EventLog(str(tmp_path))
+    log.open()
+    log.append(_body(0))
+    assert [offset for offset, _, _ in log.read()] == [0]
+    log.close()
+
+
+def test_replay_dispatches_with_limit_and_counts_failures(filled_log):
+    """
+    Replay sends parsed payloads to the dispatcher and keeps going past failures.
+    """
+    seen = []
+
+    def dispatch(payload):
+        if payload["data"]["n"] == 12:
+            raise RuntimeError("handler bug")
+        seen.append(payload["data"]["n"])
+
+    summary = replay(filled_log, dispatch, from_offset=10, limit=5, rate=1000)
+
+    assert seen == [10, 11, 13, 14]
+    assert summary == {"replayed": 4, "failed": 1, "last_offset": 14}
+
+
+def test_cli_replays_through_registered_handlers(filled_log, tmp_path, monkeypatch):
+    """
+    The CLI dispatches logged events to the handlers registered for their type.
+    """
+    from webhooks.event_registry import registry
+
+    seen = []
+    monkeypatch.setitem(registry._handlers, "log.test", [lambda data: seen.append(data["n"])])
+    monkeypatch.setattr(registry, "_resolved", {})
+
+    exit_code = main(["replay", "--dir", str(tmp_path), "--from-offset", "295", "--rate", "1000"])
+
+    assert exit_code == 0
+    assert seen == [295, 296, 297, 298, 299]
+
+
+def test_accepted_webhooks_are_logged_and_replayable(tmp_path, monkeypatch, webhook_deduplicator, admin_headers):
+    """
+    Accepted events are appended to the log and can be replayed through the API.
+    """
+    from webhooks.event_registry import registry
+    from webhooks.webhooks_signature import sign_payload
+
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    log = EventLog(str(tmp_path))
+    log.open()
+    monkeypatch.setattr(event_log_module, "event_log", log)
+    seen = []
+    monkeypatch.setitem(registry._handlers, "log.test", [lambda data: seen.append(data["n"])])
+    monkeypatch.setattr(registry, "_resolved", {})
+    client = TestClient(create_app())
+
+    for index in range(3):
+        body = _body(index)
+        response = client.post(
+            "/webhooks/webhook", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+        )
+        assert response.status_code == 200
+    assert [offset for offset, _, _ in log.read()] == [0, 1, 2]
+
+    replay_request = {"from_offset": 1, "limit": 10, "rate": 1000}
+    assert client.post("/webhooks/replay", json=replay_request).status_code == 401
+    response = client.post("/webhooks/replay", json=replay_request, headers=admin_headers)
+
+    assert response.json() == {"replayed": 2, "failed": 0, "last_offset": 2}
+    assert seen == [0, 1, 2, 1, 2]
+    log.close()
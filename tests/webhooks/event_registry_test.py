@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+from webhooks.event_registry import EventRegistry, UnsupportedEventError, registry
+from webhooks.webhooks_service import apply_subscription_renewal_event, handle_charge_succeeded
+from webhooks.webhooks_signature import sign_payload
+
+
+def test_dispatch_calls_exact_and_wildcard_subscribers_in_order():
+    """
+    Exact subscribers run first, then matching wildcard patterns.
+    """
+    events = EventRegistry()
+    calls = []
+
+    @events.on("charge.succeeded")
+    def first(data):
+        calls.append(("first", data["id"]))
+
+    @events.on("charge.succeeded")
+    def second(data):
+        calls.append(("second", data["id"]))
+
+    @events.on("charge.*")
+    def any_charge(data):
+        calls.append(("charge.*", data["id"]))
+
+    @events.on("*")
+    def audit(data):
+        calls.append(("*", data["id"]))
+
+    assert events.dispatch("charge.succeeded", {"id": "ch_1"}) == 4
+    assert events.dispatch("charge.refunded", {"id": "ch_2"}) == 2
+    assert calls == [
+        ("first", "ch_1"), ("second", "ch_1"), ("charge.*", "ch_1"), ("*", "ch_1"),
+        ("charge.*", "ch_2"), ("*", "ch_2"),
+    ]
+
+
+def test_registration_after_dispatch_invalidates_cached_handlers():
+    """
+    Handlers registered later are picked up by the next dispatch.
+    """
+    events = EventRegistry()
+    events.on("invoice.paid")(lambda data: None)
+    assert len(events.handlers_for("invoice.paid")) == 1
+
+    events.on("invoice.*")(lambda data: None)
+    assert len(events.handlers_for("invoice.paid")) == 2
+
+
+def test_dispatch_runs_all_handlers_and_counts_errors():
+    """
+    A failing handler does not stop the others; its error is counted and re-raised.
+    """
+    events = EventRegistry()
+    called = []
+
+    @events.on("charge.succeeded")
+    def broken(data):
+        raise KeyError("id")
+
+    @events.on("charge.succeeded")
+    def healthy(data):
+        called.append(data)
+
+    with pytest.raises(KeyError):
+        events.dispatch("charge.succeeded", {})
+    with pytest.raises(UnsupportedEventError):
+        events.dispatch("unknown.event", {})
+
+    assert called == [{}]
+    stats = events.stats()["charge.succeeded"]
+    assert stats["dispatched"] == 2 and stats["errors"] == 1
+    assert "unknown.event" not in events.stats()
+
+
+def test_service_handlers_are_registered():
+    """
+    The built-in handlers are wired to their event types.
+    """
+    assert handle_charge_succeeded in registry.handlers_for("charge.succeeded")
+    assert apply_subscription_renewal_event in registry.handlers_for("subscription.renewed")
+
+
+def test_receive_webhook_rejects_unsupported_event_type(monkeypatch):
+    """
+    Events without a registered handler are rejected with 400.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    client = TestClient(create_app())
+    body = b'{"event": {"event_id": "evt_9", "event_type": "unknown.event"}, "data": {}}'
+
+    response = client.post(
+        "/webhooks/webhook", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+    )
+
+    assert response.status_code == 400
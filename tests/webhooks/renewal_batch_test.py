@@ -0,0 +1,221 @@
+import asyncio
+import pytest
+from contextlib import contextmanager
+
+from subscriptions.proration import billing_period
+from subscriptions.subscriptions_models import Invoice, Subscription
+from webhooks import webhooks_service
+from webhooks.webhooks_service import (
+    RenewalBatchError,
+    RenewalBatcher,
+    apply_subscription_renewals,
+    handle_subscription_renewed,
+)
+
+
+@pytest.fixture
+def renewable_subscriptions(subscriptions_session):
+    """
+    Creates three active subscriptions with an unpaid invoice for the current period,
+    plus one canceled subscription.
+    """
+    period_start, period_end = billing_period()
+    subscription_ids = []
+    for index in range(1, 5):
+        subscription = Subscription(user_id=index, plan_type="plan_gold", is_active=index != 4)
+        subscriptions_session.add(subscription)
+        subscriptions_session.flush()
+        subscriptions_session.add(Invoice(
+            subscription_id=subscription.id,
+            period_start=period_start,
+            period_end=period_end,
+            amount_due=49.99,
+        ))
+        subscription_ids.append(subscription.id)
+    subscriptions_session.commit()
+    return subscription_ids
+
+
+def _invoice_status(session, subscription_id):
+    return session.query(Invoice.status).filter(Invoice.subscription_id == subscription_id).scalar()
+
+
+def test_apply_renewals_marks_invoices_paid_and_reports_each_event(subscriptions_session, renewable_subscriptions):
+    """
+    Valid events are applied together; every bad event gets its own error.
+    """
+    first, second, third, canceled = renewable_subscriptions
+    events = [
+        {"subscription_id": first},
+        {"customer_id": "cus_1"},
+        {"subscription_id": str(second)},
+        {"subscription_id": canceled},
+        {"subscription_id": 9999},
+        {"subscription_id": "sub_ABC"},
+    ]
+
+    errors = apply_subscription_renewals(events, subscriptions_session)
+
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], KeyError)
+    assert isinstance(errors[3], ValueError)
+    assert isinstance(errors[4], ValueError)
+    assert isinstance(errors[5], ValueError)
+    assert _invoice_status(subscriptions_session, first) == "paid"
+    assert _invoice_status(subscriptions_session, second) == "paid"
+    assert _invoice_status(subscriptions_session, third) == "unpaid"
+    assert _invoice_status(subscriptions_session, canceled) == "unpaid"
+
+
+def test_handle_subscription_renewed_with_session_raises_for_its_event(subscriptions_session, renewable_subscriptions):
+    """
+    The single-event path goes through the batch code and still raises its own error.
+    """
+    handle_subscription_renewed({"subscription_id": renewable_subscriptions[0]}, subscriptions_session)
+    assert _invoice_status(subscriptions_session, renewable_subscriptions[0]) == "paid"
+
+    with pytest.raises(ValueError):
+        handle_subscription_renewed({"subscription_id": renewable_subscriptions[3]}, subscriptions_session)
+
+
+def test_batcher_applies_concurrent_submissions_in_one_batch(subscriptions_session, renewable_subscriptions, mocker):
+    """
+    Events submitted within the window share one batch, and each caller sees its own outcome.
+    """
+    @contextmanager
+    def session_factory():
+        yield subscriptions_session
+
+    apply = mocker.patch(
+        "webhooks.webhooks_service.apply_subscription_renewals", wraps=apply_subscription_renewals
+    )
+    batcher = RenewalBatcher(window_seconds=0.05, max_batch_size=100, session_factory=session_factory)
+    first, second, third, canceled = renewable_subscriptions
+
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit({"subscription_id": first}),
+            batcher.submit({"subscription_id": second}),
+            batcher.submit({"subscription_id": canceled}),
+            batcher.submit({}),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(submit_all())
+
+    assert results[0] is None and results[1] is None
+    assert isinstance(results[2], ValueError)
+    assert isinstance(results[3], KeyError)
+    assert apply.call_count == 1
+    assert _invoice_status(subscriptions_session, third) == "unpaid"
+
+
+def test_batcher_flushes_immediately_when_full(subscriptions_session, renewable_subscriptions):
+    """
+    Reaching the maximum batch size applies the batch without waiting for the window.
+    """
+    @contextmanager
+    def session_factory():
+        yield subscriptions_session
+
+    batcher = RenewalBatcher(window_seconds=60, max_batch_size=2, session_factory=session_factory)
+
+    async def submit_two():
+        await asyncio.wait_for(asyncio.gather(
+            batcher.submit({"subscription_id": renewable_subscriptions[0]}),
+            batcher.submit({"subscription_id": renewable_subscriptions[1]}),
+        ), timeout=5)
+
+    asyncio.run(submit_two())
+
+    assert _invoice_status(subscriptions_session, renewable_subscriptions[0]) == "paid"
+    assert _invoice_status(subscriptions_session, renewable_subscriptions[1]) == "paid"
+
+
+def test_registered_handler_renews_through_the_batcher(
+    subscriptions_session, renewable_subscriptions, monkeypatch, mocker
+):
+    """
+    Renewal events dispatched from handler threads share one batch once the batcher
+    is started, and each thread still gets its own event's error.
+    """
+    @contextmanager
+    def session_factory():
+        yield subscriptions_session
+
+    apply = mocker.patch(
+        "webhooks.webhooks_service.apply_subscription_renewals", wraps=apply_subscription_renewals
+    )
+    batcher = RenewalBatcher(window_seconds=0.2, session_factory=session_factory)
+    monkeypatch.setattr(webhooks_service, "renewal_batcher", batcher)
+    first, second, _, canceled = renewable_subscriptions
+
+    async def dispatch_from_threads():
+        batcher.start()
+        results = await asyncio.gather(*(
+            asyncio.to_thread(webhooks_service.apply_subscription_renewal_event, {"subscription_id": subscription_id})
+            for subscription_id in (first, second, canceled)
+        ), return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(dispatch_from_threads())
+
+    assert results[:2] == [None, None] and isinstance(results[2], ValueError)
+    assert apply.call_count == 1
+    assert _invoice_status(subscriptions_session, first) == "paid"
+    assert batcher.submit_blocking({"subscription_id": first}) is False
+
+
+def test_batcher_does_not_need_a_thread_pool_token(subscriptions_session, renewable_subscriptions, monkeypatch):
+    """
+    More handlers than the thread pool has tokens can wait on one batch: the batch
+    is written on the batcher's own thread, not behind the waiting handlers.
+    """
+    import anyio.to_thread
+    from starlette.concurrency import run_in_threadpool
+
+    @contextmanager
+    def session_factory():
+        yield subscriptions_session
+
+    batcher = RenewalBatcher(window_seconds=0.05, session_factory=session_factory)
+    monkeypatch.setattr(webhooks_service, "renewal_batcher", batcher)
+    first, second, third, _ = renewable_subscriptions
+
+    def handler(subscription_id):
+        batcher.submit_blocking({"subscription_id": subscription_id}, timeout=5)
+
+    async def dispatch_from_handlers():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        batcher.start()
+        results = await asyncio.gather(*(
+            run_in_threadpool(handler, subscription_id) for subscription_id in (first, second, third)
+        ), return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(dispatch_from_handlers()) == [None, None, None]
+    assert {_invoice_status(subscriptions_session, id_) for id_ in (first, second, third)} == {"paid"}
+
+
+def test_failed_batch_gives_each_waiter_its_own_error():
+    @contextmanager
+    def session_factory():
+        raise RuntimeError("database down")
+        yield
+
+    batcher = RenewalBatcher(window_seconds=0.01, session_factory=session_factory)
+
+    async def submit_two():
+        return await asyncio.gather(
+            batcher.submit({"subscription_id": 1}),
+            batcher.submit({"subscription_id": 2}),
+            return_exceptions=True,
+        )
+
+    errors = asyncio.run(submit_two())
+
+    assert all(isinstance(error, RenewalBatchError) for error in errors)
+    assert errors[0] is not errors[1]
+    assert isinstance(errors[0].__cause__, RuntimeError)
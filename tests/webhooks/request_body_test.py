@@ -0,0 +1,159 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+
+from main import create_app
+
+from webhooks.event_registry import registry
+from webhooks.request_body import (
+    InvalidCompressedBodyError,
+    RequestBodyTooLargeError,
+    UnsupportedContentEncodingError,
+    read_body,
+)
+from webhooks.webhooks_signature import sign_payload
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "zstd": zstandard.ZstdCompressor().compress,
+}
+
+
+def _read(wire, encoding, max_bytes=1024 * 1024, chunk_size=1000):
+    async def chunks():
+        for start in range(0, len(wire), chunk_size):
+            yield wire[start:start + chunk_size]
+
+    return asyncio.run(read_body(chunks(), encoding, max_bytes))
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_read_body_decodes_streamed_chunks(encoding):
+    """
+    Compressed bodies are decoded across chunk boundaries.
+    """
+    body = b'{"n": 1}' * 5000
+    assert _read(COMPRESSORS[encoding](body), encoding) == body
+    assert _read(COMPRESSORS[encoding](body), encoding.upper()) == body
+
+
+def test_read_body_passes_plain_bodies_through():
+    assert _read(b"plain", None) == b"plain"
+    assert _read(b"plain", "identity") == b"plain"
+
+
+def test_read_body_decodes_concatenated_gzip_members():
+    assert _read(gzip.compress(b"abc") + gzip.compress(b"def"), "gzip") == b"abcdef"
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd", None])
+def test_read_body_enforces_decoded_size_limit(encoding):
+    """
+    A body that expands past the limit is refused while it is being decoded.
+    """
+    body = b"\0" * (4 * 1024 * 1024)
+    wire = COMPRESSORS[encoding](body) if encoding else body
+    with pytest.raises(RequestBodyTooLargeError):
+        _read(wire, encoding, max_bytes=64 * 1024, chunk_size=64 * 1024)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_read_body_rejects_corrupt_bodies(encoding):
+    with pytest.raises(InvalidCompressedBodyError):
+        _read(b"definitely not compressed", encoding)
+
+
+def test_read_body_decodes_concatenated_and_skippable_zstd_frames():
+    compressor = zstandard.ZstdCompressor(write_checksum=True, write_content_size=False)
+    skippable = (0x184D2A5A).to_bytes(4, "little") + (3).to_bytes(4, "little") + b"pad"
+    wire = compressor.compress(b"abc") + skippable + zstandard.ZstdCompressor().compress(b"def")
+    assert _read(wire, "zstd", chunk_size=1) == b"abcdef"
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_read_body_rejects_truncated_bodies(encoding):
+    """
+    A body cut off anywhere before the end of its last frame is refused, not decoded as a prefix.
+    """
+    wire = COMPRESSORS[encoding](b"x" * 1000 + bytes(range(256)) * 400)
+    for end in (len(wire) - 1, len(wire) - 10, len(wire) // 2, 6):
+        with pytest.raises(InvalidCompressedBodyError):
+            _read(wire[:end], encoding)
+    with pytest.raises(InvalidCompressedBodyError):
+        _read(b"", encoding)
+
+
+def test_read_body_rejects_unknown_encodings():
+    with pytest.raises(UnsupportedContentEncodingError):
+        _read(b"data", "br")
+
+
+@pytest.fixture
+def compressed_client(webhook_deduplicator, dead_letter_store, monkeypatch):
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    calls = []
+    monkeypatch.setitem(registry._handlers, "compressed.test", [lambda data: calls.append(data["n"])])
+    monkeypatch.setattr(registry, "_resolved", {})
+    client = TestClient(create_app())
+    client.calls = calls
+    return client
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_receive_webhook_verifies_decoded_body(compressed_client, encoding):
+    """
+    Compressed events and batches are accepted with a signature over the decoded bytes.
+    """
+    body = json.dumps({"event": {"event_id": "evt_1", "event_type": "compressed.test"}, "data": {"n": 1}}).encode()
+    batch = json.dumps([
+        {"event": {"event_id": f"evt_{n}", "event_type": "compressed.test"}, "data": {"n": n}} for n in (2, 3)
+    ]).encode()
+
+    single = compressed_client.post(
+        "/webhooks/webhook",
+        content=COMPRESSORS[encoding](body),
+        headers={"Content-Encoding": encoding, "X-Webhook-Signature": sign_payload(body, "whsec_test")},
+    )
+    batched = compressed_client.post(
+        "/webhooks/webhook/batch",
+        content=COMPRESSORS[encoding](batch),
+        headers={"Content-Encoding": encoding, "X-Webhook-Signature": sign_payload(batch, "whsec_test")},
+    )
+
+    assert single.status_code == 200
+    assert [result["status"] for result in batched.json()["results"]] == ["success", "success"]
+    assert compressed_client.calls == [1, 2, 3]
+
+
+def test_receive_webhook_rejects_signature_over_compressed_bytes(compressed_client):
+    body = b'{"event": {"event_id": "evt_1", "event_type": "compressed.test"}, "data": {"n": 1}}'
+    wire = gzip.compress(body)
+
+    response = compressed_client.post(
+        "/webhooks/webhook",
+        content=wire,
+        headers={"Content-Encoding": "gzip", "X-Webhook-Signature": sign_payload(wire, "whsec_test")},
+    )
+
+    assert response.status_code == 403
+    assert compressed_client.calls == []
+
+
+@pytest.mark.parametrize("headers, wire, expected", [
+    ({"Content-Encoding": "br"}, b"{}", 415),
+    ({"Content-Encoding": "gzip"}, b"not gzip", 400),
+    ({"Content-Encoding": "zstd"}, zstandard.ZstdCompressor().compress(b" " * (11 * 1024 * 1024)), 413),
+])
+def test_receive_webhook_maps_body_errors(compressed_client, headers, wire, expected):
+    """
+    Unknown encodings, corrupt bodies and bodies over WEBHOOK_MAX_BODY_BYTES are refused.
+    """
+    response = compressed_client.post(
+        "/webhooks/webhook", content=wire, headers={**headers, "X-Webhook-Signature": "t=1,v1=00"}
+    )
+
+    assert response.status_code == expected
@@ -0,0 +1,151 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+
+from webhooks import event_log, webhook_ingestion
+from webhooks.event_log import EventLog
+from webhooks.event_registry import registry
+from webhooks.webhook_ingestion import WebhookQueueFullError
+from webhooks.webhooks_signature import sign_payload
+
+
+def _event(event_id, event_type="batch.test", **data):
+    return {"event": {"event_id": event_id, "event_type": event_type}, "data": data}
+
+
+@pytest.fixture
+def batch_client(webhook_deduplicator, dead_letter_store, monkeypatch):
+    """
+    Client for the batch endpoint with a 'batch.test' handler that fails for data {'fail': True}.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    calls = []
+
+    def handler(data):
+        if data.get("fail"):
+            raise RuntimeError("handler failed")
+        calls.append(data["n"])
+
+    monkeypatch.setitem(registry._handlers, "batch.test", [handler])
+    monkeypatch.setattr(registry, "_resolved", {})
+    client = TestClient(create_app())
+
+    def post(events, secret="whsec_test"):
+        body = json.dumps(events).encode()
+        return client.post(
+            "/webhooks/webhook/batch", content=body, headers={"X-Webhook-Signature": sign_payload(body, secret)}
+        )
+
+    post.calls = calls
+    return post
+
+
+@pytest.fixture
+def open_log(tmp_path, monkeypatch):
+    """
+    An open event log the endpoint appends accepted events to.
+    """
+    log = EventLog(str(tmp_path))
+    log.open()
+    monkeypatch.setattr(event_log, "event_log", log)
+    yield log
+    log.close()
+
+
+def test_batch_reports_status_per_event(batch_client):
+    """
+    Every event in the batch gets its own outcome at its own index.
+    """
+    response = batch_client([
+        _event("evt_1", n=1),
+        {"event": {"event_type": "batch.test"}, "data": {}},
+        _event("evt_2", event_type="unknown.type"),
+        _event("evt_1", n=1),
+        _event("evt_3", n=3),
+        _event("evt_4", fail=True),
+    ])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["received"] == 6
+    assert [result["status"] for result in body["results"]] == [
+        "success", "invalid", "rejected", "duplicate", "success", "dead_lettered",
+    ]
+    assert body["results"][1]["detail"][0]["loc"] == ["event", "event_id"]
+    assert batch_client.calls == [1, 3]
+
+
+def test_batch_skips_events_already_processed(batch_client):
+    """
+    Events delivered by an earlier batch are reported as duplicates.
+    """
+    batch_client([_event("evt_1", n=1)])
+    response = batch_client([_event("evt_1", n=1), _event("evt_2", n=2)])
+
+    assert [result["status"] for result in response.json()["results"]] == ["duplicate", "success"]
+    assert batch_client.calls == [1, 2]
+
+
+def test_batch_logs_each_event_as_sent(batch_client, open_log):
+    """
+    The log holds each accepted item's own JSON, so replays see what the sender wrote.
+    """
+    item = {**_event("evt_1", n=1), "api_version": "2026-01-01"}
+
+    batch_client([item, _event("evt_2", event_type="unknown.type"), _event("evt_3", fail=True)])
+
+    assert [json.loads(body) for _, _, body in open_log.read()] == [item, _event("evt_3", fail=True)]
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[]", b'{"event": {}}'])
+def test_batch_rejects_non_arrays(batch_client, monkeypatch, body):
+    """
+    The body must be a non-empty JSON array.
+    """
+    client = TestClient(create_app())
+    response = client.post(
+        "/webhooks/webhook/batch", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+    )
+    assert response.status_code == 400
+
+
+def test_batch_rejects_oversized_batches(batch_client, monkeypatch):
+    """
+    Batches above WEBHOOK_BATCH_MAX_EVENTS are refused as a whole.
+    """
+    monkeypatch.setattr("webhooks.webhooks_router.WEBHOOK_BATCH_MAX_EVENTS", 2)
+    response = batch_client([_event(f"evt_{index}", n=index) for index in range(3)])
+    assert response.status_code == 413
+    assert batch_client.calls == []
+
+
+def test_batch_signature_covers_whole_body(batch_client):
+    """
+    A batch signed with the wrong secret is rejected without processing any event.
+    """
+    response = batch_client([_event("evt_1", n=1)], secret="whsec_other")
+    assert response.status_code == 403
+    assert batch_client.calls == []
+
+
+def test_batch_enqueues_when_workers_run(batch_client, mocker, open_log):
+    """
+    With the workers running, events are queued and a full partition throttles only its events,
+    which are not logged.
+    """
+    queue = webhook_ingestion.webhook_queue
+    mocker.patch.object(type(queue), "running", new_callable=mocker.PropertyMock, return_value=True)
+    enqueue = mocker.patch.object(
+        queue, "enqueue", side_effect=[None, WebhookQueueFullError("Webhook queue is full; retry later.")]
+    )
+
+    response = batch_client([_event("evt_1", n=1), _event("evt_2", n=2)])
+
+    assert [result["status"] for result in response.json()["results"]] == ["accepted", "throttled"]
+    assert response.headers["Retry-After"] == "1"
+    assert enqueue.call_args_list[0].kwargs["key"] == "event_id:evt_1"
+    assert batch_client.calls == []
+    assert [json.loads(body)["event"]["event_id"] for _, _, body in open_log.read()] == ["evt_1"]
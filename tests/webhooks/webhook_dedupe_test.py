@@ -0,0 +1,180 @@
+import time
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from main import create_app
+from webhooks.event_registry import registry
+from webhooks.webhook_dedupe import EventDeduplicator, RecentEventIds, prune_processed_events
+from webhooks.webhooks_models import ProcessedWebhookEvent
+from webhooks.webhooks_signature import sign_payload
+
+
+def test_recent_ids_expire_and_stay_bounded():
+    """
+    Ids are forgotten after the TTL, and the oldest are evicted when the set is full.
+    """
+    recent = RecentEventIds(ttl_seconds=0.05, max_entries=2)
+    for event_id in ("evt_1", "evt_2", "evt_3"):
+        recent.add(event_id)
+    assert "evt_1" not in recent
+    assert "evt_2" in recent and "evt_3" in recent
+
+    time.sleep(0.06)
+    assert "evt_3" not in recent
+
+
+def test_claim_skips_duplicates_from_memory_then_database(webhook_deduplicator, webhooks_session):
+    """
+    A redelivery to the same process is caught in memory; one to another process
+    (fresh memory, same database) is caught by the persisted claim.
+    """
+    assert webhook_deduplicator.claim("evt_1", "charge.succeeded")
+    assert not webhook_deduplicator.claim("evt_1", "charge.succeeded")
+
+    other_worker = EventDeduplicator(session_factory=webhook_deduplicator.session_factory)
+    assert not other_worker.claim("evt_1", "charge.succeeded")
+    assert other_worker.claim("evt_2", "charge.succeeded")
+
+    assert webhook_deduplicator.stats()["duplicates_in_memory"] == 1
+    assert other_worker.stats()["duplicates_in_database"] == 1
+    assert webhooks_session.query(ProcessedWebhookEvent).count() == 2
+
+
+def test_release_allows_reprocessing(webhook_deduplicator):
+    """
+    A released claim can be claimed again.
+    """
+    assert webhook_deduplicator.claim("evt_1", "charge.succeeded")
+    webhook_deduplicator.release("evt_1")
+    assert webhook_deduplicator.claim("evt_1", "charge.succeeded")
+
+
+def test_claims_stay_pending_until_completed(webhook_deduplicator, webhooks_session):
+    assert webhook_deduplicator.claim("evt_1", "charge.succeeded", '{"n": 1}')
+    row = webhooks_session.get(ProcessedWebhookEvent, "evt_1")
+    assert (row.status, row.payload) == ("pending", '{"n": 1}')
+
+    webhook_deduplicator.complete("evt_1")
+
+    webhooks_session.refresh(row)
+    assert (row.status, row.payload) == ("done", None)
+
+
+def test_stale_pending_claims_are_taken_over_by_a_redelivery(webhook_deduplicator, webhooks_session):
+    """
+    A claim left pending past the timeout, e.g. by a worker that died, does not block the event for good.
+    """
+    other_worker = EventDeduplicator(session_factory=webhook_deduplicator.session_factory, pending_timeout=60)
+    assert webhook_deduplicator.claim("evt_1", "charge.succeeded")
+    assert not other_worker.claim("evt_1", "charge.succeeded")
+
+    other_worker.recent.discard("evt_1")
+    webhooks_session.get(ProcessedWebhookEvent, "evt_1").processed_at -= timedelta(minutes=5)
+    webhooks_session.commit()
+
+    assert other_worker.claim("evt_1", "charge.succeeded")
+    other_worker.recent.discard("evt_1")
+    assert not other_worker.claim("evt_1", "charge.succeeded")
+    assert other_worker.stats()["taken_over"] == 1
+
+
+def test_recovery_dispatches_stale_pending_claims_once(webhook_deduplicator, webhooks_session):
+    webhook_deduplicator.pending_timeout = 60
+    for event_id in ("evt_stale", "evt_fresh", "evt_no_payload", "evt_failing"):
+        payload = None if event_id == "evt_no_payload" else '{"id": "%s"}' % event_id
+        webhook_deduplicator.claim(event_id, "charge.succeeded", payload)
+    for event_id in ("evt_stale", "evt_no_payload", "evt_failing"):
+        webhooks_session.get(ProcessedWebhookEvent, event_id).processed_at -= timedelta(minutes=5)
+    webhooks_session.commit()
+    dispatched = []
+
+    def dispatch(payload):
+        if "failing" in payload:
+            raise RuntimeError("handler failed")
+        dispatched.append(payload)
+
+    assert webhook_deduplicator.recover_stale_claims(dispatch) == 1
+    assert dispatched == ['{"id": "evt_stale"}']
+    statuses = dict(webhooks_session.query(ProcessedWebhookEvent.event_id, ProcessedWebhookEvent.status))
+    assert statuses == {"evt_stale": "done", "evt_fresh": "pending", "evt_failing": "pending"}
+    # The failed recovery renewed its claim, so it is not retried before the timeout again
+    assert webhook_deduplicator.recover_stale_claims(dispatch) == 0
+
+
+def test_prune_removes_old_claims(webhooks_session):
+    """
+    Claims older than the retention window are deleted.
+    """
+    webhooks_session.add_all([
+        ProcessedWebhookEvent(event_id="evt_old", event_type="x", processed_at=datetime.utcnow() - timedelta(days=10)),
+        ProcessedWebhookEvent(event_id="evt_new", event_type="x", processed_at=datetime.utcnow()),
+    ])
+    webhooks_session.commit()
+
+    assert prune_processed_events(webhooks_session, timedelta(days=7)) == 1
+    assert webhooks_session.query(ProcessedWebhookEvent.event_id).scalar() == "evt_new"
+
+
+def test_recovery_task_prunes_completed_claims(webhook_deduplicator, webhooks_session, monkeypatch):
+    """
+    The periodic recovery also deletes completed claims past the configured retention,
+    leaving recent and pending claims alone.
+    """
+    import asyncio
+    from webhooks import webhook_dedupe
+
+    monkeypatch.setattr(webhook_dedupe, "WEBHOOK_DEDUPE_RETENTION_SECONDS", 3600)
+    old = datetime.utcnow() - timedelta(hours=2)
+    webhooks_session.add_all([
+        ProcessedWebhookEvent(event_id="evt_old", event_type="x", processed_at=old, status="done"),
+        ProcessedWebhookEvent(event_id="evt_old_pending", event_type="x", processed_at=old, status="pending"),
+        ProcessedWebhookEvent(event_id="evt_new", event_type="x", processed_at=datetime.utcnow(), status="done"),
+    ])
+    webhooks_session.commit()
+    monkeypatch.setattr(webhook_deduplicator, "recover_stale_claims", lambda dispatch: 0)
+
+    async def run_briefly():
+        task = asyncio.create_task(webhook_dedupe._recover_periodically(0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run_briefly())
+
+    remaining = {event_id for (event_id,) in webhooks_session.query(ProcessedWebhookEvent.event_id)}
+    assert remaining == {"evt_old_pending", "evt_new"}
+    assert webhook_deduplicator.stats()["pruned"] == 1
+
+
+def test_receive_webhook_runs_handlers_once_per_event_id(
+    webhook_deduplicator, dead_letter_store, webhooks_session, monkeypatch
+):
+    """
+    Redelivering the same event does not run its handlers again, and a handler
+    failure is retried before the delivery is answered.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    calls = []
+    failures = [RuntimeError("temporary")]
+
+    def flaky(data):
+        if failures:
+            raise failures.pop()
+        calls.append(data["n"])
+
+    monkeypatch.setitem(registry._handlers, "dedupe.test", [flaky])
+    monkeypatch.setattr(registry, "_resolved", {})
+    client = TestClient(create_app(), raise_server_exceptions=False)
+
+    def deliver(event_id):
+        body = b'{"event": {"event_id": "%s", "event_type": "dedupe.test"}, "data": {"n": 1}}' % event_id.encode()
+        return client.post(
+            "/webhooks/webhook", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+        )
+
+    assert deliver("evt_1").status_code == 200
+    duplicate = deliver("evt_1")
+
+    assert duplicate.status_code == 200 and duplicate.json()["status"] == "duplicate"
+    assert calls == [1]
+    assert webhooks_session.get(ProcessedWebhookEvent, "evt_1").status == "done"
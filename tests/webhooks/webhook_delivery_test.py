@@ -0,0 +1,290 @@
+import asyncio
+import threading
+import pytest
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from database import get_db
+from main import create_app
+from webhooks import webhook_delivery
+from webhooks.webhook_delivery import (
+    DeliveryEngine,
+    Endpoint,
+    backoff_delay,
+    bump_endpoints_version,
+    load_endpoints,
+    refresh_endpoints_if_changed,
+    register_endpoint,
+    validate_endpoint_url,
+)
+from webhooks.webhooks_models import WebhookEndpoint
+from webhooks.webhooks_signature import WebhookSignatureError, verify_signature
+
+
+class StubReceiver:
+    """
+    Local merchant endpoint: verifies signatures and records deliveries per path.
+
+    Paths can be told to fail a number of times, reject, or block until released.
+    """
+
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.received = {}
+        self.failures = {}
+        self.statuses = {}
+        self.gates = {}
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.app = FastAPI()
+        self.app.add_api_route("/{path}", self.receive, methods=["POST"])
+
+    async def receive(self, path: str, request: Request) -> Response:
+        body = await request.body()
+        try:
+            verify_signature(body, request.headers.get("X-Webhook-Signature"), secrets=self.secrets[path])
+        except WebhookSignatureError:
+            return Response(status_code=403)
+        self.in_flight[path] = self.in_flight.get(path, 0) + 1
+        self.max_in_flight[path] = max(self.max_in_flight.get(path, 0), self.in_flight[path])
+        try:
+            if path in self.gates:
+                await self.gates[path].wait()
+            if self.failures.get(path):
+                self.failures[path] -= 1
+                return Response(status_code=503)
+            if path in self.statuses:
+                return Response(status_code=self.statuses[path])
+            self.received.setdefault(path, []).append(await request.json())
+            return Response(status_code=200)
+        finally:
+            self.in_flight[path] -= 1
+
+
+@pytest.fixture
+def stub():
+    return StubReceiver({"fast": "whsec_fast", "slow": "whsec_slow", "charges": "whsec_charges"})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(webhook_delivery, "backoff_delay", lambda attempt: 0)
+
+
+def _engine(stub, **kwargs):
+    engine = DeliveryEngine(transport=httpx.ASGITransport(app=stub.app), **kwargs)
+    engine.set_endpoints([
+        Endpoint(1, "http://merchant/fast", "whsec_fast"),
+        Endpoint(2, "http://merchant/slow", "whsec_slow"),
+        Endpoint(3, "http://merchant/charges", "whsec_charges", ("charge.*",)),
+    ])
+    return engine
+
+
+async def _until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    """
+    Delays stay within the exponential ceiling and never exceed the cap.
+    """
+    for attempt in range(1, 12):
+        delay = backoff_delay(attempt, base=1, cap=30)
+        assert 0 <= delay <= min(30, 2 ** (attempt - 1))
+
+
+def test_events_are_signed_and_routed_to_subscribed_endpoints(stub):
+    """
+    Each endpoint receives a body signed with its own secret, filtered by its event types.
+    """
+    async def scenario():
+        engine = _engine(stub)
+        await engine.start()
+        charge_id = engine.emit("charge.succeeded", {"charge_id": "ch_1"})
+        engine.emit("invoice.created", {"invoice_id": 7})
+        await _until(lambda: sum(s["delivered"] for s in engine.stats()["endpoints"].values()) == 5)
+        await engine.stop()
+        return charge_id
+
+    charge_id = asyncio.run(scenario())
+
+    assert [event["event"]["event_type"] for event in stub.received["fast"]] == ["charge.succeeded", "invoice.created"]
+    assert [event["event"]["event_id"] for event in stub.received["charges"]] == [charge_id]
+
+
+def test_retryable_failures_are_retried_and_rejections_are_not(stub):
+    """
+    503s are retried until they succeed; a 4xx rejection is given up immediately.
+    """
+    stub.failures["fast"] = 2
+    stub.statuses["slow"] = 410
+
+    async def scenario():
+        engine = _engine(stub, max_attempts=4)
+        await engine.start()
+        engine.emit("invoice.created", {"invoice_id": 7})
+        await _until(lambda: engine.stats()["endpoints"].get("2", {}).get("failed") == 1
+                     and engine.stats()["endpoints"].get("1", {}).get("delivered") == 1)
+        stats = engine.stats()["endpoints"]
+        await engine.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["1"]["retried"] == 2
+    assert stats["2"]["retried"] == 0 and stats["2"]["last_status"] == 410
+
+
+def test_slow_endpoint_does_not_delay_other_endpoints(stub):
+    """
+    While one endpoint hangs at its concurrency cap, other endpoints keep receiving events,
+    and events beyond the slow endpoint's pending bound are dropped for it alone.
+    """
+    async def scenario():
+        stub.gates["slow"] = asyncio.Event()
+        engine = _engine(stub, endpoint_concurrency=2, endpoint_max_pending=5)
+        await engine.start()
+        for index in range(5):
+            engine.emit("invoice.created", {"invoice_id": index})
+        await _until(lambda: len(stub.received.get("fast", [])) == 5)
+        for index in range(5, 8):
+            engine.emit("invoice.created", {"invoice_id": index})
+        await _until(lambda: len(stub.received.get("fast", [])) == 8)
+        slow = engine.stats()["endpoints"]["2"]
+        stub.gates["slow"].set()
+        await _until(lambda: len(stub.received.get("slow", [])) == 5)
+        await engine.stop()
+        return slow
+
+    slow = asyncio.run(scenario())
+
+    assert slow["delivered"] == 0 and slow["in_flight"] == 2
+    assert slow["dropped"] == 3
+    assert stub.max_in_flight["slow"] == 2
+
+
+def test_emit_is_thread_safe_and_skipped_when_stopped(stub):
+    """
+    Events emitted from worker threads are delivered; nothing is sent before start.
+    """
+    async def scenario():
+        engine = _engine(stub)
+        assert engine.emit("invoice.created", {}) is None
+        await engine.start()
+        thread = threading.Thread(target=engine.emit, args=("invoice.created", {"invoice_id": 1}))
+        thread.start()
+        thread.join()
+        await _until(lambda: len(stub.received.get("fast", [])) == 1)
+        await engine.stop()
+        return engine.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["skipped"] == 1 and stats["emitted"] == 1
+
+
+@pytest.fixture
+def public_dns(monkeypatch):
+    # Resolves every host name to a public address, or to the address it is mapped to
+    hosts = {}
+    monkeypatch.setattr(webhook_delivery, "resolve_host", lambda host: hosts.get(host, ["93.184.215.14"]))
+    return hosts
+
+
+@pytest.mark.parametrize("url", [
+    "http://merchant.example/hooks",
+    "ftp://merchant.example",
+    "https:///hooks",
+    "https://127.0.0.1/hooks",
+    "https://10.0.0.5/hooks",
+    "https://169.254.169.254/latest/meta-data",
+    "https://[::1]/hooks",
+    "https://[::ffff:192.168.1.1]/hooks",
+    "https://0.0.0.0/hooks",
+    "https://internal.example/hooks",
+])
+def test_endpoint_urls_must_be_public_https(url, public_dns):
+    public_dns["internal.example"] = ["93.184.215.14", "192.168.0.10"]
+
+    with pytest.raises(ValueError):
+        validate_endpoint_url(url)
+
+
+def test_public_https_endpoint_urls_are_accepted(public_dns):
+    validate_endpoint_url("https://merchant.example:8443/hooks")
+    validate_endpoint_url("https://93.184.215.14/hooks")
+
+
+def test_register_endpoint_generates_secret_and_reloads_engine(webhooks_session, monkeypatch, public_dns):
+    """
+    Registered endpoints get their own secret and are picked up by the engine.
+    """
+    engine = DeliveryEngine()
+    monkeypatch.setattr(webhook_delivery, "delivery_engine", engine)
+
+    endpoint = register_endpoint(webhooks_session, "https://merchant.example/hooks", ["charge.*", "invoice.created"])
+
+    assert endpoint.secret.startswith("whsec_")
+    assert engine._endpoints == tuple(load_endpoints(webhooks_session))
+    assert engine._endpoints[0].accepts("charge.refunded") and not engine._endpoints[0].accepts("invoice.paid")
+    with pytest.raises(ValueError):
+        register_endpoint(webhooks_session, "ftp://merchant.example", ["*"])
+
+
+def test_endpoint_registration_requires_an_admin_token(webhooks_session, monkeypatch, public_dns, admin_headers):
+    monkeypatch.setattr(webhook_delivery, "delivery_engine", DeliveryEngine())
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: webhooks_session
+    client = TestClient(app)
+    body = {"url": "https://merchant.example/hooks", "event_types": ["charge.*"]}
+
+    assert client.post("/webhooks/endpoints", json=body).status_code == 401
+    assert client.post("/webhooks/endpoints", json=body, headers={"Authorization": "Bearer nope"}).status_code == 403
+    assert client.post(
+        "/webhooks/endpoints", json={**body, "url": "https://127.0.0.1/hooks"}, headers=admin_headers
+    ).status_code == 400
+    response = client.post("/webhooks/endpoints", json=body, headers=admin_headers)
+    assert response.status_code == 201
+    assert response.json()["secret"].startswith("whsec_")
+    assert load_endpoints(webhooks_session)[0].url == "https://merchant.example/hooks"
+
+
+def test_endpoint_changes_reach_other_workers_through_the_version_poll(webhooks_session, monkeypatch):
+    """
+    A worker reloads its endpoints only when another one has bumped the version stamp.
+    """
+    engine = DeliveryEngine()
+    monkeypatch.setattr(webhook_delivery, "delivery_engine", engine)
+
+    assert refresh_endpoints_if_changed(webhooks_session)
+    assert not refresh_endpoints_if_changed(webhooks_session)
+
+    # Another worker registers an endpoint
+    webhooks_session.add(WebhookEndpoint(url="https://merchant.example/hooks", secret="whsec_x", event_types="*"))
+    bump_endpoints_version(webhooks_session)
+    webhooks_session.commit()
+
+    assert refresh_endpoints_if_changed(webhooks_session)
+    assert [endpoint.url for endpoint in engine._endpoints] == ["https://merchant.example/hooks"]
+
+
+def test_deactivated_endpoints_stop_receiving_events(webhooks_session, monkeypatch, public_dns, admin_headers):
+    engine = DeliveryEngine()
+    monkeypatch.setattr(webhook_delivery, "delivery_engine", engine)
+    endpoint = register_endpoint(webhooks_session, "https://merchant.example/hooks", ["*"])
+    version = engine.endpoints_version
+    app = create_app()
+    app.dependency_overrides[get_db] = lambda: webhooks_session
+    client = TestClient(app)
+
+    assert client.post(f"/webhooks/endpoints/{endpoint.id}/deactivate").status_code == 401
+    response = client.post(f"/webhooks/endpoints/{endpoint.id}/deactivate", headers=admin_headers)
+
+    assert response.status_code == 200 and response.json()["is_active"] is False
+    assert engine._endpoints == () and engine.endpoints_version == version + 1
+    assert client.post("/webhooks/endpoints/999/deactivate", headers=admin_headers).status_code == 404
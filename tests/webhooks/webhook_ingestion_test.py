@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from webhooks import event_log, webhook_ingestion, webhooks_router
+from webhooks.event_log import EventLog
+from webhooks.webhook_ingestion import WebhookQueue, WebhookQueueClosedError, WebhookQueueFullError, object_key
+from webhooks.webhooks_models import WebhookPayload
+from webhooks.webhooks_signature import sign_payload
+
+BODY = b'{"event": {"event_id": "evt_1", "event_type": "charge.succeeded"}, "data": {"id": "ch_1"}}'
+
+
+def test_queue_processes_events_and_drains_on_stop():
+    """
+    Queued events are handled by the workers, and stop waits for the backlog.
+    """
+    handled = []
+
+    async def scenario():
+        queue = WebhookQueue(max_size=100, workers=3)
+        await queue.start()
+        for index in range(20):
+            queue.enqueue(handled.append, index)
+        await queue.stop(timeout=5)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert sorted(handled) == list(range(20))
+    assert stats["enqueued"] == 20 and stats["processed"] == 20
+    assert stats["depth"] == 0 and not stats["running"]
+
+
+def test_queue_rejects_when_full_and_counts_failures():
+    """
+    A full queue raises instead of blocking, and handler errors do not stop the workers.
+    """
+    release = threading.Event()
+
+    def slow(_):
+        release.wait(5)
+
+    def broken(_):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        queue = WebhookQueue(max_size=2, workers=1)
+        await queue.start()
+        queue.enqueue(slow, 0)
+        await asyncio.sleep(0.05)  # let the worker pick up the first event
+        queue.enqueue(broken, 1)
+        queue.enqueue(slow, 2)
+        with pytest.raises(WebhookQueueFullError):
+            queue.enqueue(slow, 3)
+        release.set()
+        await queue.stop(timeout=5)
+        with pytest.raises(WebhookQueueClosedError):
+            queue.enqueue(slow, 4)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["rejected"] == 1
+    assert stats["processed"] == 2 and stats["failed"] == 1
+    assert stats["high_water"] == 2
+
+
+def test_events_for_one_object_run_in_order_while_others_proceed():
+    """
+    A blocked object holds back only its own partition; its events still run in arrival order.
+    """
+    release = threading.Event()
+    order = []
+
+    def handle(key, index):
+        if key == "sub:1" and index == 0:
+            release.wait(5)
+        order.append((key, index))
+
+    async def scenario():
+        queue = WebhookQueue(max_size=100, workers=4)
+        await queue.start()
+        blocked = queue.partition_for("sub:1")
+        other = next(f"sub:{n}" for n in range(2, 100) if queue.partition_for(f"sub:{n}") != blocked)
+        for index in range(3):
+            queue.enqueue(handle, "sub:1", index, key="sub:1")
+            queue.enqueue(handle, other, index, key=other)
+        for _ in range(200):
+            if sum(1 for key, _ in order if key == other) == 3:
+                break
+            await asyncio.sleep(0.01)
+        stats = queue.stats()
+        release.set()
+        await queue.stop(timeout=5)
+        return other, blocked, stats
+
+    other, blocked, stats = asyncio.run(scenario())
+
+    assert [index for key, index in order if key == "sub:1"] == [0, 1, 2]
+    assert [index for key, index in order if key == other] == [0, 1, 2]
+    assert order.index(("sub:1", 0)) > order.index((other, 2))
+    blocked_partition = stats["partitions"][blocked]
+    assert blocked_partition["depth"] == 2 and blocked_partition["lag_seconds"] > 0
+    assert len(stats["partitions"]) == 4
+
+
+def test_object_key_follows_the_event_type():
+    """
+    Events are keyed by the object their type names, falling back to the event itself.
+    """
+    def payload(event_type, data):
+        return WebhookPayload.model_validate({"event": {"event_id": "evt_1", "event_type": event_type}, "data": data})
+
+    both = {"subscription_id": 7, "charge_id": "ch_1"}
+    assert object_key(payload("subscription.renewed", both)) == "subscription_id:7"
+    assert object_key(payload("charge.succeeded", both)) == "charge_id:ch_1"
+    assert object_key(payload("invoice.created", {"subscription_id": 7, "invoice_id": 3})) == "invoice_id:3"
+    assert object_key(payload("charge.refunded", {"id": "ch_2"})) == "charge_id:ch_2"
+    assert object_key(payload("charge.succeeded", None)) == "event_id:evt_1"
+    assert object_key(payload("x", {"subscription_id": 7})) == "event_id:evt_1"
+
+
+def test_receive_webhook_acknowledges_before_processing(monkeypatch, mocker):
+    """
+    With the workers running, a signed event is acknowledged and processed in the background.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    monkeypatch.setattr(webhook_ingestion, "webhook_queue", WebhookQueue(max_size=10, workers=2))
+    processed = threading.Event()
+    endpoint = mocker.patch.object(
+        webhooks_router, "webhook_receiver_endpoint", side_effect=lambda payload: processed.set()
+    )
+
+    app = FastAPI()
+    app.include_router(webhooks_router.router, prefix="/webhooks")
+    app.add_event_handler("startup", webhook_ingestion.webhook_queue.start)
+    app.add_event_handler("shutdown", webhook_ingestion.webhook_queue.stop)
+
+    with TestClient(app) as client:
+        headers = {"X-Webhook-Signature": sign_payload(BODY, "whsec_test")}
+        response = client.post("/webhooks/webhook", content=BODY, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["status"] == "accepted"
+        assert processed.wait(5)
+
+        metrics = client.get("/webhooks/queue/metrics").json()
+        assert metrics["enqueued"] == 1 and metrics["running"]
+
+    assert endpoint.call_args.args[0].event.event_id == "evt_1"
+
+
+def test_receive_webhook_returns_429_when_queue_is_full(monkeypatch, mocker, tmp_path):
+    """
+    Backpressure surfaces as 429 with a Retry-After header, and the throttled event is not logged.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    log = EventLog(str(tmp_path))
+    log.open()
+    monkeypatch.setattr(event_log, "event_log", log)
+    queue = WebhookQueue(max_size=1, workers=1)
+    monkeypatch.setattr(webhook_ingestion, "webhook_queue", queue)
+    mocker.patch.object(queue, "enqueue", side_effect=WebhookQueueFullError("Webhook queue is full; retry later."))
+    mocker.patch.object(WebhookQueue, "running", new_callable=mocker.PropertyMock, return_value=True)
+
+    app = FastAPI()
+    app.include_router(webhooks_router.router, prefix="/webhooks")
+    client = TestClient(app)
+
+    headers = {"X-Webhook-Signature": sign_payload(BODY, "whsec_test")}
+    response = client.post("/webhooks/webhook", content=BODY, headers=headers)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert list(log.read()) == []
+    log.close()
@@ -0,0 +1,47 @@
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+from main import create_app
+from webhooks.webhooks_models import WebhookPayload
+from webhooks.webhooks_signature import sign_payload
+
+
+def test_payload_data_accepts_nested_values():
+    """
+    Event data is not limited to string values.
+    """
+    payload = WebhookPayload.model_validate_json(
+        b'{"event": {"event_id": "evt_1", "event_type": "charge.succeeded"},'
+        b' "data": {"amount": 1000, "metadata": {"order": "o_1"}, "lines": [1, 2]}}'
+    )
+    assert payload.data["amount"] == 1000
+    assert payload.data["metadata"] == {"order": "o_1"}
+
+
+def test_payload_requires_non_empty_event_id():
+    """
+    An empty event_id cannot be deduplicated and is rejected.
+    """
+    with pytest.raises(ValidationError):
+        WebhookPayload.model_validate({"event": {"event_id": "", "event_type": "charge.succeeded"}})
+
+
+@pytest.mark.parametrize("body", [
+    b"{not json",
+    b"[1, 2, 3]",
+    b'{"event": {"event_type": "charge.succeeded"}, "data": {}}',
+    b'{"event": {"event_id": "evt_1", "event_type": "charge.succeeded"}, "data": "oops"}',
+])
+def test_receive_webhook_rejects_invalid_payloads(monkeypatch, body):
+    """
+    Malformed JSON and payloads that do not match WebhookPayload are rejected with 400.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    client = TestClient(create_app())
+
+    response = client.post(
+        "/webhooks/webhook", content=body, headers={"X-Webhook-Signature": sign_payload(body, "whsec_test")}
+    )
+
+    assert response.status_code == 400
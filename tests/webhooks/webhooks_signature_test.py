@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+from webhooks.webhooks_signature import (
+    MissingWebhookSignatureError,
+    WebhookSignatureError,
+    sign_payload,
+    verify_signature,
+)
+
+BODY = b'{"event": {"event_id": "evt_1", "event_type": "charge.succeeded"}, "data": {"id": "ch_1"}}'
+NOW = 1_700_000_000
+
+
+def test_verify_accepts_any_active_secret_during_rotation():
+    """
+    Bodies signed with either the old or the new secret are accepted.
+    """
+    for secret in ("whsec_old", "whsec_new"):
+        header = sign_payload(BODY, secret, timestamp=NOW)
+        assert verify_signature(BODY, header, secrets="whsec_new, whsec_old", now=NOW) == NOW
+
+
+def test_verify_rejects_tampered_body_and_unknown_secret():
+    """
+    A signature only matches the exact bytes and secret it was made with.
+    """
+    header = sign_payload(BODY, "whsec_new", timestamp=NOW)
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY.replace(b"ch_1", b"ch_2"), header, secrets="whsec_new", now=NOW)
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY, sign_payload(BODY, "whsec_forged", timestamp=NOW), secrets="whsec_new", now=NOW)
+
+
+@pytest.mark.parametrize("header", [
+    "v1=abc",
+    "t=notanumber,v1=abc",
+    "t=\u00b2,v1=abc",
+    "t=\u0661\u0667,v1=abc",
+    "t=1700000000",
+    "t=1700000000,v1=" + "a" * 2000,
+])
+def test_verify_rejects_malformed_headers(header):
+    """
+    Headers without a numeric timestamp and a v1 signature are rejected.
+    """
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY, header, secrets="whsec_new", now=NOW)
+
+
+def test_verify_enforces_timestamp_tolerance():
+    """
+    Signatures older or newer than the tolerance are rejected even when they match.
+    """
+    header = sign_payload(BODY, "whsec_new", timestamp=NOW)
+    assert verify_signature(BODY, header, secrets="whsec_new", tolerance=300, now=NOW + 300) == NOW
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY, header, secrets="whsec_new", tolerance=300, now=NOW + 301)
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY, header, secrets="whsec_new", tolerance=300, now=NOW - 301)
+
+
+def test_verify_fails_closed_without_secrets():
+    """
+    With no secrets configured every request is rejected.
+    """
+    with pytest.raises(WebhookSignatureError):
+        verify_signature(BODY, sign_payload(BODY, "whsec_new", timestamp=NOW), secrets="", now=NOW)
+    with pytest.raises(MissingWebhookSignatureError):
+        verify_signature(BODY, None, secrets="whsec_new", now=NOW)
+
+
+@pytest.fixture
+def signed_client(monkeypatch):
+    """
+    Test client for an app that accepts webhooks signed with 'whsec_test'.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    return TestClient(create_app())
+
+
+def test_receive_webhook_rejects_forged_requests_before_parsing(signed_client, mocker):
+    """
+    Missing or forged signatures are rejected without parsing the body.
+    """
+    payload_model = mocker.patch("webhooks.webhooks_router.WebhookPayload")
+
+    response = signed_client.post("/webhooks/webhook", content=BODY)
+    assert response.status_code == 400
+
+    forged = sign_payload(BODY, "whsec_forged")
+    response = signed_client.post("/webhooks/webhook", content=BODY, headers={"X-Webhook-Signature": forged})
+    assert response.status_code == 403
+    payload_model.model_validate_json.assert_not_called()
+
+
+def test_receive_webhook_rejects_non_ascii_timestamp(monkeypatch):
+    """
+    A timestamp of non-ASCII digits is a forged header (403), not a server error.
+
+    Sent as a raw ASGI request, since HTTP clients re-encode non-ASCII header values.
+    """
+    monkeypatch.setenv("WEBHOOK_SECRETS", "whsec_test")
+    app = create_app()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": BODY, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/webhooks/webhook", "raw_path": b"/webhooks/webhook", "root_path": "",
+        "query_string": b"", "server": ("testserver", 80), "client": ("testclient", 50000),
+        "headers": [(b"host", b"testserver"), (b"x-webhook-signature", b"t=\xb2,v1=abc")],
+    }
+    asyncio.run(app(scope, receive, send))
+
+    assert messages[0]["status"] == 403
+
+
+def test_receive_webhook_accepts_signed_body(signed_client, webhook_deduplicator):
+    """
+    A body signed with an active secret is parsed and accepted.
+    """
+    headers = {"X-Webhook-Signature": sign_payload(BODY, "whsec_test")}
+    response = signed_client.post("/webhooks/webhook", content=BODY, headers=headers)
+    assert response.status_code == 200
+
+    headers = {"X-Webhook-Signature": sign_payload(b"{not json", "whsec_test")}
+    response = signed_client.post("/webhooks/webhook", content=b"{not json", headers=headers)
+    assert response.status_code == 400
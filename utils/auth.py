@@ -1,8 +1,10 @@
 import os
+import hmac
 import logging
 import jwt
 from typing import Union, Optional
 from datetime import datetime, timedelta
+from fastapi import Header, HTTPException, status
 from jwt.exceptions import PyJWTError
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,8 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "defaultsecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Comma-separated bearer tokens accepted on admin routes; none are accepted when unset.
+ADMIN_API_TOKENS = [token for token in os.getenv("ADMIN_API_TOKENS", "").split(",") if token]
 
 def create_jwt(user_id: str) -> str:
     """
@@ -49,4 +53,28 @@ def verify_jwt(token: str) -> Optional[dict]:
         logger.error("JWT verification failed: %s", e)
         return None
 
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """
+    FastAPI dependency that admits only requests bearing one of ADMIN_API_TOKENS.
+
+    Args:
+        authorization (Optional[str]): The Authorization header, 'Bearer <token>'.
+
+    Raises:
+        HTTPException: 401 if no bearer token is given, 403 if it is not an admin token.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Admin token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Compare against every token so the time taken does not reveal which one matched
+    matched = False
+    for admin_token in ADMIN_API_TOKENS:
+        matched |= hmac.compare_digest(token.encode(), admin_token.encode())
+    if not matched:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
 # TODO: Implement session-based authentication if needed.
\ No newline at end of file
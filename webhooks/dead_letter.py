@@ -0,0 +1,236 @@
+"""
+Dead-letter store for webhook events whose handlers keep failing.
+
+Each handler of an event is retried a few times with a short backoff; only the
+handlers that still fail are retried, so the others never run twice. Every
+handler that exhausts its attempts is written to dead_letter_events with its
+name, error, attempt count and timing, and the delivery is acknowledged so the
+sender stops retrying. After a fix is deployed, filtered sets of dead-lettered
+events are redriven through the handler that failed, at a controlled rate.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import database
+from webhooks.event_registry import EventHandler, UnsupportedEventError, handler_name, registry
+from webhooks.webhooks_models import DeadLetterEvent, WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_HANDLER_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_HANDLER_MAX_ATTEMPTS", "3"))
+WEBHOOK_HANDLER_RETRY_DELAY_SECONDS = float(os.getenv("WEBHOOK_HANDLER_RETRY_DELAY_SECONDS", "0.2"))
+# Redriven events are committed in batches of this size.
+REDRIVE_COMMIT_EVERY = 100
+
+
+def _describe(exc: Exception) -> str:
+    return f"{exc.__class__.__name__}: {exc}"
+
+
+class DeadLetterStore:
+    """
+    Dispatches events with retries and records the ones that exhaust them.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = WEBHOOK_HANDLER_MAX_ATTEMPTS,
+        retry_delay: float = WEBHOOK_HANDLER_RETRY_DELAY_SECONDS,
+        session_factory: Callable[[], ContextManager[Session]] = database.session_scope,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.session_factory = session_factory
+        self.dead_lettered = 0
+
+    def dispatch(self, payload: WebhookPayload) -> bool:
+        """
+        Runs the handlers for an event, retrying the ones that fail and dead-lettering
+        each handler whose failures persist.
+
+        :param payload: The validated event.
+        :return: True if every handler succeeded, False if any was dead-lettered.
+        :raises UnsupportedEventError: If no handler is registered for the event type.
+        :raises Exception: If a failed handler could not be written to the dead-letter store.
+        """
+        event_type = payload.event.event_type
+        handlers = registry.handlers_for(event_type)
+        if not handlers:
+            raise UnsupportedEventError(f"Unsupported event type: {event_type}")
+
+        received_at = datetime.utcnow()
+        event_data = payload.data or {}
+        # Handler -> (first failure time, last error), for the handlers still failing
+        failing: Dict[EventHandler, Tuple[datetime, Exception]] = {}
+        pending = list(handlers)
+        for attempt in range(1, self.max_attempts + 1):
+            for handler in pending:
+                try:
+                    registry.call(event_type, handler, event_data)
+                    failing.pop(handler, None)
+                except Exception as exc:
+                    first_failed_at = failing[handler][0] if handler in failing else datetime.utcnow()
+                    failing[handler] = (first_failed_at, exc)
+                    logger.warning("Attempt %d of %s for webhook event %s failed: %s",
+                                   attempt, handler_name(handler), payload.event.event_id, exc)
+            pending = [handler for handler in pending if handler in failing]
+            if not pending:
+                return True
+            if attempt < self.max_attempts and self.retry_delay:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+        last_failed_at = datetime.utcnow()
+        with self.session_factory() as session:
+            for handler, (first_failed_at, error) in failing.items():
+                session.add(DeadLetterEvent(
+                    event_id=payload.event.event_id,
+                    event_type=event_type,
+                    handler=handler_name(handler),
+                    payload=payload.model_dump_json(),
+                    error=_describe(error),
+                    attempts=self.max_attempts,
+                    status="dead",
+                    received_at=received_at,
+                    first_failed_at=first_failed_at,
+                    last_failed_at=last_failed_at,
+                ))
+            session.commit()
+        self.dead_lettered += len(failing)
+        for handler, (_, error) in failing.items():
+            logger.error("Dead-lettered %s for webhook event %s after %d attempts: %s",
+                         handler_name(handler), payload.event.event_id, self.max_attempts, error)
+        return False
+
+
+def _redrive_one(row: DeadLetterEvent, event_data: Dict[str, Any]) -> None:
+    """
+    Runs the handler a dead-letter row recorded, or every handler for rows that predate per-handler records.
+
+    :raises LookupError: If the recorded handler is no longer registered for the event type.
+    """
+    if row.handler is None:
+        registry.dispatch(row.event_type, event_data)
+        return
+    for handler in registry.handlers_for(row.event_type):
+        if handler_name(handler) == row.handler:
+            registry.call(row.event_type, handler, event_data)
+            return
+    raise LookupError(f"Handler {row.handler} is no longer registered for {row.event_type}")
+
+
+def _filtered(
+    event_type: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    error_contains: Optional[str],
+    status: str = "dead",
+):
+    query = select(DeadLetterEvent).where(DeadLetterEvent.status == status)
+    if event_type:
+        query = query.where(DeadLetterEvent.event_type == event_type)
+    if since is not None:
+        query = query.where(DeadLetterEvent.last_failed_at >= since)
+    if until is not None:
+        query = query.where(DeadLetterEvent.last_failed_at < until)
+    if error_contains:
+        query = query.where(DeadLetterEvent.error.contains(error_contains))
+    return query.order_by(DeadLetterEvent.id)
+
+
+def list_dead_letters(
+    session: Session,
+    status: str = "dead",
+    event_type: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Returns dead-lettered events, oldest first.
+
+    :param session: Database session to read from.
+    :param status: 'dead' or 'redriven'.
+    :param event_type: Optional event type filter.
+    :param limit: Maximum number of events to return.
+    :return: One dictionary per event, without the payload.
+    """
+    rows = session.execute(_filtered(event_type, None, None, None, status).limit(limit)).scalars()
+    return [
+        {
+            "id": row.id,
+            "event_id": row.event_id,
+            "event_type": row.event_type,
+            "handler": row.handler,
+            "error": row.error,
+            "attempts": row.attempts,
+            "status": row.status,
+            "received_at": row.received_at,
+            "first_failed_at": row.first_failed_at,
+            "last_failed_at": row.last_failed_at,
+            "redriven_at": row.redriven_at,
+        }
+        for row in rows
+    ]
+
+
+def redrive(
+    session: Session,
+    event_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    error_contains: Optional[str] = None,
+    limit: int = 500,
+    rate: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Re-runs the failed handler of a filtered set of dead-lettered events.
+
+    Only the handler recorded on each row runs, so handlers that already processed
+    the event are not run again. Events that succeed are marked 'redriven'; events that fail again stay dead
+    with their attempt count, error and failure time updated.
+
+    :param session: Database session used for the reads and updates; committed in batches.
+    :param event_type: Only redrive events of this type.
+    :param since: Only redrive events that last failed at or after this time.
+    :param until: Only redrive events that last failed before this time.
+    :param error_contains: Only redrive events whose error contains this text.
+    :param limit: Maximum number of events to redrive.
+    :param rate: Maximum events per second; unlimited by default.
+    :return: Counts of 'selected', 'redriven' and 'failed' events.
+    """
+    rows = session.execute(_filtered(event_type, since, until, error_contains).limit(limit)).scalars().all()
+    summary = {"selected": len(rows), "redriven": 0, "failed": 0}
+    interval = 1.0 / rate if rate else 0.0
+    next_at = time.monotonic()
+    for count, row in enumerate(rows, start=1):
+        if interval:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at = max(next_at, time.monotonic() - interval) + interval
+        payload = json.loads(row.payload)
+        row.attempts += 1
+        try:
+            _redrive_one(row, payload.get("data") or {})
+            row.status = "redriven"
+            row.redriven_at = datetime.utcnow()
+            summary["redriven"] += 1
+        except Exception as exc:
+            row.error = _describe(exc)
+            row.last_failed_at = datetime.utcnow()
+            summary["failed"] += 1
+        if count % REDRIVE_COMMIT_EVERY == 0:
+            session.commit()
+    session.commit()
+    logger.info("Redrove %d dead-lettered event(s): %d succeeded, %d failed",
+                summary["selected"], summary["redriven"], summary["failed"])
+    return summary
+
+
+dead_letter_store = DeadLetterStore()
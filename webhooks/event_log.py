@@ -0,0 +1,433 @@
+"""
+Append-only, segmented log of accepted webhook events.
+
+Every event accepted by receive_webhook is appended with its raw body to the
+current segment file under WEBHOOK_EVENT_LOG_DIR. Each record gets a sequential
+offset; segments are named after the first offset they hold and roll over once
+they reach WEBHOOK_EVENT_LOG_SEGMENT_BYTES. Next to each segment a sparse index
+maps offsets and receive times to file positions, so reads from an offset or a
+timestamp seek close to the first record instead of scanning the whole log.
+
+Appends are buffered in memory and written, fsynced and committed together
+every WEBHOOK_EVENT_LOG_FLUSH_SECONDS, so the cost of a sync is shared by all
+events in that interval; a crash can lose at most that interval. Every uvicorn
+worker writes to the same directory: a flush holds an exclusive lock on it
+while it assigns offsets and appends, so offsets stay unique and records from
+different processes never interleave.
+
+Events can be replayed through the handler registry with the replay API or:
+
+    python -m webhooks.event_log replay --since 2025-04-01T00:00:00 --rate 50
+"""
+
+import argparse
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from webhooks import webhooks_service  # noqa: F401 - registers handlers
+from webhooks.event_registry import registry
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENT_LOG_DIR = os.getenv("WEBHOOK_EVENT_LOG_DIR", "webhook_event_log")
+WEBHOOK_EVENT_LOG_SEGMENT_BYTES = int(os.getenv("WEBHOOK_EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+WEBHOOK_EVENT_LOG_FLUSH_SECONDS = float(os.getenv("WEBHOOK_EVENT_LOG_FLUSH_SECONDS", "1"))
+# One index entry is written per this many bytes of records.
+INDEX_INTERVAL_BYTES = 64 * 1024
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# offset, receive time, body length, CRC32 of the body
+RECORD_HEADER = struct.Struct("<QdII")
+# offset, receive time, position of the record in the segment
+INDEX_ENTRY = struct.Struct("<QdQ")
+# Committed state: next offset, last segment, its end, its last indexed position, last receive time
+HEAD_STATE = struct.Struct("<QQQqd")
+HEAD_FILE = "HEAD"
+LOCK_FILE = "LOCK"
+
+LogRecord = Tuple[int, float, bytes]
+
+
+def _segment_name(base_offset: int) -> str:
+    return f"{base_offset:020d}"
+
+
+def _read_index(path: str) -> List[Tuple[int, float, int]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as index_file:
+        data = index_file.read()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, position) for position in range(0, usable, INDEX_ENTRY.size)]
+
+
+def _scan(segment: BinaryIO, position: int) -> Iterator[Tuple[int, LogRecord]]:
+    """
+    Yields (position, record) pairs from a segment, stopping at the first incomplete or corrupt record.
+    """
+    segment.seek(position)
+    while True:
+        header = segment.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        offset, received_at, length, checksum = RECORD_HEADER.unpack(header)
+        body = segment.read(length)
+        if len(body) < length or zlib.crc32(body) != checksum:
+            return
+        yield position, (offset, received_at, body)
+        position += RECORD_HEADER.size + length
+
+
+class EventLog:
+    """
+    Thread-safe writer and reader for the segmented event log.
+
+    Several processes may write to the same directory. Appends are buffered in
+    memory; each flush takes an exclusive lock on the directory, assigns the
+    buffered records the offsets after the last committed one, writes and fsyncs
+    them, and commits by replacing the HEAD file. Anything found past the
+    committed end of the last segment was left by a writer that crashed
+    mid-flush and is truncated by the next one.
+    """
+
+    def __init__(self, directory: str = WEBHOOK_EVENT_LOG_DIR,
+                 segment_bytes: int = WEBHOOK_EVENT_LOG_SEGMENT_BYTES) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._lock_file: Optional[BinaryIO] = None
+        self._pending: List[Tuple[float, bytes]] = []
+        self._pending_bytes = 0
+        self.next_offset = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._lock_file is not None
+
+    def open(self) -> None:
+        """
+        Opens the log for appending, recovering its committed state.
+        """
+        with self._lock:
+            if self._lock_file is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(os.path.join(self.directory, LOCK_FILE), "ab")
+            with self._directory_locked():
+                self.next_offset = self._read_head()[0]
+
+    def close(self) -> None:
+        """
+        Writes buffered events and closes the log.
+        """
+        with self._lock:
+            if self._lock_file is None:
+                return
+            if self._pending:
+                self._write_pending()
+            self._lock_file.close()
+            self._lock_file = None
+
+    def append(self, body: bytes, received_at: Optional[float] = None) -> None:
+        """
+        Buffers one event; it is given its offset and reaches disk on the next flush.
+
+        :param body: The raw event body.
+        :param received_at: Unix time the event was received; defaults to now.
+        :raises RuntimeError: If the log is not open.
+        """
+        received_at = time.time() if received_at is None else received_at
+        with self._lock:
+            if self._lock_file is None:
+                raise RuntimeError("Event log is not open.")
+            self._pending.append((received_at, body))
+            self._pending_bytes += RECORD_HEADER.size + len(body)
+            if self._pending_bytes >= WRITE_BUFFER_BYTES:
+                self._write_pending()
+
+    def flush(self) -> None:
+        """
+        Writes buffered events to disk and fsyncs them.
+        """
+        with self._lock:
+            if self._lock_file is not None and self._pending:
+                self._write_pending()
+
+    def read(self, from_offset: int = 0, since: Optional[float] = None) -> Iterator[LogRecord]:
+        """
+        Yields events in offset order, starting at an offset and/or receive time.
+
+        Buffered events are flushed first so they are visible to the reader.
+
+        :param from_offset: First offset to return.
+        :param since: Optional Unix time; earlier events are skipped.
+        :return: An iterator of (offset, received_at, body) tuples.
+        """
+        self.flush()
+        segments = self._list_segments()
+
+        start = max(0, bisect.bisect_right(segments, from_offset) - 1)
+        if since is not None:
+            # Receive times grow with offsets, so segments whose successor starts before 'since' are skipped
+            first_received = [self._first_received_at(base_offset) for base_offset in segments[start:]]
+            start += max(0, bisect.bisect_right(first_received, since) - 1)
+        for base_offset in segments[start:]:
+            index = _read_index(self._path(base_offset, "idx"))
+            position = 0
+            for offset, received_at, entry_position in index:
+                if offset > from_offset or (since is not None and received_at > since):
+                    break
+                position = entry_position
+            with open(self._path(base_offset, "log"), "rb") as segment:
+                for _, (offset, received_at, body) in _scan(segment, position):
+                    if offset < from_offset or (since is not None and received_at < since):
+                        continue
+                    yield offset, received_at, body
+
+    def _first_received_at(self, base_offset: int) -> float:
+        # The first record of a segment is always indexed; an empty segment sorts last
+        path = self._path(base_offset, "idx")
+        if not os.path.exists(path):
+            return float("inf")
+        with open(path, "rb") as index_file:
+            entry = index_file.read(INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(entry)[1] if len(entry) == INDEX_ENTRY.size else float("inf")
+
+    def _list_segments(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log") and name[:-4].isdigit())
+
+    def _path(self, base_offset: int, extension: str) -> str:
+        return os.path.join(self.directory, f"{_segment_name(base_offset)}.{extension}")
+
+    @contextmanager
+    def _directory_locked(self) -> Iterator[None]:
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_head(self) -> Tuple[int, int, int, int, float]:
+        """
+        Returns the committed state, cutting off anything written after it. Called with the directory locked.
+        """
+        try:
+            with open(os.path.join(self.directory, HEAD_FILE), "rb") as head_file:
+                data = head_file.read()
+        except FileNotFoundError:
+            data = b""
+        head = HEAD_STATE.unpack(data) if len(data) == HEAD_STATE.size else self._scan_head()
+        _, base_offset, end, _, _ = head
+        path = self._path(base_offset, "log")
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            logger.warning("Truncating uncommitted records at %s:%d", path, end)
+            with open(path, "r+b") as segment:
+                segment.truncate(end)
+            # Drop index entries that point into the truncated tail
+            index_path = self._path(base_offset, "idx")
+            entries = [entry for entry in _read_index(index_path) if entry[2] < end]
+            with open(index_path, "wb") as index_file:
+                index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+        return head
+
+    def _scan_head(self) -> Tuple[int, int, int, int, float]:
+        # Logs written before HEAD existed: the last segment ends at its last intact record
+        segments = self._list_segments()
+        if not segments:
+            return 0, 0, 0, -INDEX_INTERVAL_BYTES, 0.0
+        base_offset = segments[-1]
+        next_offset, end, last_received_at = base_offset, 0, 0.0
+        with open(self._path(base_offset, "log"), "rb") as segment:
+            for position, (offset, received_at, body) in _scan(segment, 0):
+                next_offset, last_received_at = offset + 1, received_at
+                end = position + RECORD_HEADER.size + len(body)
+        positions = [entry[2] for entry in _read_index(self._path(base_offset, "idx")) if entry[2] < end]
+        return next_offset, base_offset, end, positions[-1] if positions else -INDEX_INTERVAL_BYTES, last_received_at
+
+    def _write_pending(self) -> None:
+        with self._directory_locked():
+            next_offset, base_offset, end, last_indexed, last_received_at = self._read_head()
+            start, records, entries = end, [], []
+            for received_at, body in self._pending:
+                if end >= self.segment_bytes:
+                    self._write_segment(base_offset, start, records, entries)
+                    base_offset, start, end, last_indexed = next_offset, 0, 0, -INDEX_INTERVAL_BYTES
+                    records, entries = [], []
+                    logger.info("Started event log segment %s", _segment_name(base_offset))
+                # Other writers may have committed later events first; reads by time rely on times not going back
+                last_received_at = max(received_at, last_received_at)
+                if end - last_indexed >= INDEX_INTERVAL_BYTES:
+                    entries.append(INDEX_ENTRY.pack(next_offset, last_received_at, end))
+                    last_indexed = end
+                records.append(RECORD_HEADER.pack(next_offset, last_received_at, len(body), zlib.crc32(body)))
+                records.append(body)
+                end += RECORD_HEADER.size + len(body)
+                next_offset += 1
+            self._write_segment(base_offset, start, records, entries)
+            self._write_head(HEAD_STATE.pack(next_offset, base_offset, end, last_indexed, last_received_at))
+        self._pending, self._pending_bytes = [], 0
+        self.next_offset = next_offset
+
+    def _write_segment(self, base_offset: int, start: int, records: List[bytes], entries: List[bytes]) -> None:
+        # A new segment may hold leftovers of a roll that was never committed
+        with open(self._path(base_offset, "log"), "r+b" if start else "wb") as segment:
+            segment.seek(start)
+            segment.write(b"".join(records))
+            segment.flush()
+            os.fsync(segment.fileno())
+        with open(self._path(base_offset, "idx"), "ab" if start else "wb") as index_file:
+            index_file.write(b"".join(entries))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+    def _write_head(self, state: bytes) -> None:
+        path = os.path.join(self.directory, HEAD_FILE)
+        with open(f"{path}.tmp", "wb") as head_file:
+            head_file.write(state)
+            head_file.flush()
+            os.fsync(head_file.fileno())
+        os.replace(f"{path}.tmp", path)
+
+
+def replay(
+    log: EventLog,
+    dispatch: Callable[[Dict[str, Any]], None],
+    from_offset: int = 0,
+    since: Optional[float] = None,
+    limit: Optional[int] = None,
+    rate: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Sends logged events back through the dispatch path.
+
+    :param log: The event log to read.
+    :param dispatch: Called with each parsed event payload.
+    :param from_offset: First offset to replay.
+    :param since: Optional Unix time; earlier events are skipped.
+    :param limit: Maximum number of events to replay.
+    :param rate: Maximum events per second; unlimited by default.
+    :return: Counts of 'replayed' and 'failed' events and the 'last_offset' replayed.
+    """
+    summary: Dict[str, Any] = {"replayed": 0, "failed": 0, "last_offset": None}
+    interval = 1.0 / rate if rate else 0.0
+    next_at = time.monotonic()
+    for offset, _, body in log.read(from_offset, since):
+        if limit is not None and summary["replayed"] + summary["failed"] >= limit:
+            break
+        if interval:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at = max(next_at, time.monotonic() - interval) + interval
+        try:
+            dispatch(json.loads(body))
+            summary["replayed"] += 1
+        except Exception as exc:
+            summary["failed"] += 1
+            logger.error("Replay of event at offset %d failed: %s", offset, exc)
+        summary["last_offset"] = offset
+    return summary
+
+
+def dispatch_payload(payload: Dict[str, Any]) -> None:
+    """
+    Runs the registered handlers for a logged payload, bypassing deduplication.
+
+    :param payload: A webhook payload with 'event' and 'data'.
+    """
+    registry.dispatch(payload["event"]["event_type"], payload.get("data") or {})
+
+
+event_log = EventLog()
+
+_flush_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _flush_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(event_log.flush)
+        except Exception as exc:
+            logger.error("Failed to flush webhook event log: %s", exc)
+
+
+async def start_event_log() -> None:
+    """
+    Opens the event log and starts the periodic flush. Intended as an application startup handler.
+    """
+    global _flush_task
+    try:
+        await run_in_threadpool(event_log.open)
+    except OSError as exc:
+        logger.error("Failed to open webhook event log in %s: %s", event_log.directory, exc)
+        return
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_periodically(WEBHOOK_EVENT_LOG_FLUSH_SECONDS))
+
+
+async def stop_event_log() -> None:
+    """
+    Stops the periodic flush and closes the log. Intended as an application shutdown handler.
+    """
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await run_in_threadpool(event_log.close)
+
+
+def _parse_since(value: str) -> float:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Command-line entry point for replaying logged webhook events.
+
+    :param argv: Optional argument list; defaults to sys.argv.
+    :return: The process exit code.
+    """
+    parser = argparse.ArgumentParser(description="Replay logged webhook events through the handlers.")
+    parser.add_argument("command", choices=["replay"], help="'replay' re-dispatches logged events.")
+    parser.add_argument("--dir", default=WEBHOOK_EVENT_LOG_DIR, help="Event log directory.")
+    parser.add_argument("--from-offset", type=int, default=0, help="First offset to replay.")
+    parser.add_argument("--since", type=_parse_since, help="ISO timestamp (UTC if no offset) to replay from.")
+    parser.add_argument("--limit", type=int, help="Maximum number of events to replay.")
+    parser.add_argument("--rate", type=float, default=50.0, help="Maximum events per second.")
+    parser.add_argument("--dry-run", action="store_true", help="Print events instead of dispatching them.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    dispatch = (lambda payload: print(json.dumps(payload))) if args.dry_run else dispatch_payload
+    summary = replay(EventLog(args.dir), dispatch, args.from_offset, args.since, args.limit, args.rate)
+    logger.info("Replayed %d event(s), %d failed, last offset %s",
+                summary["replayed"], summary["failed"], summary["last_offset"])
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
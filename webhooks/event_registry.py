@@ -0,0 +1,153 @@
+"""
+Registry that maps webhook event types to their handlers.
+
+Handlers register with a decorator:
+
+    @on_event("charge.succeeded")
+    def handle_charge_succeeded(event_data): ...
+
+A type can have several handlers, and a pattern ending in "*" (for example
+"charge.*", or "*" for everything) subscribes to every matching type. The
+handlers for a type are resolved once and cached, so dispatch is a single dict
+lookup. Calls, errors and handler time are counted per event type.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[Dict[str, Any]], Any]
+
+# Bound on cached resolutions, so a flood of distinct event types cannot grow the cache forever.
+MAX_RESOLVED_TYPES = 1024
+
+
+def handler_name(handler: EventHandler) -> str:
+    """
+    Returns the dotted name that identifies a handler across processes and deploys.
+    """
+    return f"{handler.__module__}.{handler.__qualname__}"
+
+
+class UnsupportedEventError(Exception):
+    """
+    Raised when no handler is registered for an event type.
+    """
+    pass
+
+
+class EventRegistry:
+    """
+    Event type to handler mapping with per-type metrics.
+    """
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[EventHandler]] = defaultdict(list)
+        self._resolved: Dict[str, Tuple[EventHandler, ...]] = {}
+        self._metrics: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"dispatched": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        self._lock = threading.Lock()
+
+    def on(self, event_type: str) -> Callable[[EventHandler], EventHandler]:
+        """
+        Decorator that subscribes a handler to an event type or wildcard pattern.
+
+        :param event_type: An exact type such as 'charge.succeeded', or a pattern ending in '*'.
+        :return: A decorator that registers the handler and returns it unchanged.
+        """
+        def register(handler: EventHandler) -> EventHandler:
+            with self._lock:
+                self._handlers[event_type].append(handler)
+                self._resolved = {}
+            return handler
+        return register
+
+    def handlers_for(self, event_type: str) -> Tuple[EventHandler, ...]:
+        """
+        Returns every handler subscribed to an event type, exact matches first.
+        """
+        handlers = self._resolved.get(event_type)
+        if handlers is None:
+            handlers = self._resolve(event_type)
+            if len(self._resolved) < MAX_RESOLVED_TYPES:
+                self._resolved[event_type] = handlers
+        return handlers
+
+    def _resolve(self, event_type: str) -> Tuple[EventHandler, ...]:
+        with self._lock:
+            handlers = list(self._handlers.get(event_type, ()))
+            for pattern, subscribed in self._handlers.items():
+                if pattern.endswith("*") and event_type.startswith(pattern[:-1]):
+                    handlers.extend(subscribed)
+        return tuple(handlers)
+
+    def dispatch(self, event_type: str, event_data: Dict[str, Any]) -> int:
+        """
+        Calls every handler subscribed to an event type.
+
+        All handlers run even if one fails; the first error is re-raised afterwards.
+
+        :param event_type: The type of the event.
+        :param event_data: The event's data, passed to each handler.
+        :return: The number of handlers called.
+        :raises UnsupportedEventError: If no handler is subscribed to the type.
+        """
+        handlers = self.handlers_for(event_type)
+        if not handlers:
+            raise UnsupportedEventError(f"Unsupported event type: {event_type}")
+
+        first_error = None
+        for handler in handlers:
+            try:
+                self.call(event_type, handler, event_data)
+            except Exception as exc:
+                first_error = first_error or exc
+        if first_error is not None:
+            raise first_error
+        return len(handlers)
+
+    def call(self, event_type: str, handler: EventHandler, event_data: Dict[str, Any]) -> None:
+        """
+        Calls one handler for an event, counting it in the event type's metrics.
+
+        :param event_type: The type of the event.
+        :param handler: The handler to call.
+        :param event_data: The event's data.
+        :raises Exception: Whatever the handler raised.
+        """
+        metrics = self._metrics[event_type]
+        started = time.perf_counter()
+        try:
+            handler(event_data)
+        except Exception as exc:
+            metrics["errors"] += 1
+            logger.error("Handler %s failed for %s: %s", handler.__name__, event_type, exc)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics["dispatched"] += 1
+            metrics["total_seconds"] += elapsed
+            metrics["max_seconds"] = max(metrics["max_seconds"], elapsed)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns handler call counts, error counts and timings per event type.
+        """
+        return {
+            event_type: {
+                "dispatched": int(metrics["dispatched"]),
+                "errors": int(metrics["errors"]),
+                "avg_ms": round(1000 * metrics["total_seconds"] / metrics["dispatched"], 3) if metrics["dispatched"] else 0.0,
+                "max_ms": round(1000 * metrics["max_seconds"], 3),
+            }
+            for event_type, metrics in list(self._metrics.items())
+        }
+
+
+registry = EventRegistry()
+on_event = registry.on
@@ -0,0 +1,250 @@
+"""
+Reading webhook request bodies sent with Content-Encoding gzip or zstd.
+
+Bodies are decompressed while they stream in, and reading stops as soon as the
+decoded size passes WEBHOOK_MAX_BODY_BYTES, so a small compressed body cannot
+expand into an unbounded amount of memory. Uncompressed bodies are held to the
+same limit. Callers verify signatures over the decoded bytes.
+"""
+
+import os
+import zlib
+from typing import AsyncIterator, List, Optional
+
+import zstandard
+
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+# Largest zstd window a sender may use; bounds decoder memory independently of the body limit
+ZSTD_MAX_WINDOW_BYTES = 8 * 1024 * 1024
+# Decoded bytes produced per decompression step
+DECODE_CHUNK_BYTES = 64 * 1024
+# Idle zstd decompression contexts kept for reuse
+ZSTD_POOL_SIZE = 16
+
+SUPPORTED_ENCODINGS = ("identity", "gzip", "zstd")
+
+
+class RequestBodyError(Exception):
+    """
+    Base class for request bodies that cannot be read.
+    """
+    pass
+
+
+class RequestBodyTooLargeError(RequestBodyError):
+    """
+    Raised when the decoded body exceeds the size limit.
+    """
+    pass
+
+
+class UnsupportedContentEncodingError(RequestBodyError):
+    """
+    Raised for a Content-Encoding other than gzip, zstd or identity.
+    """
+    pass
+
+
+class InvalidCompressedBodyError(RequestBodyError):
+    """
+    Raised when a compressed body is corrupt or truncated.
+    """
+    pass
+
+
+class _BoundedBuffer:
+    """
+    Collects decoded chunks, failing once their total passes the limit.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestBodyTooLargeError(f"Request body exceeds {self.max_bytes} bytes once decoded.")
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+class _GzipDecoder:
+    def __init__(self, sink: _BoundedBuffer) -> None:
+        self.sink = sink
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def feed(self, data: bytes) -> None:
+        while data:
+            try:
+                # max_length keeps each step's output small so the limit is checked before memory grows
+                self.sink.write(self._decompressor.decompress(data, DECODE_CHUNK_BYTES))
+            except zlib.error as exc:
+                raise InvalidCompressedBodyError(f"Invalid gzip body: {exc}") from exc
+            if self._decompressor.eof:
+                # Concatenated gzip members decode as one body
+                data = self._decompressor.unused_data
+                if data:
+                    self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = self._decompressor.unconsumed_tail
+
+    def finish(self) -> None:
+        if not self._decompressor.eof:
+            raise InvalidCompressedBodyError("Truncated gzip body.")
+
+
+# States of _ZstdFrames and the size of the field each one reads
+_MAGIC, _SKIPPABLE_SIZE, _DESCRIPTOR, _BLOCK_HEADER = "magic", "skippable_size", "descriptor", "block_header"
+_FIELD_BYTES = {_MAGIC: 4, _SKIPPABLE_SIZE: 4, _DESCRIPTOR: 1, _BLOCK_HEADER: 3}
+_ZSTD_MAGIC = 0xFD2FB528
+_ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+
+
+class _ZstdFrames:
+    """
+    Follows frame and block boundaries in a zstd stream without decoding it.
+
+    The stream writer does not report where a frame ends, so this reads the
+    frame and block headers to tell a complete body from a truncated one.
+    """
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self._checksum_bytes = 0
+        self._field = bytearray()
+        self._expect(_MAGIC)
+
+    @property
+    def complete(self) -> bool:
+        return self.frames > 0 and self._state == _MAGIC and not self._skip and not self._field
+
+    def _expect(self, state: str, skip: int = 0) -> None:
+        self._state = state
+        self._skip = skip
+
+    def feed(self, data: bytes) -> None:
+        position = 0
+        while position < len(data):
+            if self._skip:
+                step = min(self._skip, len(data) - position)
+                self._skip -= step
+                position += step
+                continue
+            step = min(_FIELD_BYTES[self._state] - len(self._field), len(data) - position)
+            self._field += data[position:position + step]
+            position += step
+            if len(self._field) == _FIELD_BYTES[self._state]:
+                value = int.from_bytes(self._field, "little")
+                self._field.clear()
+                self._read_field(value)
+
+    def _read_field(self, value: int) -> None:
+        if self._state == _MAGIC:
+            if value == _ZSTD_MAGIC:
+                self._expect(_DESCRIPTOR)
+            elif value & 0xFFFFFFF0 == _ZSTD_SKIPPABLE_MAGIC:
+                self._expect(_SKIPPABLE_SIZE)
+            else:
+                raise InvalidCompressedBodyError("Invalid zstd body: unknown frame magic number.")
+        elif self._state == _SKIPPABLE_SIZE:
+            self._expect(_MAGIC, skip=value)
+        elif self._state == _DESCRIPTOR:
+            single_segment = value >> 5 & 1
+            self._checksum_bytes = 4 if value & 4 else 0
+            header_bytes = (
+                (0 if single_segment else 1)  # window descriptor
+                + (0, 1, 2, 4)[value & 3]  # dictionary ID
+                + (single_segment, 2, 4, 8)[value >> 6]  # frame content size
+            )
+            self._expect(_BLOCK_HEADER, skip=header_bytes)
+        else:
+            block_type, block_size = value >> 1 & 3, value >> 3
+            if block_type == 3:
+                raise InvalidCompressedBodyError("Invalid zstd body: reserved block type.")
+            # An RLE block carries a single byte however large its decoded size
+            content_bytes = 1 if block_type == 1 else block_size
+            if value & 1:
+                self.frames += 1
+                self._expect(_MAGIC, skip=content_bytes + self._checksum_bytes)
+            else:
+                self._expect(_BLOCK_HEADER, skip=content_bytes)
+
+
+class _ZstdDecoder:
+    # Decompression contexts are reused across requests, which halves the cost of
+    # small bodies; each one serves a single request at a time
+    _idle: List[zstandard.ZstdDecompressor] = []
+
+    def __init__(self, sink: _BoundedBuffer) -> None:
+        idle = _ZstdDecoder._idle
+        self._decompressor = idle.pop() if idle else zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_BYTES)
+        # The writer hands decoded output to the sink DECODE_CHUNK_BYTES at a time
+        self._writer = self._decompressor.stream_writer(sink, write_size=DECODE_CHUNK_BYTES, closefd=False)
+        self._frames = _ZstdFrames()
+
+    def feed(self, data: bytes) -> None:
+        try:
+            self._writer.write(data)
+        except zstandard.ZstdError as exc:
+            raise InvalidCompressedBodyError(f"Invalid zstd body: {exc}") from exc
+        self._frames.feed(data)
+
+    def finish(self) -> None:
+        try:
+            self._writer.flush()
+        except zstandard.ZstdError as exc:
+            raise InvalidCompressedBodyError(f"Invalid zstd body: {exc}") from exc
+        if not self._frames.complete:
+            raise InvalidCompressedBodyError("Truncated zstd body.")
+        # Only contexts that finished cleanly go back to the pool
+        if len(_ZstdDecoder._idle) < ZSTD_POOL_SIZE:
+            _ZstdDecoder._idle.append(self._decompressor)
+
+
+class _IdentityDecoder:
+    def __init__(self, sink: _BoundedBuffer) -> None:
+        self.sink = sink
+
+    def feed(self, data: bytes) -> None:
+        self.sink.write(data)
+
+    def finish(self) -> None:
+        pass
+
+
+_DECODERS = {"identity": _IdentityDecoder, "gzip": _GzipDecoder, "x-gzip": _GzipDecoder, "zstd": _ZstdDecoder}
+
+
+async def read_body(
+    chunks: AsyncIterator[bytes],
+    content_encoding: Optional[str] = None,
+    max_bytes: int = WEBHOOK_MAX_BODY_BYTES,
+) -> bytes:
+    """
+    Reads and decodes a request body as it streams in.
+
+    :param chunks: The raw body chunks, e.g. request.stream().
+    :param content_encoding: The Content-Encoding header; None or 'identity' for plain bodies.
+    :param max_bytes: Maximum size of the decoded body.
+    :return: The decoded body.
+    :raises UnsupportedContentEncodingError: If the encoding is not gzip, zstd or identity.
+    :raises RequestBodyTooLargeError: If the decoded body is larger than max_bytes.
+    :raises InvalidCompressedBodyError: If the compressed body is corrupt or truncated.
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    decoder_class = _DECODERS.get(encoding)
+    if decoder_class is None:
+        raise UnsupportedContentEncodingError(
+            f"Unsupported Content-Encoding {content_encoding!r}; use one of {', '.join(SUPPORTED_ENCODINGS)}."
+        )
+    sink = _BoundedBuffer(max_bytes)
+    decoder = decoder_class(sink)
+    async for chunk in chunks:
+        decoder.feed(chunk)
+    decoder.finish()
+    return sink.getvalue()
@@ -0,0 +1,348 @@
+"""
+Deduplication of redelivered webhook events by event_id.
+
+Recently seen ids are kept in a bounded in-memory TTL set, so a redelivery to
+the same process is dropped without touching the database. Every other event
+is claimed with a single INSERT ... ON CONFLICT DO NOTHING into
+processed_webhook_events: that one statement both records a fresh event and
+detects one already claimed by another worker or before a restart, so a fresh
+event costs no extra lookup. A claim is released if the handlers fail, so the
+sender's retry is processed again.
+
+Claims are written as 'pending' with the event's payload and marked 'done' once
+the handlers have finished. The claim is committed before the handlers run, so a
+worker that dies in between would otherwise lose the event: queued events have
+already been acknowledged and are never redelivered. Claims still pending after
+WEBHOOK_DEDUPE_PENDING_TIMEOUT_SECONDS are taken over, one owner at a time, by
+a redelivery of the event or by the periodic recovery, which dispatches them
+again from their stored payload. The same periodic task deletes completed claims
+once they are older than WEBHOOK_DEDUPE_RETENTION_SECONDS, which must cover the
+sender's redelivery window.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, ContextManager, Dict, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from webhooks import dead_letter
+from webhooks.webhooks_models import ProcessedWebhookEvent, WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DEDUPE_TTL_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "86400"))
+WEBHOOK_DEDUPE_MAX_ENTRIES = int(os.getenv("WEBHOOK_DEDUPE_MAX_ENTRIES", "100000"))
+# Must exceed the longest handler run, retries included, or events are handled twice.
+WEBHOOK_DEDUPE_PENDING_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_PENDING_TIMEOUT_SECONDS", "600"))
+WEBHOOK_DEDUPE_RECOVERY_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_RECOVERY_SECONDS", "60"))
+WEBHOOK_DEDUPE_RECOVERY_BATCH = int(os.getenv("WEBHOOK_DEDUPE_RECOVERY_BATCH", "100"))
+# Completed claims are kept this long, so redeliveries within the window are still caught.
+WEBHOOK_DEDUPE_RETENTION_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_RETENTION_SECONDS", str(7 * 86400)))
+WEBHOOK_DEDUPE_PRUNE_SECONDS = float(os.getenv("WEBHOOK_DEDUPE_PRUNE_SECONDS", "3600"))
+
+PENDING = "pending"
+DONE = "done"
+
+
+class RecentEventIds:
+    """
+    Thread-safe set of event ids that expire after a TTL, evicting the oldest when full.
+    """
+
+    def __init__(self, ttl_seconds: float = WEBHOOK_DEDUPE_TTL_SECONDS,
+                 max_entries: int = WEBHOOK_DEDUPE_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def __contains__(self, event_id: str) -> bool:
+        with self._lock:
+            expires = self._expires.get(event_id)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._expires[event_id]
+                return False
+            return True
+
+    def add(self, event_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._expires[event_id] = now + self.ttl_seconds
+            self._expires.move_to_end(event_id)
+            # Entries share one TTL, so insertion order is expiry order
+            while self._expires and (
+                len(self._expires) > self.max_entries or next(iter(self._expires.values())) < now
+            ):
+                self._expires.popitem(last=False)
+
+    def discard(self, event_id: str) -> None:
+        with self._lock:
+            self._expires.pop(event_id, None)
+
+
+class EventDeduplicator:
+    """
+    Claims event ids so each webhook event is handled once.
+    """
+
+    def __init__(
+        self,
+        recent: Optional[RecentEventIds] = None,
+        session_factory: Callable[[], ContextManager[Session]] = database.session_scope,
+        pending_timeout: float = WEBHOOK_DEDUPE_PENDING_TIMEOUT_SECONDS,
+    ) -> None:
+        self.recent = recent if recent is not None else RecentEventIds()
+        self.session_factory = session_factory
+        self.pending_timeout = pending_timeout
+        self.claimed = 0
+        self.duplicates_in_memory = 0
+        self.duplicates_in_database = 0
+        self.taken_over = 0
+        self.recovered = 0
+        self.pruned = 0
+
+    def claim(self, event_id: str, event_type: str, payload: Optional[str] = None) -> bool:
+        """
+        Records an event as being processed.
+
+        The claim stays pending until complete() is called. A pending claim older
+        than pending_timeout is taken over instead of being reported as a duplicate.
+
+        :param event_id: The sender's unique id for the event.
+        :param event_type: The type of the event.
+        :param payload: The event as JSON, kept so that recover_stale_claims() can process it again.
+        :return: True if the event is new and should be handled, False if it is a duplicate.
+        """
+        if event_id in self.recent:
+            self.duplicates_in_memory += 1
+            return False
+
+        now = datetime.utcnow()
+        with self.session_factory() as session:
+            inserted = database.insert_new(
+                session,
+                ProcessedWebhookEvent,
+                [{
+                    "event_id": event_id,
+                    "event_type": event_type,
+                    "processed_at": now,
+                    "status": PENDING,
+                    "payload": payload,
+                }],
+                ["event_id"],
+            )
+            # Only a conflicting claim costs the extra statement
+            taken_over = not inserted and self._take_over(session, event_id, now)
+            session.commit()
+        self.recent.add(event_id)
+        if taken_over:
+            self.taken_over += 1
+            logger.warning("Took over webhook event %s, whose claim was left pending", event_id)
+        elif not inserted:
+            self.duplicates_in_database += 1
+            return False
+        self.claimed += 1
+        return True
+
+    def complete(self, event_id: str) -> None:
+        """
+        Marks a claimed event as handled, so it is never processed again.
+
+        :param event_id: The event id whose handlers have finished.
+        """
+        try:
+            with self.session_factory() as session:
+                session.execute(
+                    update(ProcessedWebhookEvent)
+                    .where(ProcessedWebhookEvent.event_id == event_id)
+                    .values(status=DONE, payload=None)
+                )
+                session.commit()
+        except Exception as exc:
+            logger.error("Failed to complete webhook event %s; it may be processed again: %s", event_id, exc)
+
+    def release(self, event_id: str) -> None:
+        """
+        Forgets a claim after its handlers failed, so a redelivery is processed again.
+
+        :param event_id: The event id to release.
+        """
+        self.recent.discard(event_id)
+        try:
+            with self.session_factory() as session:
+                session.execute(delete(ProcessedWebhookEvent).where(ProcessedWebhookEvent.event_id == event_id))
+                session.commit()
+        except Exception as exc:
+            logger.error("Failed to release webhook event %s; redeliveries will be skipped: %s", event_id, exc)
+
+    def recover_stale_claims(self, dispatch: Callable[[str], Any], limit: int = WEBHOOK_DEDUPE_RECOVERY_BATCH) -> int:
+        """
+        Processes again the events whose claims were left pending, e.g. by a worker that died.
+
+        Each stale claim is taken over before it is dispatched, so concurrent
+        recoveries never process the same event. Claims without a payload cannot be
+        replayed and are released instead, so that a redelivery is processed.
+
+        :param dispatch: Called with the event's JSON payload; must handle the event or raise.
+        :param limit: Maximum number of claims to recover in this call.
+        :return: The number of events dispatched and completed.
+        """
+        now = datetime.utcnow()
+        with self.session_factory() as session:
+            stale = session.execute(
+                select(ProcessedWebhookEvent.event_id, ProcessedWebhookEvent.payload)
+                .where(
+                    ProcessedWebhookEvent.status == PENDING,
+                    ProcessedWebhookEvent.processed_at < now - timedelta(seconds=self.pending_timeout),
+                )
+                .order_by(ProcessedWebhookEvent.processed_at)
+                .limit(limit)
+            ).all()
+            owned = [(event_id, payload) for event_id, payload in stale if self._take_over(session, event_id, now)]
+            session.commit()
+
+        recovered = 0
+        for event_id, payload in owned:
+            if payload is None:
+                logger.warning("Releasing pending webhook event %s, which has no payload to recover", event_id)
+                self.release(event_id)
+                continue
+            try:
+                dispatch(payload)
+            except Exception as exc:
+                # Left pending: the next recovery after the timeout tries again
+                logger.error("Failed to recover webhook event %s: %s", event_id, exc)
+                continue
+            self.complete(event_id)
+            recovered += 1
+        self.recovered += recovered
+        return recovered
+
+    def prune(self, retention: float = WEBHOOK_DEDUPE_RETENTION_SECONDS) -> int:
+        """
+        Deletes completed claims older than the retention window.
+
+        :param retention: Seconds a completed claim is kept.
+        :return: The number of claims deleted.
+        """
+        with self.session_factory() as session:
+            pruned = prune_processed_events(session, timedelta(seconds=retention))
+        self.pruned += pruned
+        return pruned
+
+    def _take_over(self, session: Session, event_id: str, now: datetime) -> bool:
+        # Moves a stale pending claim's timestamp to now; only one of several racing callers matches
+        result = session.execute(
+            update(ProcessedWebhookEvent)
+            .where(
+                ProcessedWebhookEvent.event_id == event_id,
+                ProcessedWebhookEvent.status == PENDING,
+                ProcessedWebhookEvent.processed_at < now - timedelta(seconds=self.pending_timeout),
+            )
+            .values(processed_at=now)
+        )
+        return result.rowcount == 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns claim and duplicate counters.
+        """
+        return {
+            "claimed": self.claimed,
+            "duplicates_in_memory": self.duplicates_in_memory,
+            "duplicates_in_database": self.duplicates_in_database,
+            "taken_over": self.taken_over,
+            "recovered": self.recovered,
+            "pruned": self.pruned,
+            "recent_ids": len(self.recent),
+        }
+
+
+def prune_processed_events(session: Session, older_than: timedelta) -> int:
+    """
+    Deletes completed claim records older than the sender's redelivery window.
+
+    Pending claims are left for recover_stale_claims(), however old they are.
+
+    :param session: Database session used for the delete; committed on success.
+    :param older_than: Age beyond which records are no longer needed.
+    :return: The number of records deleted.
+    """
+    cutoff = datetime.utcnow() - older_than
+    result = session.execute(
+        delete(ProcessedWebhookEvent)
+        .where(ProcessedWebhookEvent.status == DONE, ProcessedWebhookEvent.processed_at < cutoff)
+    )
+    session.commit()
+    return result.rowcount
+
+
+deduplicator = EventDeduplicator()
+
+_recovery_task: Optional["asyncio.Task[None]"] = None
+
+
+def dispatch_recovered(payload: str) -> None:
+    """
+    Runs the handlers for a recovered event, with the dead-letter store's retries.
+
+    :param payload: The event as JSON, as stored with its claim.
+    """
+    dead_letter.dead_letter_store.dispatch(WebhookPayload.model_validate_json(payload))
+
+
+async def _recover_periodically(interval: float, prune_interval: float = WEBHOOK_DEDUPE_PRUNE_SECONDS) -> None:
+    next_prune = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(deduplicator.recover_stale_claims, dispatch_recovered)
+        except Exception as exc:
+            logger.error("Failed to recover pending webhook events: %s", exc)
+        if time.monotonic() < next_prune:
+            continue
+        next_prune = time.monotonic() + prune_interval
+        try:
+            pruned = await run_in_threadpool(deduplicator.prune, WEBHOOK_DEDUPE_RETENTION_SECONDS)
+            if pruned:
+                logger.info("Pruned %d completed webhook claim(s)", pruned)
+        except Exception as exc:
+            logger.error("Failed to prune completed webhook claims: %s", exc)
+
+
+async def start_claim_recovery() -> None:
+    """
+    Starts the periodic recovery of stale pending claims and pruning of completed ones.
+    Intended as an application startup handler.
+    """
+    global _recovery_task
+    if _recovery_task is None:
+        _recovery_task = asyncio.create_task(_recover_periodically(WEBHOOK_DEDUPE_RECOVERY_SECONDS))
+
+
+async def stop_claim_recovery() -> None:
+    """
+    Stops the periodic recovery. Intended as an application shutdown handler.
+    """
+    global _recovery_task
+    if _recovery_task is not None:
+        _recovery_task.cancel()
+        try:
+            await _recovery_task
+        except asyncio.CancelledError:
+            pass
+        _recovery_task = None
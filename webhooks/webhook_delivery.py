@@ -0,0 +1,499 @@
+"""
+Outbound delivery of platform events to merchant webhook endpoints.
+
+emit_event() fans an event out to every active endpoint subscribed to its
+type. Deliveries share one pooled httpx.AsyncClient, but each endpoint has its
+own concurrency cap and its own bound on pending deliveries, so a slow or
+failing merchant only ever queues behind itself. Failed deliveries (network
+errors, 429 and 5xx) are retried with exponential backoff and full jitter,
+without holding a concurrency slot while waiting. Bodies are signed with the
+endpoint's secret in the same X-Webhook-Signature format this service accepts.
+
+Endpoint changes bump a version row, as plan changes do for the plan catalog;
+every worker polls it every WEBHOOK_ENDPOINTS_REFRESH_SECONDS and reloads its
+endpoints when it moves.
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import database
+from webhooks.webhooks_models import WebhookEndpoint, WebhookEndpointsVersion
+from webhooks.webhooks_signature import SIGNATURE_HEADER, sign_payload
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DELIVERY_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DELIVERY_TIMEOUT_SECONDS", "10"))
+WEBHOOK_DELIVERY_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_DELIVERY_MAX_CONNECTIONS", "200"))
+WEBHOOK_DELIVERY_ENDPOINT_CONCURRENCY = int(os.getenv("WEBHOOK_DELIVERY_ENDPOINT_CONCURRENCY", "4"))
+WEBHOOK_DELIVERY_ENDPOINT_MAX_PENDING = int(os.getenv("WEBHOOK_DELIVERY_ENDPOINT_MAX_PENDING", "1000"))
+WEBHOOK_DELIVERY_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_DELIVERY_MAX_ATTEMPTS", "6"))
+WEBHOOK_DELIVERY_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_DELIVERY_BACKOFF_BASE_SECONDS", "1"))
+WEBHOOK_DELIVERY_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_DELIVERY_BACKOFF_MAX_SECONDS", "300"))
+WEBHOOK_ENDPOINTS_REFRESH_SECONDS = float(os.getenv("WEBHOOK_ENDPOINTS_REFRESH_SECONDS", "5"))
+
+_VERSION_ROW_ID = 1
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """
+    A merchant endpoint as seen by the delivery engine.
+    """
+
+    id: int
+    url: str
+    secret: str
+    event_types: Tuple[str, ...] = ("*",)
+
+    def accepts(self, event_type: str) -> bool:
+        return any(
+            pattern == event_type or (pattern.endswith("*") and event_type.startswith(pattern[:-1]))
+            for pattern in self.event_types
+        )
+
+
+@dataclass
+class _EndpointState:
+    semaphore: asyncio.Semaphore
+    pending: int = 0
+    in_flight: int = 0
+    delivered: int = 0
+    retried: int = 0
+    failed: int = 0
+    dropped: int = 0
+    last_status: Optional[int] = None
+    last_error: Optional[str] = None
+
+
+def backoff_delay(attempt: int, base: float = WEBHOOK_DELIVERY_BACKOFF_BASE_SECONDS,
+                  cap: float = WEBHOOK_DELIVERY_BACKOFF_MAX_SECONDS) -> float:
+    """
+    Returns a full-jitter exponential backoff delay.
+
+    :param attempt: The number of attempts made so far (1 after the first failure).
+    :param base: Delay ceiling after the first failure, in seconds.
+    :param cap: Maximum delay ceiling, in seconds.
+    :return: A random delay between 0 and min(cap, base * 2 ** (attempt - 1)).
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _is_retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class DeliveryEngine:
+    """
+    Delivers events to endpoints on one event loop with per-endpoint isolation.
+    """
+
+    def __init__(
+        self,
+        endpoint_concurrency: int = WEBHOOK_DELIVERY_ENDPOINT_CONCURRENCY,
+        endpoint_max_pending: int = WEBHOOK_DELIVERY_ENDPOINT_MAX_PENDING,
+        max_attempts: int = WEBHOOK_DELIVERY_MAX_ATTEMPTS,
+        timeout: float = WEBHOOK_DELIVERY_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.endpoint_concurrency = endpoint_concurrency
+        self.endpoint_max_pending = endpoint_max_pending
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.transport = transport
+        self._endpoints: Tuple[Endpoint, ...] = ()
+        self.endpoints_version: Optional[int] = None
+        self._states: Dict[int, _EndpointState] = {}
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.emitted = 0
+        self.skipped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._client is not None
+
+    def set_endpoints(self, endpoints: Sequence[Endpoint], version: Optional[int] = None) -> None:
+        """
+        Replaces the set of endpoints events are delivered to.
+
+        :param endpoints: The active endpoints.
+        :param version: The endpoints version stamp they were loaded at, if known.
+        """
+        self._endpoints = tuple(endpoints)
+        self.endpoints_version = version
+
+    async def start(self) -> None:
+        """
+        Opens the shared HTTP client on the running event loop.
+        """
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=WEBHOOK_DELIVERY_MAX_CONNECTIONS,
+                max_keepalive_connections=WEBHOOK_DELIVERY_MAX_CONNECTIONS,
+            ),
+            transport=self.transport,
+        )
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Waits briefly for in-flight deliveries, cancels the rest and closes the client.
+
+        :param timeout: Maximum time to wait for outstanding deliveries.
+        """
+        if self._client is None:
+            return
+        if self._tasks:
+            _, unfinished = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                logger.warning("Abandoned %d webhook deliveries on shutdown", len(unfinished))
+                await asyncio.gather(*unfinished, return_exceptions=True)
+        await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def emit(self, event_type: str, data: Dict[str, Any], event_id: Optional[str] = None) -> Optional[str]:
+        """
+        Queues an event for delivery to every subscribed endpoint. Safe to call from any thread.
+
+        :param event_type: The type of the event, e.g. 'charge.succeeded'.
+        :param data: JSON-serializable event data.
+        :param event_id: Optional id; a new one is generated by default.
+        :return: The event id, or None if the engine is not running.
+        """
+        loop = self._loop
+        if loop is None:
+            self.skipped += 1
+            return None
+        event_id = event_id or f"evt_{uuid.uuid4().hex}"
+        body = json.dumps(
+            {"event": {"event_id": event_id, "event_type": event_type}, "data": data},
+            separators=(",", ":"),
+            default=str,
+        ).encode("utf-8")
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            self._fan_out(event_type, body)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, event_type, body)
+        self.emitted += 1
+        return event_id
+
+    def _fan_out(self, event_type: str, body: bytes) -> None:
+        for endpoint in self._endpoints:
+            if not endpoint.accepts(event_type):
+                continue
+            state = self._state(endpoint)
+            if state.pending >= self.endpoint_max_pending:
+                state.dropped += 1
+                logger.error("Dropping %s for endpoint %s: %d deliveries pending", event_type, endpoint.id, state.pending)
+                continue
+            state.pending += 1
+            task = asyncio.create_task(self._deliver(endpoint, state, body))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _state(self, endpoint: Endpoint) -> _EndpointState:
+        state = self._states.get(endpoint.id)
+        if state is None:
+            state = self._states[endpoint.id] = _EndpointState(asyncio.Semaphore(self.endpoint_concurrency))
+        return state
+
+    async def _deliver(self, endpoint: Endpoint, state: _EndpointState, body: bytes) -> None:
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                async with state.semaphore:
+                    state.in_flight += 1
+                    try:
+                        error = await self._post(endpoint, state, body)
+                    finally:
+                        state.in_flight -= 1
+                if error is None:
+                    state.delivered += 1
+                    return
+                state.last_error = error
+                if attempt == self.max_attempts or error == "rejected":
+                    break
+                state.retried += 1
+                # Wait outside the semaphore so retries do not hold back fresh deliveries
+                await asyncio.sleep(backoff_delay(attempt))
+            state.failed += 1
+            logger.error("Giving up on delivery to endpoint %s: %s", endpoint.id, state.last_error)
+        finally:
+            state.pending -= 1
+
+    async def _post(self, endpoint: Endpoint, state: _EndpointState, body: bytes) -> Optional[str]:
+        assert self._client is not None
+        headers = {"Content-Type": "application/json", SIGNATURE_HEADER: sign_payload(body, endpoint.secret)}
+        try:
+            response = await self._client.post(endpoint.url, content=body, headers=headers)
+        except httpx.HTTPError as exc:
+            return f"{exc.__class__.__name__}: {exc}"
+        state.last_status = response.status_code
+        if response.is_success:
+            return None
+        return f"HTTP {response.status_code}" if _is_retryable(response.status_code) else "rejected"
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns delivery counters per endpoint.
+        """
+        return {
+            "running": self.running,
+            "emitted": self.emitted,
+            "skipped": self.skipped,
+            "endpoints": {
+                str(endpoint_id): {
+                    "pending": state.pending,
+                    "in_flight": state.in_flight,
+                    "delivered": state.delivered,
+                    "retried": state.retried,
+                    "failed": state.failed,
+                    "dropped": state.dropped,
+                    "last_status": state.last_status,
+                    "last_error": state.last_error,
+                }
+                for endpoint_id, state in list(self._states.items())
+            },
+        }
+
+
+def load_endpoints(session: Session) -> List[Endpoint]:
+    """
+    Reads the active merchant endpoints.
+
+    :param session: Database session to read from.
+    :return: The active endpoints.
+    """
+    rows = session.execute(select(WebhookEndpoint).where(WebhookEndpoint.is_active.is_(True))).scalars()
+    return [
+        Endpoint(
+            id=row.id,
+            url=row.url,
+            secret=row.secret,
+            event_types=tuple(pattern.strip() for pattern in row.event_types.split(",") if pattern.strip()),
+        )
+        for row in rows
+    ]
+
+
+def read_endpoints_version(session: Session) -> int:
+    """
+    Returns the current endpoints version stamp, or 0 if no endpoint has been changed yet.
+    """
+    version = session.execute(
+        select(WebhookEndpointsVersion.version).where(WebhookEndpointsVersion.id == _VERSION_ROW_ID)
+    ).scalar_one_or_none()
+    return version or 0
+
+
+def bump_endpoints_version(session: Session) -> None:
+    """
+    Increments the endpoints version stamp inside the caller's transaction.
+    """
+    result = session.execute(
+        update(WebhookEndpointsVersion)
+        .where(WebhookEndpointsVersion.id == _VERSION_ROW_ID)
+        .values(version=WebhookEndpointsVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(WebhookEndpointsVersion(id=_VERSION_ROW_ID, version=1))
+
+
+def reload_endpoints(session: Session) -> None:
+    """
+    Loads the active endpoints and their version stamp into the process-wide engine.
+    """
+    # Read the stamp first: a change committed in between is picked up again by the next poll
+    version = read_endpoints_version(session)
+    delivery_engine.set_endpoints(load_endpoints(session), version)
+
+
+def refresh_endpoints_if_changed(session: Session) -> bool:
+    """
+    Reloads the engine's endpoints if the stored version stamp differs from the loaded one.
+
+    :param session: Database session to read from.
+    :return: True if the endpoints were reloaded.
+    """
+    if read_endpoints_version(session) == delivery_engine.endpoints_version:
+        return False
+    reload_endpoints(session)
+    return True
+
+
+def resolve_host(host: str) -> List[str]:
+    """
+    Resolves a host name to the addresses it points at.
+
+    :raises ValueError: If the name does not resolve.
+    """
+    try:
+        return [info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)]
+    except socket.gaierror as exc:
+        raise ValueError(f"Endpoint host {host!r} could not be resolved.") from exc
+
+
+def validate_endpoint_url(url: str) -> None:
+    """
+    Checks that a merchant endpoint is a public https URL.
+
+    Deliveries are sent from inside the platform's network, so URLs whose host is, or
+    resolves to, a loopback, private, link-local or otherwise non-public address are
+    refused rather than letting registrations probe internal services.
+
+    :param url: The URL events would be posted to.
+    :raises ValueError: If the URL is not https, has no host or points at a non-public address.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https":
+        raise ValueError("Endpoint URL must use https.")
+    host = parts.hostname
+    if not host:
+        raise ValueError("Endpoint URL must include a host.")
+    try:
+        addresses = [str(ipaddress.ip_address(host))]
+    except ValueError:
+        addresses = resolve_host(host)
+    for address in addresses:
+        # Drop any IPv6 zone, e.g. 'fe80::1%eth0'
+        if not ipaddress.ip_address(address.split("%", 1)[0]).is_global:
+            raise ValueError(f"Endpoint host {host!r} is not a public address.")
+
+
+def register_endpoint(session: Session, url: str, event_types: Sequence[str] = ("*",)) -> WebhookEndpoint:
+    """
+    Stores a new merchant endpoint with a generated signing secret.
+
+    :param session: Database session used for the write; committed on success.
+    :param url: The URL events are posted to.
+    :param event_types: Event types or patterns ending in '*' the endpoint subscribes to.
+    :return: The stored endpoint, including its secret.
+    :raises ValueError: If the URL is rejected by validate_endpoint_url or no event types are given.
+    """
+    validate_endpoint_url(url)
+    if not event_types:
+        raise ValueError("At least one event type is required.")
+    endpoint = WebhookEndpoint(
+        url=url,
+        secret=f"whsec_{secrets.token_urlsafe(32)}",
+        event_types=",".join(event_types),
+        is_active=True,
+    )
+    session.add(endpoint)
+    bump_endpoints_version(session)
+    session.commit()
+    reload_endpoints(session)
+    return endpoint
+
+
+def deactivate_endpoint(session: Session, endpoint_id: int) -> Optional[WebhookEndpoint]:
+    """
+    Stops delivering events to a merchant endpoint; its row is kept.
+
+    Other workers stop delivering to it on their next version poll.
+
+    :param session: Database session used for the write; committed on success.
+    :param endpoint_id: The endpoint's ID.
+    :return: The deactivated endpoint, or None if there is no such endpoint.
+    """
+    endpoint = session.get(WebhookEndpoint, endpoint_id)
+    if endpoint is None:
+        return None
+    if endpoint.is_active:
+        endpoint.is_active = False
+        bump_endpoints_version(session)
+        session.commit()
+        reload_endpoints(session)
+        logger.info("Deactivated webhook endpoint %s", endpoint_id)
+    return endpoint
+
+
+delivery_engine = DeliveryEngine()
+
+
+def emit_event(event_type: str, data: Dict[str, Any]) -> Optional[str]:
+    """
+    Emits an event to merchant endpoints through the process-wide engine.
+
+    Does nothing while the engine is not running, so services can call this unconditionally.
+
+    :param event_type: The type of the event, e.g. 'invoice.created'.
+    :param data: JSON-serializable event data.
+    :return: The event id, or None if the engine is not running.
+    """
+    return delivery_engine.emit(event_type, data)
+
+
+_refresh_task: Optional["asyncio.Task[None]"] = None
+
+
+def _refresh_endpoints() -> None:
+    with database.session_scope() as session:
+        refresh_endpoints_if_changed(session)
+
+
+async def _refresh_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_refresh_endpoints)
+        except Exception as exc:
+            logger.error("Failed to refresh webhook endpoints: %s", exc)
+
+
+async def start_webhook_delivery() -> None:
+    """
+    Loads the merchant endpoints, starts the delivery engine and the endpoints version poll.
+
+    Intended as an application startup handler. A failed endpoint load is
+    logged and retried by the poll; the engine runs with no endpoints until then.
+    """
+    global _refresh_task
+    try:
+        await run_in_threadpool(_refresh_endpoints)
+    except Exception as exc:
+        logger.error("Failed to load webhook endpoints at startup: %s", exc)
+    await delivery_engine.start()
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_periodically(WEBHOOK_ENDPOINTS_REFRESH_SECONDS))
+
+
+async def stop_webhook_delivery() -> None:
+    """
+    Stops the endpoints version poll and the delivery engine. Intended as an application shutdown handler.
+    """
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+    await delivery_engine.stop()
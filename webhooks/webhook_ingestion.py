@@ -0,0 +1,264 @@
+"""
+Acknowledge-then-process webhook ingestion.
+
+When WEBHOOK_ASYNC_PROCESSING is enabled, receive_webhook verifies and parses
+an event, puts it on a bounded in-process queue and answers 200 straight away;
+a pool of workers drains the queue into the handlers. The queue is partitioned
+by the object an event is about (subscription, charge, ...), so events for one
+object are handled in order while different objects run in parallel. A full
+partition is reported as 429 so senders back off instead of piling up, and on
+shutdown the queue is drained before the workers stop.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_ASYNC_PROCESSING = os.getenv("WEBHOOK_ASYNC_PROCESSING", "false").lower() in ("1", "true", "yes")
+WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", "10000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_SECONDS", "30"))
+# Event data field identifying the object an event is about, by the object named
+# in its type ('charge.succeeded' is about a charge).
+OBJECT_KEY_FIELDS = {
+    "subscription": "subscription_id",
+    "charge": "charge_id",
+    "invoice": "invoice_id",
+    "customer": "customer_id",
+}
+
+WebhookHandler = Callable[..., None]
+
+
+class WebhookQueueError(Exception):
+    """
+    Base class for events the queue cannot accept.
+    """
+    pass
+
+
+class WebhookQueueFullError(WebhookQueueError):
+    """
+    Raised when the queue already holds its maximum number of events.
+    """
+    pass
+
+
+class WebhookQueueClosedError(WebhookQueueError):
+    """
+    Raised when the queue is not running or is draining for shutdown.
+    """
+    pass
+
+
+@dataclass
+class _Partition:
+    queue: "asyncio.Queue[Tuple[WebhookHandler, Tuple[Any, ...], float]]"
+    enqueued_at: Deque[float] = field(default_factory=deque)
+    processed: int = 0
+    high_water: int = 0
+    last_lag_seconds: float = 0.0
+    max_lag_seconds: float = 0.0
+
+
+def object_key(payload: Any) -> str:
+    """
+    Returns the key of the object an event is about, so its events stay in order.
+
+    The object is taken from the event type, not from whichever ID fields the
+    data happens to carry: a charge event that also names its subscription is
+    still ordered with the other events of that charge.
+
+    :param payload: A WebhookPayload.
+    :return: The ID of the event type's object from OBJECT_KEY_FIELDS (or the data's
+        'id'), or the event id for types without a known object.
+    """
+    data = payload.data or {}
+    name = OBJECT_KEY_FIELDS.get(payload.event.event_type.split(".", 1)[0])
+    if name is not None:
+        value = data.get(name, data.get("id"))
+        if value is not None:
+            return f"{name}:{value}"
+    return f"event_id:{payload.event.event_id}"
+
+
+class WebhookQueue:
+    """
+    Bounded, key-partitioned queue of webhook events processed by async workers.
+
+    Each worker owns one partition and events are assigned to partitions by a
+    stable hash of their object key, so events for the same object are handled
+    one at a time in arrival order while different objects run in parallel.
+    Handlers are synchronous and run in the thread pool, so a slow handler
+    occupies one worker without blocking the event loop.
+    """
+
+    def __init__(self, max_size: int = WEBHOOK_QUEUE_MAX_SIZE, workers: int = WEBHOOK_WORKERS) -> None:
+        if max_size <= 0 or workers <= 0:
+            raise ValueError("Queue size and worker count must be positive integers.")
+        self.max_size = max_size
+        self.workers = workers
+        # Capacity is split evenly, so one hot object can only fill its own partition
+        self.partition_size = max(1, -(-max_size // workers))
+        self._partitions: List[_Partition] = []
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._accepting = False
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.high_water = 0
+        self.last_lag_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def depth(self) -> int:
+        """
+        Returns the number of events waiting for a worker.
+        """
+        return sum(partition.queue.qsize() for partition in self._partitions)
+
+    def partition_for(self, key: str) -> int:
+        """
+        Returns the partition that events with this object key are processed on.
+        """
+        return zlib.crc32(key.encode("utf-8")) % self.workers
+
+    def enqueue(self, handler: WebhookHandler, *args: Any, key: Optional[str] = None) -> None:
+        """
+        Queues one event for processing without waiting.
+
+        :param handler: The function that processes the event.
+        :param args: Arguments passed to the handler.
+        :param key: Object key; events with the same key are processed in order.
+            Events without a key are spread across partitions.
+        :raises WebhookQueueClosedError: If the workers are not running.
+        :raises WebhookQueueFullError: If the event's partition is full.
+        """
+        if not self._accepting or not self._partitions:
+            raise WebhookQueueClosedError("Webhook queue is not accepting events.")
+        index = self.partition_for(key) if key is not None else self.enqueued % self.workers
+        partition = self._partitions[index]
+        now = time.monotonic()
+        try:
+            partition.queue.put_nowait((handler, args, now))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise WebhookQueueFullError("Webhook queue is full; retry later.") from None
+        partition.enqueued_at.append(now)
+        partition.high_water = max(partition.high_water, partition.queue.qsize())
+        self.enqueued += 1
+        self.high_water = max(self.high_water, self.depth())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns queue depth and processing counters, overall and per partition.
+
+        Partition lag is the age of the oldest waiting event; 'last_lag_seconds'
+        is how long the most recently started event waited.
+        """
+        now = time.monotonic()
+        return {
+            "running": self._accepting,
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "high_water": self.high_water,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "partitions": [
+                {
+                    "partition": index,
+                    "depth": partition.queue.qsize(),
+                    "high_water": partition.high_water,
+                    "processed": partition.processed,
+                    "lag_seconds": round(now - partition.enqueued_at[0], 3) if partition.enqueued_at else 0.0,
+                    "last_lag_seconds": round(partition.last_lag_seconds, 3),
+                    "max_lag_seconds": round(partition.max_lag_seconds, 3),
+                }
+                for index, partition in enumerate(self._partitions)
+            ],
+        }
+
+    async def start(self) -> None:
+        """
+        Creates the partitions and starts one worker per partition on the running event loop.
+        """
+        if self._accepting:
+            return
+        self._partitions = [_Partition(asyncio.Queue(maxsize=self.partition_size)) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._work(partition)) for partition in self._partitions]
+        self._accepting = True
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT_SECONDS) -> None:
+        """
+        Stops accepting events, waits for queued ones to finish and stops the workers.
+
+        :param timeout: Maximum time to wait for the queue to drain; events still
+            queued after that are logged as lost.
+        """
+        if not self._partitions:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(partition.queue.join() for partition in self._partitions)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.error("Webhook queue did not drain in %.1fs; %d event(s) lost", timeout, self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._partitions = []
+
+    async def _work(self, partition: _Partition) -> None:
+        queue = partition.queue
+        while True:
+            handler, args, enqueued_at = await queue.get()
+            partition.enqueued_at.popleft()
+            lag = time.monotonic() - enqueued_at
+            self.last_lag_seconds = partition.last_lag_seconds = lag
+            partition.max_lag_seconds = max(partition.max_lag_seconds, lag)
+            try:
+                await run_in_threadpool(handler, *args)
+                self.processed += 1
+                partition.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Error while processing queued webhook")
+            finally:
+                queue.task_done()
+
+
+webhook_queue = WebhookQueue()
+
+
+async def start_webhook_workers() -> None:
+    """
+    Starts the webhook workers when async processing is enabled.
+    Intended as an application startup handler.
+    """
+    if WEBHOOK_ASYNC_PROCESSING:
+        await webhook_queue.start()
+
+
+async def stop_webhook_workers() -> None:
+    """
+    Drains the webhook queue and stops its workers. Intended as an application shutdown handler.
+    """
+    await webhook_queue.stop()
@@ -1,7 +1,91 @@
 """Pydantic models for validating webhook payloads if needed."""
 
+from datetime import datetime
+
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.orm import declarative_base
+from typing import Any, Optional, Dict, List
+
+Base = declarative_base()
+
+
+class ProcessedWebhookEvent(Base):
+    """
+    SQLAlchemy model for the 'processed_webhook_events' table.
+
+    One row per event_id that has been claimed for processing, so redelivered
+    events are skipped across restarts and workers. A claim stays 'pending', with
+    the payload needed to process it again, until its handlers have finished.
+    """
+    __tablename__ = "processed_webhook_events"
+    __table_args__ = (
+        Index("ix_processed_webhook_events_status_processed_at", "status", "processed_at"),
+    )
+
+    event_id = Column(String, primary_key=True)
+    event_type = Column(String, nullable=False)
+    processed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # 'pending' while the handlers run, then 'done'
+    status = Column(String, nullable=False, default="done")
+    payload = Column(Text, nullable=True)
+
+
+class WebhookEndpoint(Base):
+    """
+    SQLAlchemy model for the 'webhook_endpoints' table.
+
+    A merchant URL that platform events are delivered to, signed with its own secret.
+    """
+    __tablename__ = "webhook_endpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    url = Column(String, nullable=False)
+    secret = Column(String, nullable=False)
+    # Comma-separated event types or patterns ending in '*'
+    event_types = Column(String, nullable=False, default="*")
+    is_active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class WebhookEndpointsVersion(Base):
+    """
+    SQLAlchemy model holding the single version stamp of the webhook endpoints.
+    Bumped on every endpoint change so each worker knows when to reload its endpoints.
+    """
+    __tablename__ = "webhook_endpoints_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DeadLetterEvent(Base):
+    """
+    SQLAlchemy model for the 'dead_letter_events' table.
+
+    One row per event and handler that kept failing, with the payload needed to
+    redrive that handler.
+    """
+    __tablename__ = "dead_letter_events"
+    __table_args__ = (
+        Index("ix_dead_letter_events_status_event_type_id", "status", "event_type", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, nullable=False, index=True)
+    event_type = Column(String, nullable=False)
+    # Dotted name of the failed handler; NULL on older rows, which redrive every handler
+    handler = Column(String, nullable=True)
+    payload = Column(Text, nullable=False)
+    error = Column(Text, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # 'dead' until a redrive succeeds, then 'redriven'
+    status = Column(String, nullable=False, default="dead")
+    received_at = Column(DateTime, nullable=False)
+    first_failed_at = Column(DateTime, nullable=False)
+    last_failed_at = Column(DateTime, nullable=False)
+    redriven_at = Column(DateTime, nullable=True)
 
 
 class WebhookEvent(BaseModel):
@@ -10,8 +94,8 @@ class WebhookEvent(BaseModel):
     This class can be extended to include additional fields or validations.
     """
 
-    event_id: str = Field(..., description="Unique identifier of the webhook event.")
-    event_type: str = Field(..., description="Type of the webhook event.")
+    event_id: str = Field(..., min_length=1, description="Unique identifier of the webhook event.")
+    event_type: str = Field(..., min_length=1, description="Type of the webhook event.")
     # TODO: Add more fields as needed
 
 
@@ -22,5 +106,49 @@ class WebhookPayload(BaseModel):
     """
 
     event: WebhookEvent = Field(..., description="The event associated with this payload.")
-    data: Optional[Dict[str, str]] = Field(None, description="Additional data related to the event.")
-    # TODO: Add more fields as needed
\ No newline at end of file
+    data: Optional[Dict[str, Any]] = Field(None, description="Additional data related to the event.")
+    # TODO: Add more fields as needed
+
+
+class WebhookEndpointCreate(BaseModel):
+    """
+    Request body for registering a merchant webhook endpoint.
+    """
+
+    url: str = Field(..., description="URL that events are posted to.")
+    event_types: List[str] = Field(["*"], min_length=1, description="Event types or patterns ending in '*'.")
+
+
+class WebhookEndpointCreated(BaseModel):
+    """
+    Response for a registered endpoint; the secret is only returned here.
+    """
+
+    id: int
+    url: str
+    event_types: List[str]
+    secret: str = Field(..., description="Secret used to sign deliveries to this endpoint.")
+
+
+class WebhookReplayRequest(BaseModel):
+    """
+    Request body for replaying logged webhook events through the handlers.
+    """
+
+    from_offset: int = Field(0, ge=0, description="First event log offset to replay.")
+    since: Optional[datetime] = Field(None, description="Only replay events received at or after this time (UTC).")
+    limit: int = Field(100, ge=1, le=1000, description="Maximum number of events to replay.")
+    rate: float = Field(50.0, gt=0, le=1000, description="Maximum events replayed per second.")
+
+
+class DeadLetterRedriveRequest(BaseModel):
+    """
+    Request body selecting dead-lettered events to re-dispatch.
+    """
+
+    event_type: Optional[str] = Field(None, description="Only redrive events of this type.")
+    since: Optional[datetime] = Field(None, description="Only redrive events that last failed at or after this time (UTC).")
+    until: Optional[datetime] = Field(None, description="Only redrive events that last failed before this time (UTC).")
+    error_contains: Optional[str] = Field(None, description="Only redrive events whose error contains this text.")
+    limit: int = Field(500, ge=1, le=10000, description="Maximum number of events to redrive.")
+    rate: float = Field(50.0, gt=0, le=1000, description="Maximum events redriven per second.")
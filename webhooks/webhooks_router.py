@@ -1,32 +1,121 @@
-from typing import Any, Dict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 import logging
+import os
 
-from fastapi import APIRouter, Request, HTTPException, status
+import orjson
+from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import get_db
+from utils.auth import require_admin
+
+from webhooks import dead_letter, event_log, request_body, webhook_dedupe, webhook_delivery, webhook_ingestion, webhooks_service, webhooks_signature  # noqa: F401 - registers handlers
+from webhooks.event_registry import UnsupportedEventError, registry
+from webhooks.webhooks_models import (
+    DeadLetterRedriveRequest,
+    WebhookEndpointCreate,
+    WebhookEndpointCreated,
+    WebhookPayload,
+    WebhookReplayRequest,
+)
 
 router = APIRouter()
+# Operator routes: they register outbound URLs, hand out secrets or expose and re-run events, so they require an admin token
+admin_router = APIRouter(dependencies=[Depends(require_admin)])
+
+WEBHOOK_BATCH_MAX_EVENTS = int(os.getenv("WEBHOOK_BATCH_MAX_EVENTS", "1000"))
 
+_batch_adapter = TypeAdapter(List[WebhookPayload])
 
-def webhook_receiver_endpoint(request_data: Dict[str, Any], headers: Dict[str, str]) -> None:
+
+def webhook_receiver_endpoint(request_data: WebhookPayload, headers: Optional[Mapping[str, str]] = None) -> str:
     """
-    Validates the signature and routes the event to the relevant handler.
+    Routes a verified event to the handlers registered for its type.
+
+    The signature is checked by receive_webhook on the raw body before this is called.
+    Events whose event_id was already claimed are skipped. Failing handlers are
+    retried and, once the retries are exhausted, the event is dead-lettered and
+    stays claimed; a claim is only released if the event could not be recorded,
+    so that the sender's retry is processed. The claim stays pending until then,
+    so a worker dying mid-way leaves the event to be recovered.
 
-    :param request_data: The JSON payload from the webhook event.
-    :param headers: The HTTP headers from the request.
-    :raises HTTPException: If signature validation fails or an event type is unsupported.
+    :param request_data: The validated payload from the webhook event.
+    :param headers: Optional request headers the handlers may need.
+    :return: 'success', 'duplicate' or 'dead_lettered'.
+    :raises HTTPException: If an event type is unsupported.
     """
-    # TODO: Implement signature validation
-    # signature = headers.get("X-Signature", "")
-    # if not valid_signature(signature, request_data):
-    #     raise HTTPException(status_code=400, detail="Invalid signature")
+    event_id, event_type = request_data.event.event_id, request_data.event.event_type
+    if not webhook_dedupe.deduplicator.claim(event_id, event_type, request_data.model_dump_json()):
+        logging.info("Skipping duplicate webhook event %s", event_id)
+        return "duplicate"
+    try:
+        handled = dead_letter.dead_letter_store.dispatch(request_data)
+    except UnsupportedEventError as exc:
+        webhook_dedupe.deduplicator.release(event_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    except Exception:
+        webhook_dedupe.deduplicator.release(event_id)
+        raise
+    webhook_dedupe.deduplicator.complete(event_id)
+    return "success" if handled else "dead_lettered"
+
+
+def _process_batch(payloads: List[WebhookPayload]) -> List[Dict[str, Any]]:
+    # Runs in one thread pool call for the whole batch; one failing event does not stop the rest
+    results = []
+    for payload in payloads:
+        try:
+            results.append({"status": webhook_receiver_endpoint(payload)})
+        except HTTPException as exc:
+            results.append({"status": "rejected", "detail": exc.detail})
+        except Exception:
+            logging.exception("Error while processing webhook %s", payload.event.event_id)
+            results.append({"status": "failed", "detail": "Internal Server Error"})
+    return results
+
+
+async def _read_body(request: Request) -> bytes:
+    # Decompresses gzip and zstd bodies while they stream in, within the size limit
+    try:
+        return await request_body.read_body(request.stream(), request.headers.get("Content-Encoding"))
+    except request_body.UnsupportedContentEncodingError as exc:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(exc)) from exc
+    except request_body.RequestBodyTooLargeError as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc)) from exc
+    except request_body.InvalidCompressedBodyError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+
+def _verify_request(body: bytes, request: Request) -> None:
+    try:
+        webhooks_signature.verify_signature(body, request.headers.get(webhooks_signature.SIGNATURE_HEADER))
+    except webhooks_signature.MissingWebhookSignatureError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    except webhooks_signature.WebhookSignatureError as exc:
+        logging.debug("Rejected webhook: %s", exc)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid signature") from exc
 
-    # TODO: Route event to relevant handler
-    # event_type = request_data.get("event_type")
-    # if event_type == "some_event":
-    #     handle_some_event(request_data)
-    # else:
-    #     raise HTTPException(status_code=400, detail="Unsupported event type")
 
-    pass  # Remove once implemented
+def _parse_payload(body: bytes) -> WebhookPayload:
+    # orjson builds the dict once and pydantic validates it in place; this beats
+    # model_validate_json for typical payloads (see benchmarks/webhook_parsing.py)
+    try:
+        return WebhookPayload.model_validate(orjson.loads(body))
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload") from exc
+    except ValidationError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=exc.errors(include_url=False, include_context=False, include_input=False),
+        ) from exc
+
+
+def _log_event(body: bytes) -> None:
+    if event_log.event_log.is_open:
+        event_log.event_log.append(body)
 
 
 @router.post("/webhook")
@@ -34,14 +123,45 @@ async def receive_webhook(request: Request) -> Dict[str, str]:
     """
     FastAPI endpoint to receive webhook events.
 
+    Bodies may be sent with Content-Encoding gzip or zstd; the signature covers
+    the decoded body. When the webhook workers are running the event is queued
+    and acknowledged immediately; otherwise it is processed before responding.
+
     :param request: The incoming request object.
     :return: A dictionary indicating the result of the webhook processing.
-    :raises HTTPException: If validation or processing fails.
+    :raises HTTPException: 400 if the signature header or payload is missing or invalid,
+        403 if the signature is invalid, 413 if the decoded body is too large,
+        415 if the Content-Encoding is unsupported, 429 if the queue is full,
+        500 if processing fails.
     """
+    body = await _read_body(request)
+    _verify_request(body, request)
+
+    payload = _parse_payload(body)
+    event_type = payload.event.event_type
+    if not registry.handlers_for(event_type):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported event type: {event_type}")
+    if payload.event.event_id in webhook_dedupe.deduplicator.recent:
+        return {"status": "duplicate", "message": "Webhook already received."}
+
+    # Events are logged only once accepted, so throttled events the sender retries are not logged twice
+    if webhook_ingestion.webhook_queue.running:
+        try:
+            webhook_ingestion.webhook_queue.enqueue(
+                webhook_receiver_endpoint, payload, key=webhook_ingestion.object_key(payload)
+            )
+        except webhook_ingestion.WebhookQueueFullError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=str(exc),
+                headers={"Retry-After": "1"},
+            ) from exc
+        _log_event(body)
+        return {"status": "accepted", "message": "Webhook queued for processing."}
+
     try:
-        data = await request.json()
-        hdrs = dict(request.headers)
-        webhook_receiver_endpoint(data, hdrs)
+        if await run_in_threadpool(webhook_receiver_endpoint, payload) != "duplicate":
+            _log_event(body)
         return {"status": "success", "message": "Webhook received successfully."}
     except HTTPException:
         raise
@@ -50,4 +170,256 @@ async def receive_webhook(request: Request) -> Dict[str, str]:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal Server Error"
-        ) from exc
\ No newline at end of file
+        ) from exc
+
+
+def _parse_batch(body: bytes) -> Tuple[List[Any], List[Any]]:
+    # Returns the decoded items and, at the same index, each one's WebhookPayload or its errors.
+    # Validates the whole batch in one pass; per-item errors are only worked out if it fails
+    try:
+        items = orjson.loads(body)
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload") from exc
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a non-empty array of events")
+    if len(items) > WEBHOOK_BATCH_MAX_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch may hold at most {WEBHOOK_BATCH_MAX_EVENTS} events",
+        )
+    try:
+        return items, _batch_adapter.validate_python(items)
+    except ValidationError as exc:
+        errors: Dict[int, List[Dict[str, Any]]] = {}
+        for error in exc.errors(include_url=False, include_context=False, include_input=False):
+            errors.setdefault(error["loc"][0], []).append({**error, "loc": error["loc"][1:]})
+    valid = [index for index in range(len(items)) if index not in errors]
+    payloads = iter(_batch_adapter.validate_python([items[index] for index in valid]))
+    return items, [next(payloads) if index not in errors else errors[index] for index in range(len(items))]
+
+
+@router.post("/webhook/batch")
+async def receive_webhook_batch(request: Request, response: Response) -> Dict[str, Any]:
+    """
+    FastAPI endpoint to receive an array of webhook events in one request.
+
+    The signature covers the whole decoded body, which may be sent with
+    Content-Encoding gzip or zstd, and is checked once. Each event is then
+    handled as if it had been posted to /webhook on its own, and its outcome is
+    reported in 'results' at the same index: 'success', 'accepted' (queued),
+    'duplicate', 'dead_lettered', 'invalid', 'rejected' (unsupported type),
+    'throttled' (queue full; retry it later) or 'failed'.
+
+    :param request: The incoming request object.
+    :param response: The outgoing response; Retry-After is set if any event was throttled.
+    :return: A dictionary with the number of events 'received' and the per-event 'results'.
+    :raises HTTPException: 400 if the signature header is missing or the body is not an array,
+        403 if the signature is invalid, 413 if the decoded body or the batch is too large,
+        415 if the Content-Encoding is unsupported.
+    """
+    body = await _read_body(request)
+    _verify_request(body, request)
+
+    items, parsed = _parse_batch(body)
+    results: List[Dict[str, Any]] = [{} for _ in parsed]
+    to_dispatch: List[int] = []
+    seen = set()
+    queue = webhook_ingestion.webhook_queue
+    for index, payload in enumerate(parsed):
+        result = results[index]
+        result["index"] = index
+        if not isinstance(payload, WebhookPayload):
+            result.update(status="invalid", detail=payload)
+            continue
+        event_id, event_type = payload.event.event_id, payload.event.event_type
+        result["event_id"] = event_id
+        if not registry.handlers_for(event_type):
+            result.update(status="rejected", detail=f"Unsupported event type: {event_type}")
+            continue
+        if event_id in seen or event_id in webhook_dedupe.deduplicator.recent:
+            result["status"] = "duplicate"
+            continue
+        seen.add(event_id)
+
+        if queue.running:
+            try:
+                queue.enqueue(webhook_receiver_endpoint, payload, key=webhook_ingestion.object_key(payload))
+            except webhook_ingestion.WebhookQueueFullError as exc:
+                result.update(status="throttled", detail=str(exc))
+                response.headers["Retry-After"] = "1"
+                continue
+            result["status"] = "accepted"
+            # The item as the sender wrote it, not the model's dump with its defaults filled in
+            _log_event(orjson.dumps(items[index]))
+        else:
+            to_dispatch.append(index)
+
+    if to_dispatch:
+        outcomes = await run_in_threadpool(_process_batch, [parsed[index] for index in to_dispatch])
+        for index, outcome in zip(to_dispatch, outcomes):
+            results[index].update(outcome)
+            if outcome["status"] in ("success", "dead_lettered"):
+                _log_event(orjson.dumps(items[index]))
+    return {"received": len(parsed), "results": results}
+
+
+@router.get("/queue/metrics")
+async def get_webhook_queue_metrics() -> Dict[str, Any]:
+    """
+    Returns the depth and processing counters of the webhook queue.
+
+    :return: A dictionary of queue statistics.
+    """
+    return webhook_ingestion.webhook_queue.stats()
+
+
+@router.get("/events/metrics")
+async def get_webhook_event_metrics() -> Dict[str, Any]:
+    """
+    Returns handler call counts, error counts and timings per event type.
+
+    :return: A dictionary keyed by event type.
+    """
+    return registry.stats()
+
+
+@router.get("/dedupe/metrics")
+async def get_webhook_dedupe_metrics() -> Dict[str, Any]:
+    """
+    Returns claim and duplicate counters of the webhook deduplicator.
+
+    :return: A dictionary of deduplication statistics.
+    """
+    return webhook_dedupe.deduplicator.stats()
+
+
+@admin_router.post("/endpoints", response_model=WebhookEndpointCreated, status_code=status.HTTP_201_CREATED)
+def register_webhook_endpoint(
+    endpoint_data: WebhookEndpointCreate,
+    db: Session = Depends(get_db),
+) -> Dict[str, Any]:
+    """
+    Registers a merchant endpoint that platform events are delivered to.
+
+    :param endpoint_data: The endpoint URL and the event types it subscribes to.
+    :param db: Database session.
+    :return: The stored endpoint, including the secret its deliveries are signed with.
+    :raises HTTPException: 400 if the URL is not a public https URL or the event types are invalid.
+    """
+    try:
+        endpoint = webhook_delivery.register_endpoint(db, endpoint_data.url, endpoint_data.event_types)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    return {
+        "id": endpoint.id,
+        "url": endpoint.url,
+        "event_types": endpoint.event_types.split(","),
+        "secret": endpoint.secret,
+    }
+
+
+@admin_router.post("/endpoints/{endpoint_id}/deactivate")
+def deactivate_webhook_endpoint(endpoint_id: int, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """
+    Stops delivering platform events to a merchant endpoint.
+
+    :param endpoint_id: The endpoint's ID.
+    :param db: Database session.
+    :return: The endpoint's ID, URL, event types and active flag.
+    :raises HTTPException: 404 if there is no such endpoint.
+    """
+    endpoint = webhook_delivery.deactivate_endpoint(db, endpoint_id)
+    if endpoint is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Webhook endpoint not found")
+    return {
+        "id": endpoint.id,
+        "url": endpoint.url,
+        "event_types": endpoint.event_types.split(","),
+        "is_active": endpoint.is_active,
+    }
+
+
+@router.get("/delivery/metrics")
+async def get_webhook_delivery_metrics() -> Dict[str, Any]:
+    """
+    Returns outbound delivery counters per merchant endpoint.
+
+    :return: A dictionary of delivery statistics.
+    """
+    return webhook_delivery.delivery_engine.stats()
+
+
+@admin_router.post("/replay")
+async def replay_webhook_events(replay_request: WebhookReplayRequest) -> Dict[str, Any]:
+    """
+    Replays logged events through the registered handlers at a controlled rate.
+
+    Deduplication is bypassed, so handlers run again for every replayed event.
+
+    :param replay_request: Where to start, how many events and how fast.
+    :return: Counts of 'replayed' and 'failed' events and the 'last_offset' replayed.
+    """
+    since = None
+    if replay_request.since is not None:
+        since_utc = replay_request.since
+        if since_utc.tzinfo is None:
+            since_utc = since_utc.replace(tzinfo=timezone.utc)
+        since = since_utc.timestamp()
+    return await run_in_threadpool(
+        event_log.replay,
+        event_log.event_log,
+        event_log.dispatch_payload,
+        replay_request.from_offset,
+        since,
+        replay_request.limit,
+        replay_request.rate,
+    )
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@admin_router.get("/dead-letters")
+def list_dead_letter_events(
+    status_filter: str = Query("dead", alias="status", pattern="^(dead|redriven)$"),
+    event_type: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+) -> List[Dict[str, Any]]:
+    """
+    Lists dead-lettered events with their failed handler, error, attempt count and timing.
+
+    :param status_filter: 'dead' for events awaiting a redrive, 'redriven' for recovered ones.
+    :param event_type: Optional event type filter.
+    :param limit: Maximum number of events to return.
+    :param db: Database session.
+    :return: The matching events, oldest first.
+    """
+    return dead_letter.list_dead_letters(db, status_filter, event_type, limit)
+
+
+@admin_router.post("/dead-letters/redrive")
+async def redrive_dead_letter_events(
+    redrive_request: DeadLetterRedriveRequest,
+    db: Session = Depends(get_db),
+) -> Dict[str, int]:
+    """
+    Re-runs the failed handlers of a filtered set of dead-lettered events at a controlled rate.
+
+    :param redrive_request: Filters, how many events and how fast.
+    :param db: Database session.
+    :return: Counts of 'selected', 'redriven' and 'failed' events.
+    """
+    return await run_in_threadpool(
+        dead_letter.redrive,
+        db,
+        redrive_request.event_type,
+        _naive_utc(redrive_request.since),
+        _naive_utc(redrive_request.until),
+        redrive_request.error_contains,
+        redrive_request.limit,
+        redrive_request.rate,
+    )
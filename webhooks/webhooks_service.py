@@ -1,7 +1,29 @@
+import asyncio
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import database
+from subscriptions.proration import billing_period
+from subscriptions.subscriptions_models import Invoice, Subscription
+from webhooks.event_registry import on_event
 
 logger = logging.getLogger(__name__)
 
+# Extra time a batch waits for more events. Batches are written one at a time, so with 0
+# everything that arrives while one batch is being written goes into the next one.
+RENEWAL_BATCH_WINDOW_SECONDS = float(os.getenv("RENEWAL_BATCH_WINDOW_SECONDS", "0"))
+RENEWAL_BATCH_MAX_SIZE = int(os.getenv("RENEWAL_BATCH_MAX_SIZE", "1000"))
+# How long a handler thread waits for its renewal's batch before giving up.
+RENEWAL_BATCH_TIMEOUT_SECONDS = float(os.getenv("RENEWAL_BATCH_TIMEOUT_SECONDS", "30"))
+
+
+@on_event("charge.succeeded")
 def handle_charge_succeeded(event_data: dict) -> None:
     """
     Processes a successful charge event.
@@ -31,7 +53,7 @@ def handle_charge_succeeded(event_data: dict) -> None:
         logger.error("Missing key in event_data: %s", e)
         raise
 
-def handle_subscription_renewed(event_data: dict) -> None:
+def handle_subscription_renewed(event_data: dict, db_session: Optional[Session] = None) -> None:
     """
     Renews subscription on successful payment.
 
@@ -43,19 +65,250 @@ def handle_subscription_renewed(event_data: dict) -> None:
 
     :param event_data: The payload from the webhook event
     :type event_data: dict
+    :param db_session: Optional database session; when given, the renewal is applied
+        through the same path as batched renewals
     :raises KeyError: If expected keys are missing in the event data
+    :raises ValueError: If the subscription does not exist or is not active
     :return: None
     """
     try:
-        # TODO: Implement actual logic for handling subscription renewal
-        # Example: update subscription record in the database, notify user, etc.
-
-        # Example placeholder usage:
         subscription_id = event_data["subscription_id"]
         logger.info("Processing subscription renewal for subscription_id: %s", subscription_id)
-
-        # Additional business logic goes here
-
     except KeyError as e:
         logger.error("Missing key in event_data for subscription renewal: %s", e)
-        raise
\ No newline at end of file
+        raise
+
+    if db_session is not None:
+        error = apply_subscription_renewals([event_data], db_session)[0]
+        if error is not None:
+            raise error
+
+    # TODO: Notify the user about the successful renewal
+
+
+@on_event("subscription.renewed")
+def apply_subscription_renewal_event(event_data: dict) -> None:
+    """
+    Registered handler for 'subscription.renewed' events.
+
+    Renewals are applied through renewal_batcher, so concurrent handlers share one
+    UPDATE; without a running batcher the renewal gets its own transaction.
+
+    :param event_data: The payload from the webhook event
+    :raises KeyError: If expected keys are missing in the event data
+    :raises ValueError: If the subscription does not exist or is not active
+    """
+    if renewal_batcher.submit_blocking(event_data):
+        return
+    with database.session_scope() as session:
+        handle_subscription_renewed(event_data, session)
+
+
+def apply_subscription_renewals(events: List[Dict[str, Any]], db_session: Session) -> List[Optional[Exception]]:
+    """
+    Applies many renewal events with one subscription update and one invoice update.
+
+    Each event gets the error that handle_subscription_renewed would have raised
+    for it alone, so one bad event never fails the rest of the batch.
+
+    :param events: Renewal event payloads, each with a 'subscription_id'.
+    :param db_session: Database session used for the writes; committed on success.
+    :return: One entry per event: None on success, otherwise the exception for that event.
+    """
+    errors: List[Optional[Exception]] = [None] * len(events)
+    ids_by_event: Dict[int, int] = {}
+    for index, event_data in enumerate(events):
+        try:
+            ids_by_event[index] = int(event_data["subscription_id"])
+        except KeyError as e:
+            logger.error("Missing key in event_data for subscription renewal: %s", e)
+            errors[index] = e
+        except (TypeError, ValueError):
+            errors[index] = ValueError(f"Invalid subscription_id: {event_data['subscription_id']!r}")
+
+    subscription_ids = set(ids_by_event.values())
+    if not subscription_ids:
+        return errors
+
+    now = datetime.utcnow()
+    period_start, _ = billing_period(now)
+    renewed = set(db_session.execute(
+        update(Subscription)
+        .where(Subscription.id.in_(subscription_ids))
+        .where(Subscription.is_active.is_(True))
+        .values(updated_at=now)
+        .returning(Subscription.id)
+    ).scalars())
+    if renewed:
+        db_session.execute(
+            update(Invoice)
+            .where(Invoice.subscription_id.in_(renewed))
+            .where(Invoice.period_start == period_start)
+            .where(Invoice.status != "paid")
+            .values(status="paid")
+        )
+    db_session.commit()
+
+    for index, subscription_id in ids_by_event.items():
+        if subscription_id not in renewed:
+            logger.error("Cannot renew missing or inactive subscription %s", subscription_id)
+            errors[index] = ValueError(f"Subscription {subscription_id} not found or inactive.")
+    logger.info("Applied %d subscription renewal(s) from %d event(s)", len(renewed), len(events))
+    return errors
+
+
+class RenewalBatchError(Exception):
+    """
+    Raised for each event of a renewal batch whose write failed as a whole.
+    """
+    pass
+
+
+class RenewalBatcher:
+    """
+    Collects renewal events and applies them in batches, one batch at a time.
+
+    Callers await their own event's outcome, so error reporting matches the
+    single-event path even though the writes are shared. Handler threads submit
+    through submit_blocking() once start() has bound the batcher to the event loop.
+
+    Batches are written on the batcher's own thread rather than the shared thread
+    pool: the handler threads waiting in submit_blocking() hold that pool's tokens,
+    so a batch queued behind them would never run.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = RENEWAL_BATCH_WINDOW_SECONDS,
+        max_batch_size: int = RENEWAL_BATCH_MAX_SIZE,
+        session_factory: Optional[Callable[[], ContextManager[Session]]] = None,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.session_factory = session_factory
+        self._pending: List[Tuple[Dict[str, Any], "asyncio.Future[None]"]] = []
+        self._timer: Optional["asyncio.Task[None]"] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        Binds the batcher to the running event loop, so handler threads can submit to it.
+        """
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self) -> None:
+        """
+        Stops accepting events from handler threads and applies whatever is queued.
+        """
+        self._loop = None
+        await self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def submit_blocking(self, event_data: Dict[str, Any], timeout: float = RENEWAL_BATCH_TIMEOUT_SECONDS) -> bool:
+        """
+        Submits a renewal from a handler thread and waits for its batch.
+
+        :param event_data: The renewal event payload.
+        :param timeout: Seconds to wait for the batch to be applied.
+        :return: False if the batcher is not running or this is its own event loop's
+            thread, in which case nothing was submitted.
+        :raises KeyError: If the event has no 'subscription_id'.
+        :raises ValueError: If the subscription does not exist or is not active.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            if asyncio.get_running_loop() is loop:
+                # Blocking here would deadlock the loop the batch runs on
+                return False
+        except RuntimeError:
+            pass
+        asyncio.run_coroutine_threadsafe(self.submit(event_data), loop).result(timeout)
+        return True
+
+    async def submit(self, event_data: Dict[str, Any]) -> None:
+        """
+        Queues one renewal event and waits until its batch has been applied.
+
+        :param event_data: The renewal event payload.
+        :raises KeyError: If the event has no 'subscription_id'.
+        :raises ValueError: If the subscription does not exist or is not active.
+        """
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._pending.append((event_data, future))
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+        await future
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self.window_seconds)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Applies every queued event once the previous batch is written, and resolves their waiters.
+        """
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            # Taken only now, so events queued while the previous batch was written join this one
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            events = [event_data for event_data, _ in batch]
+            if self._executor is None:
+                # Batches are written one at a time, so one thread is enough
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="renewal-batcher")
+            try:
+                errors = await asyncio.get_running_loop().run_in_executor(self._executor, self._apply, events)
+            except Exception as exc:
+                logger.error("Failed to apply %d subscription renewal(s): %s", len(batch), exc)
+                errors = []
+                for _ in batch:
+                    # Each waiter gets its own exception, so their tracebacks do not pile up on one object
+                    error = RenewalBatchError(f"Failed to apply subscription renewals: {exc}")
+                    error.__cause__ = exc
+                    errors.append(error)
+
+            for (_, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _apply(self, events: List[Dict[str, Any]]) -> List[Optional[Exception]]:
+        session_factory = self.session_factory or database.session_scope
+        with session_factory() as session:
+            return apply_subscription_renewals(events, session)
+
+
+renewal_batcher = RenewalBatcher()
+
+
+async def start_renewal_batcher() -> None:
+    """
+    Routes registered renewal handlers through renewal_batcher. Intended as an application startup handler.
+    """
+    renewal_batcher.start()
+
+
+async def stop_renewal_batcher() -> None:
+    """
+    Applies queued renewals and returns handlers to per-event transactions.
+    Intended as an application shutdown handler.
+    """
+    await renewal_batcher.stop()
@@ -0,0 +1,134 @@
+"""
+HMAC-SHA256 verification of incoming webhook requests.
+
+Senders sign the raw request body together with a Unix timestamp and send the
+result in the X-Webhook-Signature header:
+
+    X-Webhook-Signature: t=1700000000,v1=<hex digest>[,v1=<hex digest>...]
+
+where each digest is HMAC-SHA256(secret, b"<t>." + body). Several secrets can
+be active at once (comma-separated in WEBHOOK_SECRETS) so they can be rotated
+without rejecting traffic. Everything here runs on bytes before the body is
+parsed, and the cheap checks (header shape, timestamp) come before any HMAC is
+computed, so forged requests cost as little as possible.
+"""
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+SIGNATURE_SCHEME = "v1"
+WEBHOOK_SIGNATURE_TOLERANCE_SECONDS = int(os.getenv("WEBHOOK_SIGNATURE_TOLERANCE_SECONDS", "300"))
+# Upper bound on the header size, so oversized headers are rejected before they are split.
+MAX_SIGNATURE_HEADER_LENGTH = 1024
+
+
+class WebhookSignatureError(Exception):
+    """
+    Raised when a webhook request is not signed by any active secret.
+    """
+    pass
+
+
+class MissingWebhookSignatureError(WebhookSignatureError):
+    """
+    Raised when a webhook request carries no signature header at all.
+    """
+    pass
+
+
+@lru_cache(maxsize=8)
+def _signing_keys(secrets: str) -> Tuple["hmac.HMAC", ...]:
+    # Keyed HMAC objects are built once per secret list and copied per request
+    return tuple(
+        hmac.new(secret.strip().encode("utf-8"), digestmod=hashlib.sha256)
+        for secret in secrets.split(",")
+        if secret.strip()
+    )
+
+
+def active_secrets() -> str:
+    """
+    Returns the comma-separated list of secrets currently accepted.
+    """
+    return os.getenv("WEBHOOK_SECRETS", "")
+
+
+def sign_payload(body: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """
+    Builds the signature header value for a body.
+
+    :param body: The raw request body.
+    :param secret: The signing secret.
+    :param timestamp: Unix time of signing; defaults to now.
+    :return: The value for the X-Webhook-Signature header.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode("utf-8"), b"%d." % timestamp + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},{SIGNATURE_SCHEME}={digest}"
+
+
+def _parse_header(header: str) -> Tuple[int, List[bytes]]:
+    timestamp = None
+    signatures = []
+    for item in header.split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == SIGNATURE_SCHEME:
+            signatures.append(value.encode("latin-1", errors="replace"))
+    # str.isdigit() also accepts non-ASCII digits such as '²', which int() rejects
+    if timestamp is None or not (timestamp.isascii() and timestamp.isdigit()) or not signatures:
+        raise WebhookSignatureError("Malformed signature header.")
+    return int(timestamp), signatures
+
+
+def verify_signature(
+    body: bytes,
+    header: Optional[str],
+    secrets: Optional[str] = None,
+    tolerance: int = WEBHOOK_SIGNATURE_TOLERANCE_SECONDS,
+    now: Optional[float] = None,
+) -> int:
+    """
+    Checks that a raw webhook body was signed by one of the active secrets.
+
+    :param body: The raw request body, exactly as received.
+    :param header: Value of the X-Webhook-Signature header, if any.
+    :param secrets: Comma-separated secrets to accept; defaults to WEBHOOK_SECRETS.
+    :param tolerance: Maximum age (or clock skew) of the signature timestamp, in seconds.
+    :param now: The current Unix time; defaults to now.
+    :return: The verified signature timestamp.
+    :raises MissingWebhookSignatureError: If there is no signature header.
+    :raises WebhookSignatureError: If the header is malformed, too old, or matches no secret.
+    """
+    if not header:
+        raise MissingWebhookSignatureError("Missing signature header.")
+    if len(header) > MAX_SIGNATURE_HEADER_LENGTH:
+        raise WebhookSignatureError("Malformed signature header.")
+
+    timestamp, signatures = _parse_header(header)
+    now = time.time() if now is None else now
+    if abs(now - timestamp) > tolerance:
+        raise WebhookSignatureError("Signature timestamp is outside the tolerance window.")
+
+    keys = _signing_keys(active_secrets() if secrets is None else secrets)
+    if not keys:
+        logger.error("Rejecting webhook: no webhook secrets are configured")
+        raise WebhookSignatureError("No webhook secrets are configured.")
+
+    signed_payload = b"%d." % timestamp + body
+    for key in keys:
+        mac = key.copy()
+        mac.update(signed_payload)
+        expected = mac.hexdigest().encode("ascii")
+        if any(hmac.compare_digest(expected, signature) for signature in signatures):
+            return timestamp
+    raise WebhookSignatureError("Signature does not match any active secret.")